@@ -41,6 +41,8 @@ function App() {
   const { user, loading: authLoading } = useAuth();
   
   const prevUserIdRef = useRef<string | null>(null);
+  // Temporary chats whose context the server said it kept (X-Context-Kept), so the next turn can append
+  const keptContextsRef = useRef<Set<string>>(new Set());
 
   useEffect(() => {
     if (user && user.id !== prevUserIdRef.current) {
@@ -66,6 +68,7 @@ function App() {
     updateCurrentMessages,
     addTTSAudio,
     deleteTTSAudio,
+    loadVoiceTranscript,
     updateConversationTitle,
     fetchConversations,
   } = useConversations();
@@ -262,7 +265,10 @@ function App() {
       try {
         const response = await fetch("/api/voice/speak", {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
+          headers: {
+            "Content-Type": "application/json",
+            "Authorization": `Bearer ${(await supabase.auth.getSession()).data.session?.access_token}`
+          },
           body: JSON.stringify({ text: text.trim(), voiceId: selectedVoiceId }),
         });
 
@@ -379,74 +385,131 @@ function App() {
         
         const isTemporary = conversations.find(c => c.id === conversationId)?.isTemporary;
         
-        let messagesPayload;
-        if (isTemporary) {
-             // For temporary chat, we must send the full history because backend won't save it.
-             // currentMessages is the state BEFORE this new message (React state update is async)
-             // We need to map ChatMessage to the API format { role, content }
-             messagesPayload = [...currentMessages, userMessage].map(m => ({
-                 role: m.role,
-                 content: m.content
-             }));
-        } else {
-
-             messagesPayload = [{ role: userMessage.role, content: userMessage.content }];
-        }
-
-        const response = await fetch(`/api/chat/${conversationId}/message`, {
+        // Temporary chats are not saved, but the server may keep their context for a while: if it said
+        // so on the last turn, only the new message is sent. If that context expired (409), send the whole chat.
+        const sendMessage = (messages: ChatMessageType[], append: boolean) => fetch(`/api/chat/${conversationId}/message`, {
             method: "POST",
             headers: {
                 "Content-Type": "application/json",
                 "Authorization": `Bearer ${token}`
             },
             body: JSON.stringify({
-                messages: messagesPayload,
-                is_temporary: !!isTemporary
+                messages: messages.map(m => ({ role: m.role, content: m.content })),
+                is_temporary: !!isTemporary,
+                append
             })
         });
 
+        // currentMessages is the state BEFORE this new message (React state update is async)
+        const append = !!isTemporary && currentMessages.length > 0 && keptContextsRef.current.has(conversationId);
+        let response = await sendMessage(isTemporary && !append ? [...currentMessages, userMessage] : [userMessage], append);
+        if (append && response.status === 409) {
+            response = await sendMessage([...currentMessages, userMessage], false);
+        }
+        if (isTemporary) {
+            if (response.headers.get("X-Context-Kept") === "true") keptContextsRef.current.add(conversationId);
+            else keptContextsRef.current.delete(conversationId);
+        }
+
         if (!response.ok) throw new Error("Network response was not ok");
         
         // Refresh conversation list so the new chat (and its title) appears in sidebar
         void fetchConversations();
         
-        const reader = response.body?.getReader();
-        const decoder = new TextDecoder();
         let assistantContent = "";
-        
-        if (!reader) throw new Error("No reader");
-        
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-            
-            const chunk = decoder.decode(value);
-            const lines = chunk.split("\n");
-            
-            for (const line of lines) {
-                if (line.startsWith("data: ")) {
-                    const data = line.slice(6);
-                    if (data === "[DONE]") break;
-                    try {
-                        const parsed = JSON.parse(data);
-                        if (parsed.content) {
-                            assistantContent += parsed.content;
-                            updateCurrentMessages(prev => prev.map(m => 
-                                m.id === assistantMessageId ? { ...m, content: assistantContent } : m
-                            ));
+        let lastEventId: string | null = null;
+        let finished = false;
+        // Set when the server reports that the answer failed (the stream then ends without [DONE])
+        let streamError: string | null = null;
+
+        const consume = async (res: Response) => {
+            const reader = res.body?.getReader();
+            const decoder = new TextDecoder();
+
+            if (!reader) throw new Error("No reader");
+
+            while (!finished && !streamError) {
+                const { done, value } = await reader.read();
+                if (done) break;
+
+                const chunk = decoder.decode(value);
+                const lines = chunk.split("\n");
+                let pendingId: string | null = null;
+
+                for (const line of lines) {
+                    if (line.startsWith("id: ")) {
+                        pendingId = line.slice(4);
+                    } else if (line.startsWith("data: ")) {
+                        const data = line.slice(6);
+                        if (data === "[DONE]") {
+                            finished = true;
+                            break;
                         }
-                        if (parsed.tool_used) {
-                            updateCurrentMessages(prev => prev.map(m => 
-                                m.id === assistantMessageId ? { ...m, toolUsed: true } : m
-                            ));
+                        try {
+                            const parsed = JSON.parse(data);
+                            if (parsed.error) {
+                                streamError = String(parsed.error);
+                                break;
+                            }
+                            if (parsed.content) {
+                                assistantContent += parsed.content;
+                                updateCurrentMessages(prev => prev.map(m => 
+                                    m.id === assistantMessageId ? { ...m, content: assistantContent } : m
+                                ));
+                            }
+                            if (parsed.tool_used) {
+                                updateCurrentMessages(prev => prev.map(m => 
+                                    m.id === assistantMessageId ? { ...m, toolUsed: true } : m
+                                ));
+                            }
+                            if (pendingId) lastEventId = pendingId;
+                        } catch (e) {
+                             // Ignore parse errors for partial chunks
                         }
-                    } catch (e) {
-                         // Ignore parse errors for partial chunks
                     }
                 }
             }
+        };
+
+        // If the connection drops mid-answer, reconnect and continue after the last event received.
+        // This never starts a new completion: it gets what was generated until the drop, and the rest
+        // if the server keeps generating without a reader (STREAM_RESUME_GRACE_SECONDS).
+        let current = response;
+        for (let attempt = 1; ; attempt++) {
+            try {
+                await consume(current);
+            } catch (e) {
+                if (!lastEventId || attempt > 3) throw e;
+            }
+            if (finished || streamError || !lastEventId || attempt > 3) break;
+
+            await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+            current = await fetch(`/api/chat/${conversationId}/stream`, {
+                headers: {
+                    "Authorization": `Bearer ${token}`,
+                    "Last-Event-ID": lastEventId
+                }
+            });
+            if (!current.ok) break;
         }
-        
+        if (streamError) throw new Error(streamError);
+
+        // After the first answer the server writes a better title in the background; poll briefly for it
+        if (finished && !isTemporary && currentMessages.length === 0) {
+            for (let attempt = 0; attempt < 5; attempt++) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const titleRes = await fetch(`/api/chat/${conversationId}/title`, {
+                    headers: { "Authorization": `Bearer ${token}` }
+                });
+                if (!titleRes.ok) break;
+                const { pending } = await titleRes.json();
+                if (!pending) {
+                    void fetchConversations();
+                    break;
+                }
+            }
+        }
+
     } catch (e) {
         console.error("Error sending message", e);
         updateCurrentMessages(prev => prev.map(m => 
@@ -753,6 +816,7 @@ function App() {
                       <AudioList 
                         audios={currentTTSHistory} 
                         onDelete={deleteTTSAudio} 
+                        onLoadTranscript={loadVoiceTranscript}
                       />
                    </div>
                 </div>
@@ -849,6 +913,7 @@ function App() {
                   <AudioList 
                     audios={currentTTSHistory} 
                     onDelete={deleteTTSAudio}
+                    onLoadTranscript={loadVoiceTranscript}
                   />
                 </div>
               </div>
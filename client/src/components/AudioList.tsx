@@ -1,5 +1,5 @@
 import { Volume2, Play, Pause, Download, Trash2 } from "lucide-react";
-import { useState, useRef } from "react";
+import { useState, useRef, useEffect } from "react";
 import { TTSAudio } from "../types";
 import { Button } from "./ui/Button";
 import { Card, CardContent } from "./ui/Card";
@@ -11,14 +11,23 @@ import { Avatar } from "./ui/Avatar";
 interface Props {
   audios: TTSAudio[];
   onDelete: (id: string) => void;
+  onLoadTranscript?: (id: string) => void;
 }
 
-export function AudioList({ audios, onDelete }: Props) {
+// Conversational sessions arrive without their transcript (only the first line, as `text`)
+const isVoiceSession = (audio: TTSAudio) => audio.voiceId === 'conversational-ai';
+
+export function AudioList({ audios, onDelete, onLoadTranscript }: Props) {
   const { user } = useAuth();
   const userName = user?.user_metadata?.full_name || "Tú";
   const [playingId, setPlayingId] = useState<string | null>(null);
   const audioRefs = useRef<{ [key: string]: HTMLAudioElement }>({});
 
+  useEffect(() => {
+    if (!onLoadTranscript) return;
+    audios.filter(audio => isVoiceSession(audio) && !audio.transcript).forEach(audio => onLoadTranscript(audio.id));
+  }, [audios, onLoadTranscript]);
+
   const handlePlayPause = (audio: TTSAudio) => {
     if (!audio.audioUrl) {
       alert("Este audio no está disponible para reproducción");
@@ -92,10 +101,9 @@ export function AudioList({ audios, onDelete }: Props) {
   return (
     <div className="max-w-3xl mx-auto space-y-3">
       {[...audios].sort((a, b) => b.timestamp - a.timestamp).map((audio) => {
-        // Only treat as "Voice Session" (Conversational) if it has a transcript AND the voiceId is specific to conversational mode
-        const isVoiceSession = !!audio.transcript && audio.transcript.length > 0 && audio.voiceId === 'conversational-ai';
-
-        if (isVoiceSession) {
+        // Only treat as "Voice Session" (Conversational) if the voiceId is specific to conversational mode
+        // and its transcript is loaded or can be
+        if (isVoiceSession(audio) && (audio.transcript?.length || onLoadTranscript)) {
           return (
              <Card key={audio.id} className="hover:shadow-md transition-shadow overflow-hidden border-border/50">
                 <div className="bg-muted/30 px-4 py-2 border-b border-border/50 flex items-center justify-between">
@@ -108,6 +116,11 @@ export function AudioList({ audios, onDelete }: Props) {
                 <CardContent className="p-0">
                     {/* Transcript Scroll Area */}
                     <div className="max-h-[60vh] min-h-[200px] overflow-y-auto p-6 space-y-6 bg-white dark:bg-card/50 custom-scrollbar">
+                        {!audio.transcript && (
+                            <div className="flex justify-center py-12">
+                                <div className="animate-spin rounded-full h-6 w-6 border-b-2 border-primary"></div>
+                            </div>
+                        )}
                         {audio.transcript?.map((msg, idx) => {
                             const isUser = msg.role === 'user';
                             return (
@@ -32,6 +32,7 @@ export function useConversations(): {
   addChatMessage: (message: ChatMessage, conversationId?: string) => Promise<void>;
   addTTSAudio: (audio: TTSAudio, conversationId?: string) => void; // TODO: Implement Voice API
   deleteTTSAudio: (audioId: string) => void;
+  loadVoiceTranscript: (audioId: string) => void;
   updateConversationTitle: (id: string, newTitle: string) => void; // TODO: API endpoint?
   fetchConversations: () => Promise<void>;
 } {
@@ -42,6 +43,7 @@ export function useConversations(): {
   const [isLoading, setIsLoading] = useState(false);
   const [isInitialized, setIsInitialized] = useState(false);
   const temporaryConversationIds = useRef<Set<string>>(new Set());
+  const transcriptRequests = useRef<Set<string>>(new Set());
 
   // 1. Fetch Conversations (List)
   const fetchConversations = useCallback(async () => {
@@ -131,11 +133,17 @@ export function useConversations(): {
 
         setCurrentMessages(messages);
         
-        const ttsHistory = data.ttsHistory || [];
+        const fetched: TTSAudio[] = data.ttsHistory || [];
         
         // Update local cache with messages, TTS history, AND title
-        setConversations(prev => prev.map(c => 
-            c.id === id ? { 
+        setConversations(prev => prev.map(c => {
+            if (c.id !== id) return c;
+            // Voice sessions come without their transcript: keep the ones already loaded
+            const ttsHistory = fetched.map(audio => audio.transcript ? audio : {
+                ...audio,
+                transcript: c.ttsHistory?.find(a => a.id === audio.id)?.transcript
+            });
+            return { 
                 ...c, 
                 messages: messages, 
                 ttsHistory: ttsHistory,
@@ -143,8 +151,8 @@ export function useConversations(): {
                 title: data.title || c.title,
                 // If it was local, mark as synced (isLocal: false) since we fetched it from backend
                 isLocal: false 
-            } : c
-        ));
+            };
+        }));
     } catch (error) {
         console.error("Failed to load conversation:", error);
     } finally {
@@ -303,6 +311,29 @@ export function useConversations(): {
       }
   }, [currentConversationId]);
 
+  // Full transcript of a voice session, fetched when it is displayed
+  const loadVoiceTranscript = useCallback(async (audioId: string) => {
+      const conversationId = currentConversationId;
+      if (!conversationId || transcriptRequests.current.has(audioId)) return;
+      transcriptRequests.current.add(audioId);
+
+      try {
+          const res = await api.get(`/chat/${conversationId}/voice-sessions/${audioId}`);
+          setConversations(prev => prev.map(c => 
+              c.id === conversationId ? {
+                  ...c,
+                  ttsHistory: (c.ttsHistory || []).map(a => 
+                      a.id === audioId ? { ...a, transcript: res.data.transcript, waveform: res.data.waveform ?? a.waveform } : a
+                  )
+              } : c
+          ));
+      } catch (e) {
+          console.error("Failed to load voice session transcript", e);
+      } finally {
+          transcriptRequests.current.delete(audioId);
+      }
+  }, [currentConversationId]);
+
   const updateCurrentMessages = useCallback((messages: any) => setCurrentMessages(messages), []);
 
   const updateConversationTitle = useCallback(async (id: string, newTitle: string) => {
@@ -339,6 +370,7 @@ export function useConversations(): {
     addChatMessage,
     addTTSAudio,
     deleteTTSAudio,
+    loadVoiceTranscript,
     updateConversationTitle,
     fetchConversations
   };
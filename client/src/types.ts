@@ -41,12 +41,14 @@ export interface TTSAudio {
   timestamp: number;
   voiceId: string;
   voiceName: string;
-  transcript?: {
+  transcript?: { // Voice sessions: loaded on demand (GET /chat/{id}/voice-sessions/{sessionId})
     id?: any;
     role: string;
     msg: string;
     date?: string;
   }[];
+  duration?: number; // Seconds, once the audio has been transcoded
+  waveform?: number[]; // Peak amplitudes (0-1)
 }
 
 // Raw DB Types (for mapping)
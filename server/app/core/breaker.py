@@ -0,0 +1,186 @@
+import functools
+import inspect
+import threading
+import time
+from enum import IntEnum
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.core.metrics import registry
+
+# Circuit breakers in front of external dependencies (OpenAI, ElevenLabs, Supabase), per worker process.
+# When a dependency keeps failing, calls to it fail immediately instead of each one waiting
+# out its timeouts and retries; after a cool-down a few probe calls decide whether it is back.
+
+logger = get_logger(__name__)
+
+breaker_state = registry.gauge(
+    "circuit_breaker_state", "Circuit breaker state by dependency (0 closed, 1 half-open, 2 open)", ("dependency",)
+)
+breaker_transitions = registry.counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes, by dependency and new state", ("dependency", "state")
+)
+breaker_rejected = registry.counter(
+    "circuit_breaker_rejected_total", "Calls failed fast because the dependency's breaker was open", ("dependency",)
+)
+
+class BreakerState(IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+class CircuitOpenError(HTTPException):
+    """
+    Raised instead of calling a dependency whose breaker is open. It is an HTTPException
+    (503 with Retry-After), so unless a caller handles it the client gets a fast, retryable error.
+    """
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{dependency} is temporarily unavailable, retry shortly",
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    - closed: calls go through; BREAKER_FAILURE_THRESHOLD consecutive failures open the breaker
+    - open: calls raise CircuitOpenError for BREAKER_RESET_SECONDS
+    - half-open: up to BREAKER_HALF_OPEN_PROBES calls go through as probes; a success closes
+      the breaker, a failure opens it again
+    Only errors `is_failure` blames on the dependency count (connection errors, timeouts, 5xx);
+    anything else (4xx, bad input) means the dependency answered and counts as a success.
+    Thread safe: Supabase calls run in the threadpool.
+    """
+
+    def __init__(self, name: str, is_failure: Callable[[BaseException], bool]):
+        self.name = name
+        self.is_failure = is_failure
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        breaker_state.set(int(self.state), dependency=name)
+
+    def _set_state(self, state: BreakerState):
+        if state == self.state:
+            return
+        self.state = state
+        breaker_state.set(int(state), dependency=self.name)
+        breaker_transitions.inc(dependency=self.name, state=state.name.lower())
+        log = logger.warning if state == BreakerState.OPEN else logger.info
+        log("Circuit breaker %s is now %s", self.name, state.name.lower(), extra={"failures": self.failures})
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets probes through (0 unless open)."""
+        if self.state != BreakerState.OPEN:
+            return 0.0
+        return max(self.opened_at + settings.BREAKER_RESET_SECONDS - time.monotonic(), 0.0)
+
+    def check(self):
+        """Fail fast if the breaker is open, without taking a probe slot (e.g. before queueing)."""
+        if settings.BREAKER_ENABLED and self.state == BreakerState.OPEN and self.retry_after() > 0:
+            breaker_rejected.inc(dependency=self.name)
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def before(self) -> bool:
+        """Admit a call or raise CircuitOpenError. Returns True if the call is a half-open probe."""
+        if not settings.BREAKER_ENABLED:
+            return False
+        with self._lock:
+            if self.state == BreakerState.OPEN:
+                if self.retry_after() > 0:
+                    breaker_rejected.inc(dependency=self.name)
+                    raise CircuitOpenError(self.name, self.retry_after())
+                self._probes = 0
+                self._set_state(BreakerState.HALF_OPEN)
+            if self.state == BreakerState.HALF_OPEN:
+                if self._probes >= settings.BREAKER_HALF_OPEN_PROBES:
+                    # The probes decide; everyone else keeps failing fast meanwhile
+                    breaker_rejected.inc(dependency=self.name)
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probes += 1
+                return True
+        return False
+
+    def after(self, error: Optional[BaseException], probe: bool = False):
+        """Record the outcome of an admitted call (error=None on success)."""
+        if not settings.BREAKER_ENABLED:
+            return
+        with self._lock:
+            if probe:
+                self._probes = max(self._probes - 1, 0)
+            if error is not None and not isinstance(error, Exception):
+                # Cancelled (or shutting down): says nothing about the dependency
+                return
+            if error is not None and self.is_failure(error):
+                self.failures += 1
+                if self.state == BreakerState.OPEN:
+                    # A call admitted before the breaker opened: don't extend the cool-down
+                    return
+                if self.state == BreakerState.HALF_OPEN or self.failures >= settings.BREAKER_FAILURE_THRESHOLD:
+                    self.opened_at = time.monotonic()
+                    self._set_state(BreakerState.OPEN)
+            elif probe or self.state != BreakerState.OPEN:
+                self.failures = 0
+                self._set_state(BreakerState.CLOSED)
+
+    def guard(self) -> "_Guard":
+        """Context manager around one call to the dependency (works in sync and async code)."""
+        return _Guard(self)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"state": self.state.name.lower(), "failures": self.failures, "retry_after": round(self.retry_after(), 1)}
+
+class _Guard:
+    __slots__ = ("breaker", "probe", "error")
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.error: Optional[BaseException] = None
+
+    def fail(self, error: BaseException):
+        """Record the call as failed without raising (e.g. a 5xx response the caller handles itself)."""
+        self.error = error
+
+    def __enter__(self):
+        self.probe = self.breaker.before()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.breaker.after(exc or self.error, self.probe)
+        return False
+
+def guarded(breaker: CircuitBreaker):
+    """Decorator running every call of a sync or async function under `breaker`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with breaker.guard():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with breaker.guard():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+def circuit_breaker(name: str, is_failure: Callable[[BaseException], bool]) -> CircuitBreaker:
+    """The breaker for dependency `name` (created on first use, listed on /api/health)."""
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name, is_failure)
+    return breakers[name]
+
+def breaker_health() -> Dict[str, Dict[str, object]]:
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
@@ -0,0 +1,141 @@
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from app.core.config import settings
+from app.core.logs import get_logger
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+    from redis.asyncio import Redis
+    from supabase import Client
+
+# Shared API clients, constructed on first use instead of at import time.
+# The SDK imports live inside the factories too: `openai` and `supabase` account for
+# most of the app's import time, which every uvicorn worker pays on a cold start.
+# One Supabase client is shared by SupabaseService and StorageService.
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_supabase: Optional["Client"] = None
+_openai: Optional["AsyncOpenAI"] = None
+_redis: Optional["Redis"] = None
+_elevenlabs: Optional["httpx.AsyncClient"] = None
+_storage: Optional["httpx.AsyncClient"] = None
+
+def get_supabase_client() -> "Client":
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                from supabase import create_client
+                _supabase = create_client(settings.require("SUPABASE_URL"), settings.require("SUPABASE_SERVICE_KEY"))
+    return _supabase
+
+def get_openai_client() -> "AsyncOpenAI":
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                from openai import AsyncOpenAI
+                # Retries are done by the OpenAI scheduler (app/core/scheduler.py), which also paces admission
+                _openai = AsyncOpenAI(api_key=settings.require("OPENAI_API_KEY"), base_url=settings.OPENAI_BASE_URL, max_retries=0)
+    return _openai
+
+def get_redis_client() -> "Redis":
+    """
+    Shared asyncio Redis client for state that must be consistent across workers.
+    `redis` is an optional dependency, only needed when a Redis-backed feature is enabled.
+    """
+    global _redis
+    if _redis is None:
+        with _lock:
+            if _redis is None:
+                try:
+                    from redis.asyncio import from_url
+                except ImportError as e:
+                    raise RuntimeError("The redis package is required for Redis-backed features: pip install redis") from e
+                _redis = from_url(settings.require("REDIS_URL"), decode_responses=True)
+    return _redis
+
+def get_elevenlabs_client() -> "httpx.AsyncClient":
+    """
+    Keep-alive connection pool for ElevenLabs, so calls skip the TCP+TLS handshake.
+    HTTP/2 is negotiated when the h2 package is installed (httpx[http2]); otherwise HTTP/1.1.
+    Auth headers are passed per request.
+    """
+    global _elevenlabs
+    if _elevenlabs is None:
+        with _lock:
+            if _elevenlabs is None:
+                import httpx
+                http2 = settings.ELEVENLABS_HTTP2
+                if http2:
+                    try:
+                        import h2 # noqa: F401
+                    except ImportError:
+                        http2 = False
+                _elevenlabs = httpx.AsyncClient(
+                    base_url=settings.ELEVENLABS_API_URL,
+                    http2=http2,
+                    timeout=httpx.Timeout(
+                        settings.ELEVENLABS_READ_TIMEOUT_SECONDS,
+                        connect=settings.ELEVENLABS_CONNECT_TIMEOUT_SECONDS
+                    ),
+                    limits=httpx.Limits(
+                        max_connections=settings.ELEVENLABS_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.ELEVENLABS_MAX_CONNECTIONS,
+                        keepalive_expiry=30
+                    )
+                )
+    return _elevenlabs
+
+def get_storage_http_client() -> "httpx.AsyncClient":
+    """
+    Keep-alive pool for reading public objects from Supabase Storage (voice playback proxy).
+    Requests are relative to the project's public object root, so the pool reaches nothing else.
+    """
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                import httpx
+                _storage = httpx.AsyncClient(
+                    base_url=f"{settings.require('SUPABASE_URL').rstrip('/')}/storage/v1/object/public/",
+                    timeout=httpx.Timeout(settings.STORAGE_READ_TIMEOUT_SECONDS, connect=settings.STORAGE_CONNECT_TIMEOUT_SECONDS),
+                    limits=httpx.Limits(
+                        max_connections=settings.STORAGE_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.STORAGE_MAX_CONNECTIONS,
+                        keepalive_expiry=30
+                    ),
+                    follow_redirects=False
+                )
+    return _storage
+
+def warm_clients():
+    """Construct every configured client ahead of the first request (called from the lifespan)."""
+    for name, factory in (("supabase", get_supabase_client), ("openai", get_openai_client), ("elevenlabs", get_elevenlabs_client)):
+        try:
+            factory()
+        except Exception as e:
+            logger.warning("Could not initialize %s client: %s", name, e)
+
+async def close_clients():
+    """Release pooled connections on shutdown."""
+    global _supabase, _openai, _redis, _elevenlabs, _storage
+    with _lock:
+        openai_client, redis_client, elevenlabs_client, storage_client = _openai, _redis, _elevenlabs, _storage
+        _openai = None
+        _supabase = None
+        _redis = None
+        _elevenlabs = None
+        _storage = None
+    if openai_client is not None:
+        await openai_client.close()
+    if elevenlabs_client is not None:
+        await elevenlabs_client.aclose()
+    if storage_client is not None:
+        await storage_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
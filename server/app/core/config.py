@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -6,15 +7,185 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "AI Assistant API"
     API_V1_STR: str = "/api"
     
+    # API keys are optional at startup: a missing key only fails the features that need it
+    # (see `require`), so workers can boot and serve health checks without every secret.
+    
     # OpenAI
-    OPENAI_API_KEY: str
+    OPENAI_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None # Override the API endpoint (e.g. local stand-in for benchmarks)
     
     # Supabase
-    SUPABASE_URL: str
-    SUPABASE_SERVICE_KEY: str 
+    SUPABASE_URL: Optional[str] = None
+    SUPABASE_SERVICE_KEY: Optional[str] = None
+    
+    # OpenAI admission control (per worker process): concurrent requests, tokens per minute (0 = no budget),
+    # completion tokens reserved per request until the real usage is known, and retries on 429/5xx
+    OPENAI_MAX_CONCURRENCY: int = 32
+    OPENAI_TOKENS_PER_MINUTE: int = 200_000
+    OPENAI_COMPLETION_TOKENS_ESTIMATE: int = 500
+    OPENAI_MAX_RETRIES: int = 3
+    OPENAI_BACKOFF_BASE_SECONDS: float = 0.5
+    OPENAI_BACKOFF_MAX_SECONDS: float = 8.0
+    
+    # Chat model routing (see app/services/model_router_svc.py). Requests may pick any model in
+    # CHAT_ALLOWED_MODELS; otherwise prompts up to CHAT_SMALL_MAX_PROMPT_TOKENS go to CHAT_MODEL_SMALL (if set).
+    # The fallback model takes over when the chosen one fails or times out before its first token,
+    # and is raced against it after CHAT_HEDGE_AFTER_MS without a first token (0 = no hedging).
+    CHAT_MODEL_DEFAULT: str = "gpt-4o-mini"
+    CHAT_MODEL_SMALL: Optional[str] = None
+    CHAT_SMALL_MAX_PROMPT_TOKENS: int = 300
+    CHAT_FALLBACK_MODEL: Optional[str] = "gpt-4.1-mini"
+    CHAT_FIRST_TOKEN_TIMEOUT_MS: int = 15000
+    CHAT_HEDGE_AFTER_MS: int = 0
+    CHAT_ALLOWED_MODELS: list[str] = ["gpt-4o-mini", "gpt-4o", "gpt-4.1-mini", "gpt-4.1-nano", "gpt-4.1"]
+    
+    # Conversation titles: new conversations get the first message truncated right away, then a title
+    # from TITLE_MODEL once the first answer is done. Up to TITLE_BATCH_SIZE conversations share one
+    # background-priority call; the worker waits TITLE_BATCH_WAIT_MS for a batch to fill.
+    TITLE_GENERATION_ENABLED: bool = True
+    TITLE_MODEL: str = "gpt-4.1-nano"
+    TITLE_BATCH_SIZE: int = 16
+    TITLE_BATCH_WAIT_MS: int = 500
     
     # ElevenLabs
-    ELEVENLABS_API_KEY: str
+    ELEVENLABS_API_KEY: Optional[str] = None
+    ELEVENLABS_API_URL: str = "https://api.elevenlabs.io/v1"
+    # Pooled keep-alive client: timeouts, pool size, HTTP/2 (needs httpx[http2]) and retries with
+    # backoff on connection errors, 429 and 5xx
+    ELEVENLABS_CONNECT_TIMEOUT_SECONDS: float = 5
+    ELEVENLABS_READ_TIMEOUT_SECONDS: float = 60
+    ELEVENLABS_MAX_CONNECTIONS: int = 20
+    ELEVENLABS_HTTP2: bool = True
+    ELEVENLABS_MAX_RETRIES: int = 2
+    ELEVENLABS_BACKOFF_BASE_SECONDS: float = 0.5
+    # Post-call webhooks (POST /api/webhooks/elevenlabs, signed with ELEVENLABS_WEBHOOK_SECRET; unset = disabled).
+    # Audio/transcripts are staged until the session processor takes them; it waits up to
+    # VOICE_WEBHOOK_WAIT_SECONDS before falling back to the ElevenLabs API. memory: per worker (bounded), so
+    # with several workers processors do not wait; redis: shared by all workers (requires redis and REDIS_URL)
+    ELEVENLABS_WEBHOOK_SECRET: Optional[str] = None
+    VOICE_STAGING_BACKEND: str = "memory" # memory | redis
+    VOICE_WEBHOOK_WAIT_SECONDS: float = 15
+    VOICE_WEBHOOK_MAX_BYTES: int = 64 * 1024 * 1024
+    VOICE_STAGING_MAX_CALLS: int = 100
+    VOICE_STAGING_MAX_BYTES: int = 256 * 1024 * 1024
+    VOICE_STAGING_TTL_SECONDS: float = 600
+    
+    # Image uploads: validated, downsized to fit IMAGE_MAX_LONG_SIDE x IMAGE_MAX_SHORT_SIDE (what OpenAI uses
+    # for high detail) and re-encoded in a pool of IMAGE_PROCESS_WORKERS processes per worker (0 = a thread).
+    # IMAGE_DETAIL is sent with every image part (low | high | auto).
+    IMAGE_PROCESS_WORKERS: int = 2
+    IMAGE_MAX_LONG_SIDE: int = 2048
+    IMAGE_MAX_SHORT_SIDE: int = 768
+    IMAGE_OUTPUT_FORMAT: str = "webp" # webp | jpeg
+    IMAGE_QUALITY: int = 85
+    IMAGE_MAX_PIXELS: int = 50_000_000
+    IMAGE_MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    IMAGE_DETAIL: str = "auto"
+    # Other uploads (audio, files) are stored as they are, up to UPLOAD_MAX_BYTES
+    UPLOAD_MAX_BYTES: int = 100 * 1024 * 1024
+
+    # Voice session audio: after a session is saved, its MP3 is transcoded in the background to mono Opus
+    # (AUDIO_OPUS_BITRATE_KBPS, WebM container) with a waveform of AUDIO_WAVEFORM_POINTS peaks and the duration,
+    # in a pool of AUDIO_TRANSCODE_WORKERS processes per worker. Needs an ffmpeg binary built with libopus
+    # (AUDIO_FFMPEG_PATH); without one, sessions keep only the MP3. AUDIO_KEEP_ORIGINAL=false deletes the MP3
+    # once the Opus variant is stored. Playback URLs (/api/voice/sessions/{id}/audio) are signed and valid
+    # for AUDIO_PLAYBACK_URL_TTL_SECONDS to 2x that; the key defaults to one derived from SUPABASE_SERVICE_KEY.
+    AUDIO_TRANSCODE_ENABLED: bool = True
+    AUDIO_FFMPEG_PATH: str = "ffmpeg"
+    AUDIO_TRANSCODE_WORKERS: int = 1
+    AUDIO_TRANSCODE_TIMEOUT_SECONDS: float = 300
+    AUDIO_OPUS_BITRATE_KBPS: int = 24
+    AUDIO_WAVEFORM_POINTS: int = 200
+    AUDIO_KEEP_ORIGINAL: bool = True
+    AUDIO_PLAYBACK_URL_TTL_SECONDS: int = 6 * 3600
+    AUDIO_PLAYBACK_SECRET: Optional[str] = None
+    
+    # Uploads are stored content-addressed (by SHA-256); this local SQLite file remembers what is
+    # already in storage so duplicates skip the transfer. Empty = no index (duplicates are re-uploaded).
+    STORAGE_INDEX_PATH: Optional[str] = "storage_index.sqlite3"
+    # Connection pool for reading stored objects back (voice playback proxy)
+    STORAGE_CONNECT_TIMEOUT_SECONDS: float = 5
+    STORAGE_READ_TIMEOUT_SECONDS: float = 60
+    STORAGE_MAX_CONNECTIONS: int = 20
+    
+    # Chat history
+    HISTORY_PAGE_SIZE: int = 50 # Default page size when a client asks for a paginated history
+    
+    # Data export/import (GET /api/chat/export, POST /api/chat/import, NDJSON): rows read per page on export;
+    # rows (or bytes) per insert on import; longest accepted line (one conversation with its history)
+    EXPORT_PAGE_SIZE: int = 200
+    IMPORT_BATCH_SIZE: int = 200
+    IMPORT_BATCH_MAX_BYTES: int = 4 * 1024 * 1024
+    IMPORT_MAX_LINE_BYTES: int = 16 * 1024 * 1024
+    
+    # Chat streaming: merge tokens into fewer SSE frames (0 = disabled, one frame per token)
+    STREAM_COALESCE_MS: int = 0
+    STREAM_COALESCE_BYTES: int = 0
+    
+    # Chat over WebSocket (/api/chat/ws): seconds a new connection has to authenticate, and conversations
+    # whose state (history, version) a connection keeps warm between turns
+    CHAT_WS_AUTH_TIMEOUT_SECONDS: float = 10
+    CHAT_WS_MAX_CONVERSATIONS: int = 16
+    
+    # Temporary chats: their context is kept on the server (never in Supabase) for EPHEMERAL_TTL_SECONDS after
+    # the last turn, cut to the last EPHEMERAL_MAX_MESSAGES messages, so clients send only the new message.
+    # memory: per worker, at most EPHEMERAL_MAX_CONVERSATIONS contexts and EPHEMERAL_MAX_BYTES in total (least
+    # recently used evicted first); redis: shared by all workers (requires the redis package and REDIS_URL)
+    EPHEMERAL_BACKEND: str = "memory" # memory | redis
+    EPHEMERAL_TTL_SECONDS: float = 3600
+    EPHEMERAL_MAX_MESSAGES: int = 100
+    EPHEMERAL_MAX_CONVERSATIONS: int = 1000
+    EPHEMERAL_MAX_BYTES: int = 64 * 1024 * 1024
+    
+    # Resumable chat streams: events kept per answer, how long an answer keeps generating with no reader
+    # attached and how long it stays resumable after it ended. The grace costs OpenAI tokens for every
+    # client that just left, so by default (0) generation stops as soon as the client disconnects; set it
+    # (e.g. 15) where clients reconnect to continue an answer, as the web client does.
+    # memory: per worker; redis: any worker can resume (requires the redis package and REDIS_URL)
+    STREAM_RESUME_BACKEND: str = "memory" # memory | redis
+    STREAM_BUFFER_EVENTS: int = 2000
+    STREAM_RESUME_GRACE_SECONDS: float = 0
+    STREAM_RESUME_TTL_SECONDS: float = 60
+    
+    # Metrics: if set, /api/metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+    METRICS_TOKEN: Optional[str] = None
+    
+    # Logging / tracing
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # json | text
+    TRACE_EXPORTER: str = "none" # none | console | file
+    TRACE_FILE: str = "traces.jsonl"
+    TRACE_SAMPLE_RATE: float = 0.1 # Fraction of traces recorded (decided once per request)
+    
+    # Startup: build API clients in the background right after boot instead of on the first request
+    PREWARM_CLIENTS: bool = True
+    
+    # Per-user rate limits (token bucket: sustained requests per minute + burst) and concurrent chat streams.
+    # memory: per worker process; redis: shared by all workers (requires the redis package and REDIS_URL)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory" # memory | redis
+    RATE_LIMIT_CHAT_PER_MINUTE: float = 20
+    RATE_LIMIT_CHAT_BURST: int = 10
+    RATE_LIMIT_TTS_PER_MINUTE: float = 30
+    RATE_LIMIT_TTS_BURST: int = 10
+    MAX_CONCURRENT_STREAMS_PER_USER: int = 3
+    STREAM_LEASE_SECONDS: float = 600 # A stream slot not released by then (crashed worker) frees itself
+    REDIS_URL: Optional[str] = None
+
+    # Circuit breakers for OpenAI, ElevenLabs and Supabase (per worker process, state on /api/health):
+    # after FAILURE_THRESHOLD consecutive connection errors/timeouts/5xx calls fail fast with a 503
+    # for RESET_SECONDS, then HALF_OPEN_PROBES calls test whether the dependency is back
+    BREAKER_ENABLED: bool = True
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30
+    BREAKER_HALF_OPEN_PROBES: int = 1
+
+    # Production runner (serve.py): worker processes (default: one per CPU core) and graceful shutdown.
+    # On SIGTERM a worker stops accepting new chat streams, lets active ones finish for up to
+    # SHUTDOWN_GRACE_SECONDS, then gets SHUTDOWN_FLUSH_SECONDS to flush pending history writes.
+    WEB_CONCURRENCY: Optional[int] = None
+    SHUTDOWN_GRACE_SECONDS: float = 30
+    SHUTDOWN_FLUSH_SECONDS: float = 10
     
     # Cors
     BACKEND_CORS_ORIGINS: list[str] = ["http://localhost:5173"]
@@ -26,4 +197,11 @@ class Settings(BaseSettings):
         extra="ignore"
     )
 
+    def require(self, name: str) -> str:
+        """Return a setting that must be configured, with a clear error if it is not."""
+        value = getattr(self, name)
+        if not value:
+            raise RuntimeError(f"{name} is not configured")
+        return value
+
 settings = Settings()
@@ -0,0 +1,95 @@
+import asyncio
+import signal
+from contextlib import asynccontextmanager
+from typing import Callable, Set
+
+from app.core.logs import get_logger
+from app.core.metrics import registry
+
+logger = get_logger(__name__)
+
+class StreamTracker:
+    """
+    Tracks in-flight SSE streams and deferred persistence so a worker can drain on shutdown:
+    once draining, new streams are refused (503) while active ones run to completion,
+    and pending history writes are flushed before the process exits.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.active = 0
+        self._pending: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def begin_drain(self):
+        if not self.draining:
+            logger.info("Draining: refusing new streams", extra={"active_streams": self.active, "pending_writes": self.pending})
+        self.draining = True
+
+    @asynccontextmanager
+    async def stream(self):
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+
+    def persist(self, func: Callable, *args, **kwargs) -> asyncio.Task:
+        """
+        Run a blocking persistence call in the threadpool as a tracked task.
+        The task is independent of the request, so it completes even if the stream that
+        scheduled it is cancelled (client gone, shutdown deadline hit).
+        """
+        task = asyncio.get_running_loop().create_task(self._run(func, *args, **kwargs))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        except Exception:
+            # Nobody awaits a write scheduled from a cancelled stream, so failures are logged here
+            logger.exception("Deferred write failed", extra={"func": getattr(func, "__name__", str(func))})
+
+    async def drain(self, timeout: float):
+        """Wait (up to `timeout` seconds) for active streams and pending writes to finish."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.active or self._pending) and loop.time() < deadline:
+            if self._pending:
+                await asyncio.wait(set(self._pending), timeout=max(deadline - loop.time(), 0))
+            else:
+                await asyncio.sleep(0.05)
+        if self.active or self._pending:
+            logger.warning("Drain deadline reached", extra={"active_streams": self.active, "pending_writes": self.pending})
+
+    def install_signal_hooks(self):
+        """
+        Start draining as soon as the server receives SIGTERM/SIGINT.
+        Chains onto the handlers already installed by the server (uvicorn installs its own
+        before running the lifespan), so its shutdown sequence is unchanged.
+        """
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+
+            def handler(signum, frame, previous=previous):
+                self.begin_drain()
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous == signal.SIG_DFL:
+                    signal.default_int_handler(signum, frame)
+
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                # Not on the main thread (e.g. embedded in tests): the lifespan shutdown still drains
+                return
+
+stream_tracker = StreamTracker()
+
+registry.gauge("chat_active_streams", "SSE chat streams in flight in this worker", callback=lambda: stream_tracker.active)
+registry.gauge("chat_pending_writes", "Deferred history writes not yet flushed", callback=lambda: stream_tracker.pending)
@@ -0,0 +1,75 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.core.tracing import current_span
+
+# Structured, async-safe logging.
+# Records are handed to a QueueHandler (a non-blocking put) and written to stderr by a
+# QueueListener thread, so logging from the event loop never waits on terminal/file I/O.
+# Each record carries the trace/span IDs of the active span for correlation with traces.
+
+# Attributes every LogRecord has; anything else passed through `extra=` is emitted as a field
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "trace_id", "span_id"}
+
+class _TraceContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        active = current_span()
+        record.trace_id = active.trace_id if active else ""
+        record.span_id = active.span_id if active else ""
+        return True
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.trace_id:
+            entry["trace_id"] = record.trace_id
+            entry["span_id"] = record.span_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+_listener = None
+
+def setup_logging():
+    """Configure the `app` logger hierarchy once (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if settings.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # The filter runs in the caller's context, where the active span is visible
+    queue_handler.addFilter(_TraceContextFilter())
+
+    root = logging.getLogger("app")
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.handlers = [queue_handler]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the `app` hierarchy (e.g. get_logger(__name__) inside app/)."""
+    return logging.getLogger(name if name.startswith("app") else f"app.{name}")
@@ -0,0 +1,191 @@
+import math
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.core.metrics import registry
+
+# Per-user rate limits (token bucket) and concurrent chat stream quotas.
+# The memory backend is per process; with several workers (serve.py) each worker
+# enforces its own limits, so multi-worker deployments should use the Redis backend.
+
+logger = get_logger(__name__)
+
+rate_limited = registry.counter(
+    "rate_limited_total", "Requests rejected with 429 by limit (chat, tts, streams)", ("limit",)
+)
+
+class MemoryBackend:
+    """In-process token buckets and stream leases."""
+
+    def __init__(self):
+        # key -> (tokens, last refill time, time the bucket is full again)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        # key -> {lease id: expiry}
+        self._leases: Dict[str, Dict[str, float]] = {}
+        self._calls = 0
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; returns 0 if allowed, otherwise the seconds until a token is available."""
+        now = time.monotonic()
+        tokens, last, _ = self._buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        # Each bucket knows when it will be full again at its own rate, whichever limit triggers the sweep
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        self._sweep(now)
+        return wait
+
+    def _sweep(self, now: float):
+        # Buckets that have refilled completely carry no state; drop them now and then so idle users don't accumulate
+        self._calls += 1
+        if self._calls % 1000:
+            return
+        self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+
+    async def acquire(self, key: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.monotonic()
+        leases = {lease: expiry for lease, expiry in self._leases.get(key, {}).items() if expiry > now}
+        if len(leases) >= limit:
+            self._leases[key] = leases
+            return None
+        lease = uuid.uuid4().hex
+        leases[lease] = now + ttl
+        self._leases[key] = leases
+        return lease
+
+    async def release(self, key: str, lease: str):
+        leases = self._leases.get(key)
+        if leases is not None:
+            leases.pop(lease, None)
+            if not leases:
+                del self._leases[key]
+
+# Token bucket in one round trip; the Redis clock is used so all workers agree on time.
+# The wait is returned as a string because Lua numbers are truncated to integers on the way out.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# Stream leases are members of a sorted set scored by expiry, so slots held by a crashed worker free themselves
+_ACQUIRE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local now = tonumber(redis.call('TIME')[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= limit then return 0 end
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[3])
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+class RedisBackend:
+    """Token buckets and stream leases shared by every worker through Redis."""
+
+    def __init__(self):
+        from app.core.clients import get_redis_client
+        self.redis = get_redis_client()
+        self._take = self.redis.register_script(_TAKE_SCRIPT)
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._take(keys=[f"ratelimit:{key}"], args=[rate, burst]))
+
+    async def acquire(self, key: str, limit: int, ttl: float) -> Optional[str]:
+        lease = uuid.uuid4().hex
+        acquired = await self._acquire(keys=[f"streams:{key}"], args=[limit, math.ceil(ttl), lease])
+        return lease if acquired else None
+
+    async def release(self, key: str, lease: str):
+        await self.redis.zrem(f"streams:{key}", lease)
+
+class RateLimiter:
+    """
+    Per-user limits keyed by the authenticated user ID:
+    - `check(user_id, name)`: token bucket per named limit (requests per minute + burst)
+    - `acquire_stream` / `release_stream`: cap on concurrent chat streams per user
+    Rejections raise 429 with Retry-After.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = RedisBackend() if settings.RATE_LIMIT_BACKEND == "redis" else MemoryBackend()
+        return self._backend
+
+    def _limits(self, name: str) -> Tuple[float, int]:
+        return {
+            "chat": (settings.RATE_LIMIT_CHAT_PER_MINUTE, settings.RATE_LIMIT_CHAT_BURST),
+            "tts": (settings.RATE_LIMIT_TTS_PER_MINUTE, settings.RATE_LIMIT_TTS_BURST),
+        }[name]
+
+    async def check(self, user_id, name: str):
+        per_minute, burst = self._limits(name)
+        if not settings.RATE_LIMIT_ENABLED or per_minute <= 0:
+            return
+        try:
+            wait = await self.backend.take(f"{name}:{user_id}", per_minute / 60, max(burst, 1))
+        except Exception as e:
+            # Fail open: an unavailable limiter store must not take the API down with it
+            logger.warning("Rate limiter unavailable: %s", e)
+            return
+        if wait > 0:
+            rate_limited.inc(limit=name)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, slow down",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+
+    async def acquire_stream(self, user_id) -> Optional[str]:
+        """Reserve one of the user's concurrent stream slots; returns a lease to release when the stream ends."""
+        limit = settings.MAX_CONCURRENT_STREAMS_PER_USER
+        if not settings.RATE_LIMIT_ENABLED or limit <= 0:
+            return None
+        try:
+            lease = await self.backend.acquire(str(user_id), limit, settings.STREAM_LEASE_SECONDS)
+        except Exception as e:
+            logger.warning("Rate limiter unavailable: %s", e)
+            return None
+        if lease is None:
+            rate_limited.inc(limit="streams")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many concurrent responses (max {limit}), wait for one to finish",
+                headers={"Retry-After": "1"}
+            )
+        return lease
+
+    async def release_stream(self, user_id, lease: Optional[str]):
+        if lease is None:
+            return
+        try:
+            await self.backend.release(str(user_id), lease)
+        except Exception as e:
+            # The lease expires on its own after STREAM_LEASE_SECONDS
+            logger.warning("Could not release stream slot: %s", e)
+
+rate_limiter = RateLimiter()
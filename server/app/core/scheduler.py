@@ -0,0 +1,220 @@
+import asyncio
+import heapq
+import itertools
+import random
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from app.core.breaker import circuit_breaker
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.core.metrics import registry
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+class Priority(IntEnum):
+    """Lower value is admitted first."""
+    INTERACTIVE = 0 # A user is waiting on the stream
+    BACKGROUND = 1 # Titles, summaries and other jobs nobody is watching
+
+openai_queue_wait = registry.histogram(
+    "openai_queue_wait_seconds", "Time a request waited for admission to OpenAI", ("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+openai_retries = registry.counter(
+    "openai_retries_total", "OpenAI calls retried after a transient error, by status/error", ("reason",)
+)
+
+# HTTP statuses worth retrying: rate limited, overloaded or transient server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Tokens billed for the largest high-detail image (768x2048: 8 tiles x 170 + 85)
+IMAGE_TOKENS_ESTIMATE = 1445
+
+def estimate_tokens(messages: List[dict]) -> int:
+    """Rough prompt size (~4 characters per token), good enough for budget accounting."""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+            images += sum(1 for part in content if isinstance(part, dict) and part.get("type") == "image_url")
+    return chars // 4 + 4 * len(messages) + images * IMAGE_TOKENS_ESTIMATE
+
+class Ticket:
+    """An admitted request: holds a concurrency slot and a token reservation until released."""
+
+    def __init__(self, scheduler: "OpenAIScheduler", priority: Priority, tokens: int):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.reserved = tokens
+        self.used: Optional[int] = None
+
+    def record_usage(self, tokens: int):
+        """Actual tokens consumed; the difference with the reservation is returned to (or taken from) the budget."""
+        self.used = tokens
+
+    async def call(self, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `request` with retries on transient errors (429, 5xx, connection errors).
+        Delays use exponential backoff with full jitter, or the server's Retry-After when given;
+        a 429 also pauses admission of new requests, since OpenAI limits are per organization.
+        """
+        attempt = 0
+        while True:
+            try:
+                # Each attempt goes through the breaker: once OpenAI is clearly down, retries stop too
+                with openai_breaker.guard():
+                    return await request()
+            except Exception as e:
+                reason = _retry_reason(e)
+                if reason is None or attempt >= settings.OPENAI_MAX_RETRIES:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(settings.OPENAI_BACKOFF_MAX_SECONDS, settings.OPENAI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+                if reason == "429":
+                    self.scheduler.pause(delay)
+                openai_retries.inc(reason=reason)
+                logger.warning("OpenAI call failed (%s), retrying in %.2fs", reason, delay, extra={"attempt": attempt + 1})
+                attempt += 1
+                await asyncio.sleep(delay)
+
+def _retry_reason(error: Exception) -> Optional[str]:
+    from openai import APIConnectionError, APIStatusError
+    if isinstance(error, APIStatusError):
+        return str(error.status_code) if error.status_code in RETRYABLE_STATUS else None
+    if isinstance(error, APIConnectionError):
+        return type(error).__name__
+    return None
+
+def _is_outage(error: BaseException) -> bool:
+    """Errors that count against the OpenAI breaker: connection errors, timeouts and 5xx (not 429, which the scheduler paces)."""
+    from openai import APIConnectionError, APIStatusError
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+openai_breaker = circuit_breaker("openai", _is_outage)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(value), settings.OPENAI_BACKOFF_MAX_SECONDS) if value else None
+    except ValueError:
+        return None
+
+class OpenAIScheduler:
+    """
+    Admission control in front of OpenAI, per worker process:
+    - at most `max_concurrency` requests (streams) in flight
+    - a tokens-per-minute budget, refilled continuously; each request reserves its estimated
+      tokens on admission and settles the difference with the actual usage when released
+    - waiting requests are admitted by priority, FIFO within a priority class
+    With N workers the effective limits are N times these, so size them per worker.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self._budget = float(tokens_per_minute)
+        self._budget_at: Optional[float] = None
+        self._paused_until = 0.0
+        self._queue: List[Tuple[int, int, asyncio.Future, int]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, future, _ in self._queue if not future.done())
+
+    @property
+    def budget(self) -> float:
+        return self._budget
+
+    def _refill(self, now: float):
+        if self.tokens_per_minute <= 0:
+            return
+        if self._budget_at is not None:
+            self._budget = min(self.tokens_per_minute, self._budget + (now - self._budget_at) * self.tokens_per_minute / 60)
+        self._budget_at = now
+
+    def pause(self, seconds: float):
+        """Stop admitting requests for `seconds` (upstream told us to back off)."""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+
+    def _dispatch(self):
+        """Admit queued requests while there is capacity; otherwise wake up when there will be."""
+        loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = loop.time()
+        self._refill(now)
+        while self._queue:
+            _, _, future, tokens = self._queue[0]
+            if future.done(): # Cancelled while waiting
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= self.max_concurrency:
+                return # A release will dispatch again
+            wait = self._paused_until - now
+            if self.tokens_per_minute > 0 and self._budget < tokens:
+                wait = max(wait, (tokens - self._budget) * 60 / self.tokens_per_minute)
+            if wait > 0:
+                self._timer = loop.call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            self._budget -= tokens
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _release(self, ticket: Ticket):
+        self.in_flight -= 1
+        if ticket.used is not None and self.tokens_per_minute > 0:
+            self._budget = min(self.tokens_per_minute, self._budget + ticket.reserved - ticket.used)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE, tokens: int = 0):
+        """Wait for admission, then hold a slot for the duration of the block (e.g. a whole stream)."""
+        # Don't queue for a dependency that is down
+        openai_breaker.check()
+        loop = asyncio.get_running_loop()
+        tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute > 0 else 0
+        future = loop.create_future()
+        heapq.heappush(self._queue, (int(priority), next(self._seq), future, tokens))
+        started = loop.time()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the waiter was cancelled: give the slot back
+                self._release(Ticket(self, priority, tokens))
+            else:
+                future.cancel()
+                self._dispatch()
+            raise
+        openai_queue_wait.observe(loop.time() - started, priority=priority.name.lower())
+
+        ticket = Ticket(self, priority, tokens)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+openai_scheduler = OpenAIScheduler(settings.OPENAI_MAX_CONCURRENCY, settings.OPENAI_TOKENS_PER_MINUTE)
+
+registry.gauge("openai_in_flight", "OpenAI requests currently admitted", callback=lambda: openai_scheduler.in_flight)
+registry.gauge("openai_queue_depth", "Requests waiting for admission to OpenAI", callback=lambda: openai_scheduler.queued)
+registry.gauge("openai_token_budget", "Tokens left in the per-minute budget", callback=lambda: openai_scheduler.budget)
@@ -0,0 +1,58 @@
+import asyncio
+import functools
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.core.metrics import registry
+
+# Request coalescing ("single flight"), per worker process: while a call for a key is in flight,
+# identical calls wait for it and get the same result (or exception) instead of repeating the work.
+# Nothing is kept once the call finishes, so there is no TTL to tune and no staleness beyond
+# the duration of one call. Results are shared between callers: treat them as read-only.
+
+T = TypeVar("T")
+
+singleflight_calls = registry.counter(
+    "singleflight_calls_total", "Coalesced calls by name and result (leader: ran the call, shared: joined one in flight)", ("name", "result")
+)
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            # Its own task: the first caller going away (client disconnect) must not cancel the call for the others
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+            singleflight_calls.inc(name=self.name, result="leader")
+        else:
+            singleflight_calls.inc(name=self.name, result="shared")
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception() # Retrieved here in case every caller went away
+
+def single_flight(name: str, key: Callable[..., Hashable]):
+    """
+    Decorator coalescing concurrent calls of an async function. `key` receives the same
+    arguments as the function and returns what makes two calls identical.
+    """
+    flight = SingleFlight(name)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await flight.do(key(*args, **kwargs), lambda: func(*args, **kwargs))
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.metrics import registry
+
+# Stream events are plain dicts, e.g. {"content": "Hola"} or {"tool_used": True}.
+# Producers (OpenAIService.stream_chat) yield events; they are only turned into
+# SSE frames once, right before they go out on the wire.
+StreamEvent = Dict[str, Any]
+
+SSE_DONE = "data: [DONE]\n\n"
+
+# Compact separators and a pre-built encoder: this runs once per frame.
+# ensure_ascii stays on so frames never split a multi-byte character across reads on the client.
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+def format_event(event: StreamEvent) -> str:
+    """Encode a stream event as an SSE `data:` frame."""
+    return f"data: {_encode(event)}\n\n"
+
+def _is_content(event: StreamEvent) -> bool:
+    return len(event) == 1 and "content" in event
+
+async def coalesce(events: AsyncIterator[StreamEvent], interval_ms: int = 0, max_bytes: int = 0) -> AsyncIterator[StreamEvent]:
+    """
+    Merge consecutive content events into fewer, larger ones.
+    A merged event is flushed when `interval_ms` has passed since its first token
+    or when it reaches `max_bytes` (UTF-8), whichever comes first. Any other event
+    (e.g. tool_used) flushes the buffer first so ordering is preserved.
+    With both limits at 0 events are passed through untouched.
+    """
+    if interval_ms <= 0 and max_bytes <= 0:
+        try:
+            async for event in events:
+                yield event
+        finally:
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        return
+
+    # The upstream is drained by a pump task; per token it only appends to a buffer.
+    # Waking the consumer (and arming one timer) happens once per outgoing frame.
+    loop = asyncio.get_running_loop()
+    interval = interval_ms / 1000 if interval_ms > 0 else None
+    ready = asyncio.Event()
+    outgoing: Deque[StreamEvent] = deque()
+    buffer: List[str] = []
+    size = 0
+    timer: Optional[asyncio.TimerHandle] = None
+    finished = False
+
+    def flush():
+        nonlocal buffer, size, timer
+        if buffer:
+            outgoing.append({"content": "".join(buffer)})
+            buffer, size = [], 0
+        if timer is not None:
+            timer.cancel()
+            timer = None
+
+    def on_timer():
+        nonlocal timer
+        timer = None
+        flush()
+        ready.set()
+
+    async def pump():
+        nonlocal size, timer, finished
+        try:
+            async for event in events:
+                if _is_content(event):
+                    content = event["content"]
+                    if not buffer and interval is not None:
+                        timer = loop.call_later(interval, on_timer)
+                    buffer.append(content)
+                    size += len(content.encode("utf-8"))
+                    if max_bytes and size >= max_bytes:
+                        flush()
+                        ready.set()
+                else:
+                    flush()
+                    outgoing.append(event)
+                    ready.set()
+        finally:
+            flush()
+            finished = True
+            ready.set()
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            while outgoing:
+                yield outgoing.popleft()
+            if finished:
+                break
+        # Surface upstream errors to the caller
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+        if timer is not None:
+            timer.cancel()
+
+sse_disconnects = registry.counter(
+    "sse_client_disconnects_total", "Event streams stopped because the client went away before the end"
+)
+
+class EventStreamResponse(StreamingResponse):
+    """
+    SSE response that stops its event source as soon as the client disconnects.
+    The disconnect is watched for the whole response, so it is noticed even while nothing is
+    being sent (waiting for the first token, running tools), and the body iterator is always
+    closed afterwards so the producer's cleanup (closing upstream calls, saving partial output)
+    runs right away instead of whenever the generator is garbage collected.
+    """
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        streaming = asyncio.ensure_future(self.stream_response(send))
+        watcher = asyncio.ensure_future(self.listen_for_disconnect(receive))
+        disconnected = False
+        try:
+            await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not streaming.done():
+                disconnected = True
+                streaming.cancel()
+                await asyncio.wait({streaming})
+            elif not streaming.cancelled() and isinstance(streaming.exception(), OSError):
+                # Servers on ASGI spec 2.4 report a disconnect as a failed send
+                disconnected = True
+            else:
+                streaming.result()
+        finally:
+            watcher.cancel()
+            if not streaming.done():
+                streaming.cancel()
+                await asyncio.wait({streaming})
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        if disconnected:
+            sse_disconnects.inc()
+            return
+        if self.background is not None:
+            await self.background()
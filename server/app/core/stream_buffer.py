@@ -0,0 +1,273 @@
+import asyncio
+import uuid
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.core.metrics import registry
+from app.core.sse import format_event
+
+# Resumable streams: a chat answer is generated by a producer task that publishes SSE frames
+# into a bounded buffer, and responses are readers of that buffer. A reader that drops can
+# reconnect with Last-Event-ID ("<turn>.<seq>") and continue where it left off without a new
+# OpenAI call. The producer is cancelled once nobody has been reading for the grace window.
+#
+# memory: buffers live in this worker, so a reconnect must reach the same worker.
+# redis: frames go to a Redis stream per turn, readable from any worker.
+
+logger = get_logger(__name__)
+
+stream_resumes = registry.counter(
+    "chat_stream_resumes_total", "Reconnections to an in-progress or recent answer, by result", ("result",)
+)
+
+FIRST_READER_TIMEOUT = 10
+
+class ResumeGone(Exception):
+    """The requested position is no longer buffered (older turn, or evicted from the ring buffer)."""
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """'<turn>.<seq>' -> (turn, seq); missing or malformed -> (None, 0)."""
+    if not value or "." not in value:
+        return None, 0
+    turn, _, seq = value.rpartition(".")
+    return (turn, int(seq)) if seq.isdigit() else (None, 0)
+
+class MemoryStream:
+    """Ring buffer of (seq, frame) for one answer, with local readers."""
+
+    def __init__(self, turn: str, owner: str, size: int):
+        self.turn = turn
+        self.owner = owner
+        self.frames: Deque[Tuple[int, str]] = deque(maxlen=size)
+        self.next_seq = 1
+        self.done = False
+        self.readers = 0
+        self._changed = asyncio.Event()
+        self._attached_once = asyncio.Event()
+        self._detached = asyncio.Event()
+        self._detached.set()
+
+    async def publish(self, frame: str):
+        self.frames.append((self.next_seq, frame))
+        self.next_seq += 1
+        self._wake()
+
+    async def finish(self):
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        # Wakes every waiting reader; each one then catches up from its own position
+        self._changed.set()
+        self._changed.clear()
+
+    async def check_position(self, after: int):
+        first = self.frames[0][0] if self.frames else self.next_seq
+        if after + 1 < first:
+            raise ResumeGone()
+
+    def _attach(self):
+        self.readers += 1
+        self._attached_once.set()
+        self._detached.clear()
+
+    def _detach(self):
+        self.readers -= 1
+        if self.readers == 0:
+            self._detached.set()
+
+    async def read(self, after: int) -> AsyncIterator[Tuple[int, str]]:
+        await self.check_position(after)
+        self._attach()
+        try:
+            while True:
+                # Only walk the new tail of the buffer
+                pending: List[Tuple[int, str]] = []
+                for seq, frame in reversed(self.frames):
+                    if seq <= after:
+                        break
+                    pending.append((seq, frame))
+                for seq, frame in reversed(pending):
+                    after = seq
+                    yield seq, frame
+                if self.done and after >= self.next_seq - 1:
+                    return
+                if not pending:
+                    await self._changed.wait()
+        finally:
+            self._detach()
+
+    async def wait_attached(self):
+        await self._attached_once.wait()
+
+    async def wait_detached(self):
+        await self._detached.wait()
+
+    async def attached(self) -> bool:
+        return self.readers > 0
+
+class RedisStream(MemoryStream):
+    """
+    Frames stored in a Redis stream (entry ID "<seq>-0", capped at `size` entries) so readers on
+    any worker can resume. Readers refresh a heartbeat key; the producer's worker treats the
+    stream as attached while it exists.
+    """
+
+    def __init__(self, turn: str, owner: str, size: int, redis, pointer_key: Optional[str] = None):
+        super().__init__(turn, owner, size)
+        self.redis = redis
+        self.size = size
+        self.pointer_key = pointer_key
+        self.key = f"resume:{turn}"
+        self.heartbeat_key = f"resume:{turn}:readers"
+        self.ttl = max(int(settings.STREAM_RESUME_TTL_SECONDS), 1)
+
+    async def publish(self, frame: str):
+        seq = self.next_seq
+        self.next_seq += 1
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(self.key, {"frame": frame}, id=f"{seq}-0", maxlen=self.size, approximate=True)
+            pipe.expire(self.key, self.ttl)
+            if self.pointer_key:
+                # Keep the conversation -> turn pointer alive for as long as the answer is being written
+                pipe.expire(self.pointer_key, self.ttl)
+            await pipe.execute()
+
+    async def finish(self):
+        self.done = True
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(self.key, {"end": "1"}, id=f"{self.next_seq}-0")
+            pipe.expire(self.key, self.ttl)
+            await pipe.execute()
+
+    async def check_position(self, after: int):
+        first = await self.redis.xrange(self.key, "-", "+", count=1)
+        if not first or int(first[0][0].split("-")[0]) > after + 1:
+            raise ResumeGone()
+
+    async def read(self, after: int) -> AsyncIterator[Tuple[int, str]]:
+        await self.check_position(after)
+        self._attach()
+        heartbeat = max(int(settings.STREAM_RESUME_GRACE_SECONDS), 1)
+        try:
+            while True:
+                await self.redis.set(self.heartbeat_key, "1", ex=heartbeat)
+                response = await self.redis.xread({self.key: f"{after}-0"}, block=1000, count=500)
+                if not response and not await self.redis.exists(self.key):
+                    return # Expired without an end marker (producer's worker died)
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        if "end" in fields:
+                            return
+                        after = int(entry_id.split("-")[0])
+                        yield after, fields["frame"]
+        finally:
+            self._detach()
+
+    async def attached(self) -> bool:
+        return self.readers > 0 or bool(await self.redis.exists(self.heartbeat_key))
+
+class StreamHub:
+    """Creates per-turn streams, runs their producers and finds them again for resuming readers."""
+
+    def __init__(self):
+        # conversation key -> latest stream (memory backend, and local producers with redis)
+        self._local: Dict[str, MemoryStream] = {}
+        self._producers: Set[asyncio.Task] = set()
+
+    @property
+    def _redis(self):
+        if settings.STREAM_RESUME_BACKEND != "redis":
+            return None
+        from app.core.clients import get_redis_client
+        return get_redis_client()
+
+    async def open(self, key: str, owner: str) -> MemoryStream:
+        turn = uuid.uuid4().hex[:12]
+        redis = self._redis
+        if redis is not None:
+            stream = RedisStream(turn, owner, settings.STREAM_BUFFER_EVENTS, redis, pointer_key=f"resume:conv:{key}")
+            await redis.set(stream.pointer_key, f"{turn}:{owner}", ex=stream.ttl)
+        else:
+            stream = MemoryStream(turn, owner, settings.STREAM_BUFFER_EVENTS)
+        self._local[key] = stream
+        return stream
+
+    async def lookup(self, key: str) -> Optional[MemoryStream]:
+        stream = self._local.get(key)
+        redis = self._redis
+        if redis is None or stream is not None:
+            return stream
+        pointer = await redis.get(f"resume:conv:{key}")
+        if not pointer:
+            return None
+        turn, _, owner = pointer.partition(":")
+        return RedisStream(turn, owner, settings.STREAM_BUFFER_EVENTS, redis)
+
+    def start(self, key: str, stream: MemoryStream, producer: Callable[[MemoryStream], Awaitable[None]]) -> asyncio.Task:
+        """Run `producer(stream)` in the background; cancel it when no reader is left for the grace window."""
+        task = asyncio.ensure_future(self._run(key, stream, producer))
+        watchdog = asyncio.ensure_future(self._watch(stream, task))
+        self._producers.add(task)
+        task.add_done_callback(self._producers.discard)
+        task.add_done_callback(lambda _: watchdog.cancel())
+        return task
+
+    async def shutdown(self):
+        """Stop producers still running at shutdown (their partial answers are saved as interrupted)."""
+        producers = set(self._producers)
+        for task in producers:
+            task.cancel()
+        if producers:
+            await asyncio.wait(producers)
+
+    async def _run(self, key: str, stream: MemoryStream, producer: Callable[[MemoryStream], Awaitable[None]]):
+        try:
+            await producer(stream)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.exception("Stream producer failed", extra={"turn": stream.turn})
+            # Readers must be able to tell a failed answer from a finished one (which ends with [DONE])
+            detail = e.detail if isinstance(e, HTTPException) else "The answer could not be generated"
+            try:
+                await stream.publish(format_event({"error": detail}))
+            except Exception:
+                logger.warning("Could not publish the stream error", extra={"turn": stream.turn})
+        finally:
+            # Readers end at the end marker; the buffer stays resumable for a while after the answer ended
+            await stream.finish()
+            asyncio.get_running_loop().call_later(settings.STREAM_RESUME_TTL_SECONDS, self._forget, key, stream)
+
+    async def _watch(self, stream: MemoryStream, task: asyncio.Task):
+        # The first reader is the response that started the answer; give it a moment to attach
+        try:
+            await asyncio.wait_for(stream.wait_attached(), FIRST_READER_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        grace = settings.STREAM_RESUME_GRACE_SECONDS
+        if isinstance(stream, RedisStream):
+            # Remote readers only show up through their heartbeat, so poll at least every second
+            grace = max(grace, 1)
+        while not task.done():
+            await stream.wait_detached()
+            await asyncio.sleep(grace)
+            if not await stream.attached():
+                logger.info("No readers left, cancelling answer", extra={"turn": stream.turn})
+                task.cancel()
+                return
+
+    def _forget(self, key: str, stream: MemoryStream):
+        if self._local.get(key) is stream:
+            del self._local[key]
+
+    async def frames(self, stream: MemoryStream, after: int = 0) -> AsyncIterator[str]:
+        """SSE frames of `stream` after `after`, each tagged with its event ID."""
+        async for seq, frame in stream.read(after):
+            yield f"id: {stream.turn}.{seq}\n{frame}"
+
+stream_hub = StreamHub()
@@ -0,0 +1,249 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+# Lightweight request-scoped tracing.
+# Spans use W3C/OpenTelemetry identifiers (32-hex trace id, 16-hex span id, traceparent header)
+# and are exported as OTLP-style JSON lines to the console or a file by a background thread,
+# so the event loop never blocks on exporter I/O.
+# The sampling decision is taken once per trace (TRACE_SAMPLE_RATE); unsampled traces only
+# carry their IDs around for log correlation and record nothing.
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "sampled", "attributes",
+                 "start_ns", "end_ns", "status", "status_message", "events")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], sampled: bool, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.attributes = dict(attributes) if (sampled and attributes) else {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "UNSET"
+        self.status_message = ""
+        self.events = []
+
+    def set_attribute(self, key: str, value: Any):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any):
+        if self.sampled:
+            self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes})
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+        self.add_event("exception", **{"exception.type": type(exc).__name__, "exception.message": str(exc)})
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            exporter.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "message": self.status_message},
+            "resource": {"service.name": settings.PROJECT_NAME},
+        }
+
+class SpanExporter:
+    """Writes finished spans as JSON lines from a daemon thread."""
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TRACE_EXPORTER in ("console", "file")
+
+    def export(self, span: Span):
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.put(span)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        if settings.TRACE_EXPORTER == "file":
+            out = open(settings.TRACE_FILE, "a", encoding="utf-8")
+        else:
+            out = sys.stderr
+        while True:
+            span = self._queue.get()
+            if span is None:
+                break
+            out.write(json.dumps(span.to_dict(), default=str) + "\n")
+            # Batch flushes: only flush once the queue is drained
+            if self._queue.empty():
+                out.flush()
+        out.flush()
+        if out is not sys.stderr:
+            out.close()
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+            self._thread = None
+
+exporter = SpanExporter()
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def start_span(name: str, parent: Optional[Span] = None, attributes: Optional[Dict[str, Any]] = None,
+               traceparent: Optional[str] = None) -> Span:
+    """
+    Create a span without activating it (use for phases of async generators, where the
+    context may change between yields). The caller must call `end()`.
+    """
+    if parent is None:
+        parent = _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+
+    remote = _parse_traceparent(traceparent) if traceparent else None
+    if remote is not None:
+        trace_id, parent_span_id, sampled = remote
+        return Span(name, trace_id, parent_span_id, sampled, attributes)
+    sampled = settings.TRACE_SAMPLE_RATE > 0 and random.random() < settings.TRACE_SAMPLE_RATE
+    return Span(name, _new_trace_id(), None, sampled, attributes)
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Start a span, make it current for the enclosed block and end it afterwards."""
+    current = start_span(name, attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+def traced(name: str, **attributes: Any):
+    """Decorator wrapping a sync or async function call in a span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _parse_traceparent(header: str):
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware opening the root span of each HTTP request.
+    Honors an incoming W3C `traceparent` header (and its sampling flag) and returns
+    the request's own `traceparent` so clients can correlate.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                incoming = value.decode("latin-1")
+                break
+
+        root = start_span(f"{scope.get('method', '')} {scope.get('path', '')}", traceparent=incoming, attributes={
+            "http.method": scope.get("method", ""),
+            "http.target": scope.get("path", ""),
+        })
+        token = _current_span.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = "ERROR"
+                headers = list(message.get("headers", []))
+                headers.append((b"traceparent", root.traceparent.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.record_exception(e)
+            raise
+        finally:
+            route = scope.get("route")
+            if getattr(route, "path", None):
+                # Name by route template rather than raw path to keep span names low-cardinality
+                root.name = f"{scope.get('method', '')} {route.path}"
+                root.set_attribute("http.route", route.path)
+            _current_span.reset(token)
+            root.end()
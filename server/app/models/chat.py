@@ -12,6 +12,7 @@ class Message(BaseModel):
     role: str # user, assistant, system
     content: Union[str, List[Dict[str, Any]]]
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    interrupted: bool = False # Assistant answer cut short (client disconnected or the stream failed)
 
 class ChatMessage(BaseModel):
     role: str
@@ -20,8 +21,25 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     conversation_id: Optional[UUID] = None
-    model: str = "gpt-4o-mini"
+    model: Optional[str] = None # None = chosen by the model router
     is_temporary: bool = False
+    # Temporary chats: `messages` continue the context the server keeps (409 once it has expired);
+    # otherwise they are the whole context
+    append: bool = False
+
+class BulkRequest(BaseModel):
+    """Batch of conversation operations, applied in one transaction."""
+    delete: List[UUID] = Field(default_factory=list, max_length=1000) # Conversations, with their voice sessions
+    titles: Dict[UUID, str] = Field(default_factory=dict, max_length=1000) # Conversation ID -> new title
+    delete_tts: List[UUID] = Field(default_factory=list, max_length=1000) # Voice sessions / TTS entries
+
+class BulkResult(BaseModel):
+    op: str # delete | rename | delete_voice_session
+    id: str
+    ok: bool # False: not found or not owned by the user
+
+class BulkResponse(BaseModel):
+    results: List[BulkResult]
 
 class JSONBMessage(BaseModel):
     id: int # 0=User, 1=AI
@@ -35,7 +53,9 @@ class TTSAudio(BaseModel):
     timestamp: float
     voiceId: str
     voiceName: str
-    transcript: Optional[List[Dict[str, Any]]] = None
+    transcript: Optional[List[Dict[str, Any]]] = None # Voice sessions: on demand (GET /chat/{id}/voice-sessions/{session_id})
+    duration: Optional[float] = None # Seconds, once the audio has been transcoded
+    waveform: Optional[List[float]] = None # Peak amplitudes (0-1) for drawing the audio
 
 class ChatResponse(BaseModel):
     response: str
@@ -43,3 +63,6 @@ class ChatResponse(BaseModel):
     title: Optional[str] = None
     history: List[Message]
     ttsHistory: Optional[List[TTSAudio]] = []
+    # Pagination: sequence number to pass as `before` to load the previous page (None = no older messages)
+    next_cursor: Optional[int] = None
+    total_messages: Optional[int] = None
@@ -2,7 +2,13 @@ from fastapi import Header, HTTPException, Depends
 from typing import Optional
 from uuid import UUID
 from app.services.supabase_svc import supabase_service
+from app.core.metrics import supabase_call_duration
+from app.core.tracing import traced
+from app.core.logs import get_logger
 
+logger = get_logger(__name__)
+
+@traced("auth.get_current_user_id")
 async def get_current_user_id(authorization: Optional[str] = Header(None)) -> UUID:
     """
     Verifies the Supabase JWT token from the Authorization header 
@@ -22,7 +28,8 @@ async def get_current_user_id(authorization: Optional[str] = Header(None)) -> UU
             raise HTTPException(status_code=401, detail="Invalid authentication scheme")
             
         # Verify token using Supabase client
-        user_response = supabase_service.client.auth.get_user(token)
+        with supabase_call_duration.time(method="auth.get_user"):
+            user_response = supabase_service.client.auth.get_user(token)
         
         if not user_response or not user_response.user:
              raise HTTPException(status_code=401, detail="Invalid session token")
@@ -33,5 +40,5 @@ async def get_current_user_id(authorization: Optional[str] = Header(None)) -> UU
         raise HTTPException(status_code=401, detail="Invalid Authorization header format")
     except Exception as e:
         # Supabase client might raise errors for invalid tokens
-        print(f"Auth error: {e}")
+        logger.warning("Auth error: %s", e)
         raise HTTPException(status_code=401, detail="Authentication failed")
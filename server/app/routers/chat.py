@@ -1,26 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Header, Query, Request, Response
 from fastapi.responses import StreamingResponse
-from app.models.chat import ChatRequest, ChatResponse, Message, TTSAudio
-from app.services.openai_svc import openai_service
+from app.core.config import settings
+from app.core.sse import EventStreamResponse
+from app.core.stream_buffer import ResumeGone, parse_event_id, stream_hub, stream_resumes
+from app.core.metrics import record_cache
+from app.core.logs import get_logger
+from app.models.chat import BulkRequest, BulkResponse, ChatRequest, ChatResponse, Message, TTSAudio
+from app.services.chat_svc import start_turn
+from app.services.title_svc import placeholder_title, title_service
+from app.services.image_svc import InvalidImage, image_service
 from app.services.supabase_svc import supabase_service
 from app.services.storage_service import storage_service
+from app.services.audio_svc import playback_epoch, playback_url
+from app.services.export_svc import InvalidImport, export_service
+from app.services.ephemeral_svc import ephemeral_store
 from app.routers.auth import get_current_user_id
 from uuid import UUID
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
-import json
+import asyncio
+import hashlib
+import tempfile
+import uuid
+
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+UPLOAD_CHUNK_BYTES = 256 * 1024
+# Non-image uploads larger than this are kept in a temporary file rather than in memory
+UPLOAD_SPOOL_BYTES = 1024 * 1024
+
 @router.get("/")
 async def list_conversations(user_id: UUID = Depends(get_current_user_id)):
     """List all conversations for the current user."""
     return supabase_service.list_conversations(user_id)
 
+@router.get("/export")
+async def export_conversations(user_id: UUID = Depends(get_current_user_id)):
+    """
+    All conversations and voice sessions of the current user as NDJSON, streamed page by page
+    (see ExportService). The file can be loaded back with POST /chat/import.
+    """
+    filename = f"conversations-{datetime.utcnow():%Y%m%d}.ndjson"
+    return StreamingResponse(
+        export_service.export_lines(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
+@router.post("/import")
+async def import_conversations(request: Request, user_id: UUID = Depends(get_current_user_id)):
+    """
+    Load an NDJSON export (request body, streamed) into the current user's account, in batches.
+    Rows that already exist are skipped, so an interrupted import can simply be sent again.
+    """
+    try:
+        return await export_service.import_lines(user_id, request.stream())
+    except InvalidImport as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
 @router.delete("/{conversation_id}")
 async def delete_conversation(conversation_id: UUID, user_id: UUID = Depends(get_current_user_id)):
-    """Delete a conversation."""
-    success = supabase_service.delete_conversation(conversation_id, user_id)
+    """Delete a conversation (for a temporary chat, the context the server keeps for it)."""
+    # Temporary chats are never stored, so there is nothing else to delete for them
+    success = await ephemeral_store.discard(user_id, conversation_id) or supabase_service.delete_conversation(conversation_id, user_id)
     if not success:
         # Could be 404 or just not allowed/not found
         raise HTTPException(status_code=404, detail="Conversation not found or could not be deleted")
@@ -43,27 +87,107 @@ async def update_conversation_title(
         
     return {"status": "ok", "message": "Title updated", "title": title}
 
+@router.get("/{conversation_id}/title")
+async def get_conversation_title(
+    conversation_id: UUID,
+    user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    Current title, for clients waiting on the generated one: `pending` is true while the
+    title is queued or in progress, on this worker or (judging by the row) another one.
+    """
+    row = supabase_service.get_conversation_title(conversation_id, user_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"title": row.get("title"), "pending": title_service.pending(conversation_id, row)}
+
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
     user_id: UUID = Depends(get_current_user_id)
 ):
-    """Upload a file (image/audio) and return the public URL."""
+    """
+    Upload a file (image/audio) and return the public URL.
+    Images are validated, downsized and re-encoded first (see image_svc); the response then
+    also carries their dimensions. Storage is content-addressed: a file uploaded before
+    returns the existing URL without being processed or transferred again.
+    """
+    is_image = (file.content_type or "").startswith("image/")
+    limit = settings.IMAGE_MAX_UPLOAD_BYTES if is_image else settings.UPLOAD_MAX_BYTES
+    # Hash while reading the upload, so a duplicate is recognised without a second pass. Images are
+    # processed in memory (and capped low); anything past UPLOAD_SPOOL_BYTES goes to a temporary file
+    # that is streamed to storage
+    digest = hashlib.sha256()
+    chunks = []
+    spool = None
+    size = 0
     try:
-        content = await file.read()
-        public_url_resp = await storage_service.upload_file(content, file.filename, file.content_type)
-        
-        # storage-py `get_public_url` returns a string URL or object depending on version
-        # If it's just the URL string, return it. If it's an object/response, extract it.
-        # Assuming our storage_service.py returns the URL string or Response object.
-        # Let's verify what `get_public_url` returns. Usually it returns the URL string directly in newer versions, 
-        # or we might need to construct it.
-        
-        # Adjust based on storage_service implementation which calls `get_public_url`
-        return {"url": public_url_resp} 
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(status_code=413, detail="File too large")
+            digest.update(chunk)
+            if spool is None and not is_image and size > UPLOAD_SPOOL_BYTES:
+                spool = tempfile.TemporaryFile(buffering=0)
+                for buffered in chunks:
+                    await asyncio.to_thread(spool.write, buffered)
+                chunks = []
+            if spool is not None:
+                await asyncio.to_thread(spool.write, chunk)
+            else:
+                chunks.append(chunk)
+        source_sha256 = digest.hexdigest()
+
+        stored = await storage_service.lookup(source_sha256)
+        if stored is None:
+            if is_image:
+                try:
+                    image = await image_service.process(b"".join(chunks))
+                except InvalidImage as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                stored = await storage_service.store(
+                    image["data"], image["content_type"], image["extension"], key=source_sha256, sha256=image["sha256"],
+                    meta={"width": image["width"], "height": image["height"], "content_type": image["content_type"]}
+                )
+            else:
+                extension = file.filename.rsplit(".", 1)[-1].lower() if file.filename and "." in file.filename else "bin"
+                if spool is not None:
+                    spool.seek(0)
+                content = spool if spool is not None else b"".join(chunks)
+                stored = await storage_service.store(content, file.content_type, extension, sha256=source_sha256)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Upload error: {e}")
+        logger.exception("Upload error")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if spool is not None:
+            spool.close()
+
+    return {"url": stored["url"], "sha256": stored["sha256"], "deduplicated": stored["deduplicated"], **stored["meta"]}
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_conversations(
+    request: BulkRequest,
+    user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    Delete conversations, rename conversations and delete TTS entries / voice sessions in one call.
+    Everything is applied in a single transaction; each item gets its own result
+    (ok=false when it does not exist or belongs to someone else).
+    """
+    if any(not title.strip() for title in request.titles.values()):
+        raise HTTPException(status_code=400, detail="Title required")
+    if not (request.delete or request.titles or request.delete_tts):
+        return BulkResponse(results=[])
+    results = await asyncio.to_thread(
+        supabase_service.bulk_conversations,
+        user_id,
+        delete=request.delete,
+        titles={i: title.strip() for i, title in request.titles.items()},
+        delete_voice_sessions=request.delete_tts
+    )
+    return BulkResponse(results=results)
 
 @router.post("/new")
 async def create_conversation(
@@ -76,16 +200,8 @@ async def create_conversation(
     """
     first_msg_content = request.messages[0].content if request.messages else "New Conversation"
     
-    # Handle multimodal content for title generation
-    if isinstance(first_msg_content, list):
-         # Extract text from list of content parts
-         text_parts = [p['text'] for p in first_msg_content if p.get('type') == 'text']
-         first_msg_text = " ".join(text_parts)
-    else:
-        first_msg_text = first_msg_content
-
-    # Basic title generation strategy: truncate first message
-    title = first_msg_text[:30] + "..." if len(first_msg_text) > 30 else first_msg_text
+    # Placeholder title (first message truncated); replaced in the background after the first answer
+    title = placeholder_title(first_msg_content)
     
     initial_msg = {
         "id": 0,
@@ -106,152 +222,159 @@ async def send_message(
     """
     Send a message to an existing conversation and stream the response.
     """
-    conversation = supabase_service.get_conversation(conversation_id)
-    
-    current_history = []
-    if conversation:
-        current_history = conversation.get("history", [])
-        
-    last_user_msg = request.messages[-1]
+    stream = await start_turn(user_id, conversation_id, request)
+    headers = None
+    if request.is_temporary:
+        # Whether the next turn may send only its new message (append)
+        headers = {"X-Context-Kept": "true" if ephemeral_store.keeps_context else "false"}
+    # Reading stops as soon as the client disconnects; generation stops once no reader is left for the grace window
+    return EventStreamResponse(stream_hub.frames(stream), headers=headers)
 
-    # Validation
-    if isinstance(last_user_msg.content, str) and not last_user_msg.content.strip():
-            raise HTTPException(status_code=400, detail="Empty message")
+@router.get("/{conversation_id}/stream")
+async def resume_stream(
+    conversation_id: UUID,
+    last_event_id: Optional[str] = Header(None),
+    user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    Reconnect to the answer being generated for a conversation, or one that ended less than
+    STREAM_RESUME_TTL_SECONDS ago. With a Last-Event-ID header only the events after it are sent.
+    """
+    stream = await stream_hub.lookup(str(conversation_id))
+    if stream is None or stream.owner != str(user_id):
+        stream_resumes.inc(result="not_found")
+        raise HTTPException(status_code=404, detail="No answer in progress for this conversation")
 
-    user_msg_entry = {
-        "id": 0, # User
-        "role": "user",
-        "msg": last_user_msg.content, 
-        "date": datetime.utcnow().isoformat()
-    }
-    
-    if request.is_temporary:
-        # For temporary chats, we rely on the frontend sending the full context if needed.
-        # But wait, frontend currently sends only the last message?
-        # If we want temporary chat, frontend MUST send full history if it wants context.
-        # Here we just use what we get.
-        updated_history = []
-        for m in request.messages:
-             updated_history.append({
-                 "role": m.role,
-                 "msg": m.content if isinstance(m.content, str) else str(m.content), # Simplify for now
-                 "id": 0 if m.role == "user" else 1,
-                 "date": datetime.utcnow().isoformat()
-             })
-    else:
-        if not conversation:
-            # Create conversation on the fly
-            first_msg_content = last_user_msg.content
-            if isinstance(first_msg_content, list):
-                 text_parts = [p['text'] for p in first_msg_content if p.get('type') == 'text']
-                 first_msg_text = " ".join(text_parts)
-            else:
-                first_msg_text = first_msg_content
-                
-            title = first_msg_text[:30] + "..." if len(first_msg_text) > 30 else first_msg_text
-            
-            conversation = supabase_service.create_conversation(user_id, title, user_msg_entry, conversation_id)
-            updated_history = [user_msg_entry]
-        else:
-            updated_history = current_history + [user_msg_entry]
-            supabase_service.update_conversation_history(conversation_id, updated_history)
-    
-    # Prepare messages for OpenAI
-    openai_messages = []
-    for h in updated_history:
-        role = "user" if h.get("id") == 0 else "assistant"
-        if "role" in h:
-            role = h["role"]
-            
-        msg_content = h.get("msg")
-        if isinstance(msg_content, list):
-             # For OpenAI, we need to ensure the structure is correct
-             # But here we are just validating against Pydantic Message model which expects str?
-             # Wait, Message model defined content: str. If we have list, it will fail.
-             # We need to update Message model to accept content as union too.
-             # Let's stringify for now or update model. 
-             # The error was about ID, not content yet.
-             # But let's be safe.
-             pass 
-             
-        openai_messages.append(Message(id=str(h.get("id")), role=role, content=str(h.get("msg")), created_at=datetime.fromisoformat(h.get("date"))))
-        
-    async def stream_generator():
-        full_response_content = ""
-        async for chunk in openai_service.stream_chat(openai_messages):
-            if chunk.startswith("data: {") and not "[DONE]" in chunk:
-                try:
-                    data = json.loads(chunk[6:])
-                    if "content" in data:
-                        full_response_content += data["content"]
-                except:
-                    pass
-            yield chunk
-            
-        if not request.is_temporary:
-            ai_msg_entry = {
-                "id": 1, # AI
-                "role": "assistant",
-                "msg": full_response_content,
-                "date": datetime.utcnow().isoformat()
-            }
-            final_history = updated_history + [ai_msg_entry]
-            supabase_service.update_conversation_history(conversation_id, final_history)
-
-    return StreamingResponse(stream_generator(), media_type="text/event-stream")
+    turn, after = parse_event_id(last_event_id)
+    try:
+        if turn is not None and turn != stream.turn:
+            raise ResumeGone()
+        await stream.check_position(after)
+    except ResumeGone:
+        # A newer answer replaced it, or the events are no longer buffered: the client should refetch the conversation
+        stream_resumes.inc(result="gone")
+        raise HTTPException(status_code=410, detail="Stream position is no longer available")
+
+    stream_resumes.inc(result="resumed")
+    return EventStreamResponse(stream_hub.frames(stream, after))
+
+def _message_id(conversation_id: UUID, seq: int) -> str:
+    """
+    Stable message ID derived from the conversation and the message position,
+    so the same message always gets the same ID and clients can cache/diff pages.
+    """
+    return str(uuid.uuid5(conversation_id, str(seq)))
+
+def _to_message(conversation_id: UUID, seq: int, item: Dict[str, Any]) -> Message:
+    # Map legacy 0/1 IDs to roles if 'role' is missing
+    role = "user" if item.get("id") == 0 else "assistant"
+    if "role" in item:
+        role = item["role"]
+
+    # Parse timestamp
+    date_str = item.get("date")
+    try:
+        timestamp = datetime.fromisoformat(date_str) if date_str else datetime.utcnow()
+    except ValueError:
+        timestamp = datetime.utcnow()
+
+    return Message(
+        id=_message_id(conversation_id, seq),
+        role=role,
+        content=item.get("msg", ""),
+        created_at=timestamp,
+        interrupted=item.get("interrupted", False)
+    )
+
+def _page_etag(conversation_id: UUID, updated_at: Optional[str], start_seq: int, count: int, voice_session_ids: List[str], transcripts: bool = False) -> str:
+    """
+    Weak ETag for a history page. `updated_at` changes on every history/title write
+    (trigger in schema.sql); voice sessions live in their own table so their IDs are mixed in.
+    """
+    raw = f"{conversation_id}:{updated_at}:{start_seq}:{count}:{','.join(voice_session_ids)}"
+    if transcripts:
+        raw += ":transcripts"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 @router.get("/{conversation_id}", response_model=ChatResponse)
-async def get_conversation(conversation_id: UUID, user_id: UUID = Depends(get_current_user_id)):
-    conversation = supabase_service.get_conversation(conversation_id)
+async def get_conversation(
+    conversation_id: UUID,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before: Optional[int] = Query(None, ge=0),
+    include_transcripts: bool = Query(False),
+    user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    Fetch a conversation.
+    Without `limit`/`before` the whole history is returned (legacy behaviour).
+    With them, only the latest `limit` messages preceding the `before` cursor are returned,
+    and `next_cursor` is the value to pass as `before` to load the previous page.
+    Voice sessions come as summaries (first line, duration, playback URL); their transcripts are
+    loaded with GET /chat/{id}/voice-sessions/{session_id}, or inline with `include_transcripts`.
+    Supports If-None-Match: unchanged pages return 304.
+    """
+    paginated = limit is not None or before is not None
+    if paginated:
+        history_read = supabase_service.load_conversation_page(conversation_id, before, limit or settings.HISTORY_PAGE_SIZE)
+    else:
+        history_read = supabase_service.load_conversation(conversation_id)
+    # Voice sessions are attached to the newest page only, read alongside the history
+    if before is None:
+        conversation, voice_sessions = await asyncio.gather(
+            history_read, supabase_service.load_voice_sessions(conversation_id, transcripts=include_transcripts)
+        )
+    else:
+        conversation, voice_sessions = await history_read, []
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    history_data = conversation.get("history", [])
-    messages = []
-    
-    for item in history_data:
-        # Map legacy 0/1 IDs to roles if 'role' is missing
-        role = "user" if item.get("id") == 0 else "assistant"
-        if "role" in item:
-            role = item["role"]
-        
-        content = item.get("msg", "")
-        
-        # Parse timestamp
-        date_str = item.get("date")
-        try:
-            timestamp = datetime.fromisoformat(date_str) if date_str else datetime.utcnow()
-        except ValueError:
-            timestamp = datetime.utcnow()
-        
-        # Generate stable-ish ID or use Random UUID to ensure frontend keys are unique
-        # (Internal ID 0/1 is not unique)
-        import uuid
-        msg_id = str(uuid.uuid4())
-        
-        messages.append(Message(
-            id=msg_id,
-            role=role,
-            content=content,
-            created_at=timestamp
-        ))
-    
-    # Fetch associated voice sessions
-    voice_sessions = supabase_service.list_voice_sessions(conversation_id)
+
+    history_data = conversation.get("history") or []
+    start_seq = conversation.get("start_seq", 0) if paginated else 0
+    total = conversation.get("total", len(history_data)) if paginated else len(history_data)
+
+    epoch = playback_epoch()
+    etag = _page_etag(
+        conversation_id,
+        conversation.get("updated_at"),
+        start_seq,
+        len(history_data),
+        # Transcoded sessions are served through signed URLs that rotate every playback epoch
+        [f"{s.get('id')}@{epoch}" if s.get("variant_url") else str(s.get("id")) for s in voice_sessions],
+        include_transcripts
+    )
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        record_cache("conversation_etag", hit=True)
+        return Response(status_code=304, headers={"ETag": etag})
+    record_cache("conversation_etag", hit=False)
+    response.headers["ETag"] = etag
+
+    messages = [_to_message(conversation_id, start_seq + i, item) for i, item in enumerate(history_data)]
+
     tts_history = []
     
     for session in voice_sessions:
         # Each session is one "blob" of TTS or audio
         # We need to map it back to TTSAudio structure expected by frontend
-        # voice_sessions: id, audio_url, transcript (list of dicts)
-        
-        # Assume transcript[0] has metadata if we saved it that way
-        transcripts = session.get("transcript", [])
-        if transcripts and isinstance(transcripts, list):
-            meta = transcripts[0]
+        # The first transcript line has the metadata if we saved it that way (TTS entries have only that line)
+        meta = session.get("first")
+        if meta and isinstance(meta, dict):
             # Try to get text from 'msg' (standard) or 'text' (legacy/tts)
             text_content = meta.get("msg") or meta.get("text") or "Audio"
+            transcript = session.get("transcript")
+            if transcript is None and meta.get("voice_id"):
+                transcript = [meta] # A TTS entry: its metadata is the whole transcript
             audio_url = session.get("audio_url")
+            if session.get("variant_url"):
+                # Compact Opus variant, range-served by /api/voice/sessions/{id}/audio
+                audio_url = playback_url(session.get("id"))
             tts_history.append(TTSAudio(
                 id=str(session.get("id")),
                 text=text_content,
@@ -259,7 +382,9 @@ async def get_conversation(conversation_id: UUID, user_id: UUID = Depends(get_cu
                 timestamp=meta.get("timestamp") or datetime.utcnow().timestamp() * 1000,
                 voiceId=meta.get("voice_id") or "conversational-ai",
                 voiceName=meta.get("voice_name") or "Unknown Voice", # Handle None
-                transcript=transcripts
+                transcript=transcript,
+                duration=session.get("duration"),
+                waveform=session.get("waveform")
             ))
 
     return ChatResponse(
@@ -267,9 +392,23 @@ async def get_conversation(conversation_id: UUID, user_id: UUID = Depends(get_cu
         conversation_id=conversation_id,
         title=conversation.get("title"),
         history=messages,
-        ttsHistory=tts_history
+        ttsHistory=tts_history,
+        next_cursor=start_seq if start_seq > 0 else None,
+        total_messages=total
     )
 
+@router.get("/{conversation_id}/voice-sessions/{session_id}")
+async def get_voice_session_transcript(
+    conversation_id: UUID,
+    session_id: UUID,
+    user_id: UUID = Depends(get_current_user_id)
+):
+    """Full transcript and waveform of a voice session (conversation fetches only carry summaries)."""
+    session = await asyncio.to_thread(supabase_service.get_voice_session_transcript, conversation_id, session_id, user_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Voice session not found")
+    return {"id": str(session["id"]), "transcript": session.get("transcript") or [], "waveform": session.get("waveform")}
+
 @router.post("/{conversation_id}/tts")
 async def add_tts_entry(
     conversation_id: UUID, 
@@ -278,11 +417,11 @@ async def add_tts_entry(
 ):
     """Add a TTS audio entry to the voice_sessions table."""
     # Ensure conversation exists
-    conversation = supabase_service.get_conversation(conversation_id)
+    conversation = await supabase_service.load_conversation(conversation_id)
     
     if not conversation:
         # Create new conversation if not exists
-        title = audio.text[:30] + "..." if len(audio.text) > 30 else audio.text
+        title = placeholder_title(audio.text)
         supabase_service.create_conversation(
             user_id=user_id, 
             title=title, 
@@ -315,7 +454,7 @@ async def add_tts_entry(
     updated_title = None
     if not conversation:
         # We just created it, we know the title we gave it
-        updated_title = audio.text[:30] + "..." if len(audio.text) > 30 else audio.text
+        updated_title = title
     
     return {
         "status": "created", 
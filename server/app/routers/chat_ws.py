@@ -0,0 +1,227 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.core.metrics import registry
+from app.core.sse import SSE_DONE
+from app.models.chat import ChatRequest
+from app.services.chat_svc import ConversationState, start_turn
+from app.services.ephemeral_svc import ephemeral_store
+from app.services.title_svc import title_service
+from app.routers.auth import get_current_user_id
+from contextlib import suppress
+from typing import Any, Awaitable, Dict, Optional, Set
+from uuid import UUID
+import asyncio
+import base64
+import json
+import time
+
+logger = get_logger(__name__)
+
+router = APIRouter(prefix="/chat", tags=["chat"])
+
+chat_websockets = registry.gauge("chat_websockets_active", "Open chat WebSocket connections")
+
+# Application close codes (4000-4999)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+def _token_expiry(token: str) -> Optional[float]:
+    """`exp` of a JWT, read without verifying it (Supabase already did). None if it has none."""
+    try:
+        payload = token.split(".")[1]
+        return float(json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+class ChatSocket:
+    """
+    One chat WebSocket: authenticated once, then any number of turns on any conversations,
+    multiplexed on the connection (each message says which conversation and client `ref` it is for).
+
+    Client -> server:
+      {"type": "auth", "token": "<Supabase JWT>"}   first message (unless the handshake had an
+                                                    Authorization header); again with a fresh token
+                                                    before the current one expires
+      {"type": "send", "ref": any, "conversation_id": "<uuid>", "messages": [...], "model"?, "is_temporary"?, "append"?}
+      {"type": "ping"}
+    Server -> client:
+      {"type": "ready", "user_id"}
+      {"type": "event", "ref", "conversation_id", "turn", "seq", "data": {...}}   tokens, tool events
+      {"type": "done", "ref", "conversation_id", "turn", "context_kept"?}        context_kept (temporary chats):
+                                                                                 whether the next turn may append
+      {"type": "title", "conversation_id", "title"}                              generated titles
+      {"type": "error", "ref"?, "conversation_id"?, "status", "detail", "retry_after"?}
+      {"type": "pong"}
+
+    Each turn goes through the same core as POST /chat/{id}/message (quotas, history, resumable
+    stream), so "turn" and "seq" resume it over GET /chat/{id}/stream with Last-Event-ID "turn.seq".
+    The state of the last CHAT_WS_MAX_CONVERSATIONS conversations stays in memory between turns.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.user_id: Optional[UUID] = None
+        self.expires_at: Optional[float] = None
+        # Least recently used first
+        self.states: Dict[str, ConversationState] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+
+    async def run(self):
+        await self.websocket.accept()
+        chat_websockets.inc()
+        try:
+            if not await self._handshake():
+                return
+            title_service.subscribe(self._on_title)
+            while await self._handle(await self.websocket.receive_text()):
+                pass
+        except WebSocketDisconnect:
+            pass
+        finally:
+            chat_websockets.dec()
+            title_service.unsubscribe(self._on_title)
+            # Reading stops with the connection; the answers themselves follow the stream grace rules
+            for task in self.tasks:
+                task.cancel()
+            if self.tasks:
+                await asyncio.wait(set(self.tasks))
+
+    async def _handshake(self) -> bool:
+        authorization = self.websocket.headers.get("authorization")
+        if authorization is None:
+            try:
+                raw = await asyncio.wait_for(self.websocket.receive_text(), settings.CHAT_WS_AUTH_TIMEOUT_SECONDS)
+                message = json.loads(raw)
+                authorization = f"Bearer {message['token']}" if message.get("type") == "auth" else None
+            except (asyncio.TimeoutError, ValueError, KeyError, TypeError, AttributeError):
+                authorization = None
+        refused = CLOSE_UNAUTHORIZED if authorization is None else await self._authenticate(authorization)
+        if refused:
+            await self.websocket.close(refused, "Authentication failed")
+            return False
+        await self.send({"type": "ready", "user_id": str(self.user_id)})
+        return True
+
+    async def _authenticate(self, authorization: str) -> Optional[int]:
+        """None once the token is verified, otherwise the code to close the connection with."""
+        try:
+            user_id = await get_current_user_id(authorization)
+        except HTTPException:
+            return CLOSE_UNAUTHORIZED
+        if self.user_id is not None and user_id != self.user_id:
+            # A connection belongs to one user for its whole life
+            return CLOSE_FORBIDDEN
+        self.user_id = user_id
+        self.expires_at = _token_expiry(authorization.split()[-1])
+        return None
+
+    async def _handle(self, raw: str) -> bool:
+        """Act on one client message; False once the connection has been closed."""
+        try:
+            message = json.loads(raw)
+            kind = message.get("type")
+        except (ValueError, AttributeError):
+            await self.send({"type": "error", "status": 400, "detail": "Invalid message"})
+            return True
+
+        if kind == "auth":
+            refused = await self._authenticate(f"Bearer {message.get('token')}")
+            if refused:
+                await self.websocket.close(refused, "Authentication failed")
+                return False
+            await self.send({"type": "ready", "user_id": str(self.user_id)})
+            return True
+        if self.expires_at is not None and time.time() >= self.expires_at:
+            await self.websocket.close(CLOSE_UNAUTHORIZED, "Token expired")
+            return False
+        if kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind == "send":
+            ref = message.get("ref")
+            try:
+                conversation_id = UUID(str(message.get("conversation_id")))
+                request = ChatRequest.model_validate(message)
+                if not request.messages:
+                    raise ValueError("No messages")
+            except (ValueError, ValidationError) as e:
+                await self.send({"type": "error", "ref": ref, "status": 422, "detail": str(e)})
+                return True
+            self._spawn(self._turn(ref, conversation_id, request))
+        else:
+            await self.send({"type": "error", "status": 400, "detail": f"Unknown message type: {kind}"})
+        return True
+
+    def _state(self, conversation_id: UUID) -> ConversationState:
+        key = str(conversation_id)
+        state = self.states.pop(key, None) or ConversationState(conversation_id)
+        self.states[key] = state
+        while len(self.states) > max(settings.CHAT_WS_MAX_CONVERSATIONS, 1):
+            del self.states[next(iter(self.states))]
+        return state
+
+    async def _turn(self, ref: Any, conversation_id: UUID, request: ChatRequest):
+        # Turns on one conversation queue up (a temporary chat's next turn continues its kept context too);
+        # different conversations stream side by side
+        state = self._state(conversation_id)
+        async with state.lock:
+            try:
+                stream = await start_turn(self.user_id, conversation_id, request, state, transport="websocket")
+            except HTTPException as e:
+                error = {"type": "error", "ref": ref, "conversation_id": str(conversation_id), "status": e.status_code, "detail": e.detail}
+                if e.headers and "Retry-After" in e.headers:
+                    error["retry_after"] = float(e.headers["Retry-After"])
+                await self.send(error)
+                return
+
+            # Frames are stored SSE-encoded ("data: {...}\n\n"); the JSON is spliced in as is
+            prefix = json.dumps({"type": "event", "ref": ref, "conversation_id": str(conversation_id), "turn": stream.turn})[:-1]
+            done = False
+            async for seq, frame in stream.read(0):
+                if frame == SSE_DONE:
+                    done = True
+                    message = {"type": "done", "ref": ref, "conversation_id": str(conversation_id), "turn": stream.turn}
+                    if request.is_temporary:
+                        message["context_kept"] = ephemeral_store.keeps_context
+                    await self.send(message)
+                else:
+                    await self.send(f'{prefix}, "seq": {seq}, "data": {frame[6:-2]}}}')
+            if not done:
+                await self.send({"type": "error", "ref": ref, "conversation_id": str(conversation_id), "status": 502, "detail": "The answer was interrupted"})
+
+    def _on_title(self, conversation_id: str, title: str):
+        state = self.states.get(conversation_id)
+        if state is None:
+            return
+        # The title write moved the conversation's version: read it again on the next turn
+        state.loaded = False
+        self._spawn(self.send({"type": "title", "conversation_id": conversation_id, "title": title}))
+
+    def _spawn(self, coro: Awaitable):
+        task = asyncio.ensure_future(self._guard(coro))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _guard(self, coro: Awaitable):
+        try:
+            await coro
+        except (WebSocketDisconnect, RuntimeError):
+            pass # The connection closed under the task
+        except Exception:
+            logger.exception("Chat WebSocket task failed", extra={"user_id": str(self.user_id)})
+            with suppress(WebSocketDisconnect, RuntimeError):
+                await self.send({"type": "error", "status": 500, "detail": "Internal error"})
+
+    async def send(self, message):
+        async with self._send_lock:
+            if isinstance(message, str):
+                await self.websocket.send_text(message)
+            else:
+                await self.websocket.send_json(message)
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """Chat over one persistent connection (see ChatSocket for the protocol)."""
+    await ChatSocket(websocket).run()
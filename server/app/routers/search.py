@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
+from app.core.singleflight import single_flight
+import asyncio
 import difflib
 
 router = APIRouter(prefix="/search", tags=["search"])
@@ -83,10 +85,7 @@ KNOWLEDGE_BASE = [
     }
 ]
 
-@router.post("", response_model=SearchResponse)
-async def search(request: SearchRequest):
-    query = request.query.lower().strip()
-    
+def _score(query: str) -> List[dict]:
     scored_results = []
     
     for item in KNOWLEDGE_BASE:
@@ -107,7 +106,18 @@ async def search(request: SearchRequest):
     scored_results.sort(key=lambda x: x["similarity"], reverse=True)
     
     # Filter out very low scores if needed, but for now return top 3
-    top_results = sorted(scored_results, key=lambda x: x["similarity"], reverse=True)[:3]
+    return scored_results[:3]
+
+@single_flight("search", key=lambda query: query)
+async def _ranked(query: str) -> List[dict]:
+    # Scoring is CPU bound: off the event loop, and shared by identical queries arriving together
+    return await asyncio.to_thread(_score, query)
+
+@router.post("", response_model=SearchResponse)
+async def search(request: SearchRequest):
+    query = request.query.lower().strip()
+    
+    top_results = await _ranked(query)
     
     if not top_results:
         return SearchResponse(
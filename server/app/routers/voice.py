@@ -1,8 +1,18 @@
-from fastapi import APIRouter, HTTPException, Response, Depends, Body
+from fastapi import APIRouter, HTTPException, Response, Depends, Body, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from uuid import UUID
 from typing import List, Optional, Dict, Any
+from urllib.parse import quote
+import asyncio
 from app.routers.auth import get_current_user_id
+from app.core.logs import get_logger
+from app.core.ratelimit import rate_limiter
+from app.core.clients import get_storage_http_client
+from app.services.audio_svc import BUCKET as AUDIO_BUCKET, verify_playback
+from app.services.storage_service import storage_service
+from app.services.supabase_svc import supabase_breaker, supabase_service
 from app.services.elevenlabs_svc import elevenlabs_service
 from app.services.voice_svc import voice_service
 
@@ -14,15 +24,21 @@ class VoiceSessionRequest(BaseModel):
     transcript: Optional[List[Dict[str, Any]]] = None
     app_conversation_id: Optional[str] = None
 
+logger = get_logger(__name__)
+
 router = APIRouter(prefix="/voice", tags=["voice"])
 
 @router.post("/speak")
-async def text_to_speech(request: SpeakRequest):
+async def text_to_speech(request: SpeakRequest, user_id: UUID = Depends(get_current_user_id)):
+    await rate_limiter.check(user_id, "tts")
     try:
-        audio_content = elevenlabs_service.text_to_speech(request.text, request.voiceId)
+        audio_content = await elevenlabs_service.text_to_speech(request.text, request.voiceId)
         return Response(content=audio_content, media_type="audio/mpeg")
+    except HTTPException:
+        # Includes CircuitOpenError: a fast 503 with Retry-After while ElevenLabs is down
+        raise
     except Exception as e:
-        print(f"Error generating speech: {e}")
+        logger.error("Error generating speech: %s", e)
         # Return the actual error message from ElevenLabs (which we raise in service)
         raise HTTPException(status_code=500, detail=f"ElevenLabs Error: {str(e)}")
 
@@ -46,6 +62,81 @@ async def process_voice_session(
         )
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing voice session: {e}")
+        logger.exception("Error processing voice session")
         raise HTTPException(status_code=500, detail=str(e))
+
+# Passed through between the client and storage for partial (seeking) requests
+RANGE_HEADERS = ("content-range", "content-length")
+
+@router.get("/sessions/{session_id}/audio")
+async def play_session_audio(
+    session_id: UUID,
+    request: Request,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    original: bool = Query(False)
+):
+    """
+    Voice session audio for <audio> elements, with HTTP Range support for seeking: the Opus variant
+    when there is one (or the MP3 with `original=true`). The URL is signed (see audio_svc.playback_url)
+    because media elements cannot send the Authorization header.
+    """
+    if not verify_playback(str(session_id), expires, signature, original):
+        raise HTTPException(status_code=403, detail="Invalid or expired playback URL")
+
+    session = await asyncio.to_thread(supabase_service.get_voice_session, session_id)
+    meta = (session or {}).get("audio_meta") or {}
+    # Only objects of the voice sessions bucket are proxied, whatever URL the row holds
+    variant = storage_service.object_path(meta.get("url"), AUDIO_BUCKET)
+    if variant and not original:
+        path, content_type, etag = variant, meta.get("content_type") or "audio/webm", meta.get("sha256")
+    elif session and session.get("audio_url") and session["audio_url"] != meta.get("url"):
+        path = storage_service.object_path(session["audio_url"], AUDIO_BUCKET)
+        if path is None:
+            logger.warning("Voice session audio URL outside storage, not proxied", extra={"session_id": str(session_id)})
+            raise HTTPException(status_code=404, detail="Audio not found")
+        # Content-addressed: the file name is the SHA-256 of the MP3
+        content_type = "audio/mpeg"
+        etag = meta.get("original_sha256") or path.rsplit("/", 1)[-1].split(".", 1)[0]
+    else:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    # Stored objects never change, so a cached copy is always good
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "ETag": f'"{etag}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"] and "range" not in request.headers:
+        return Response(status_code=304, headers=headers)
+
+    # identity: byte ranges and Content-Length must refer to the stored bytes
+    upstream_headers = {"Accept-Encoding": "identity"}
+    if "range" in request.headers:
+        upstream_headers["Range"] = request.headers["range"]
+    client = get_storage_http_client()
+    with supabase_breaker.guard() as call:
+        upstream = await client.send(client.build_request("GET", f"{AUDIO_BUCKET}/{quote(path)}", headers=upstream_headers), stream=True)
+        if upstream.status_code >= 500:
+            call.fail(HTTPException(status_code=502))
+    if upstream.status_code not in (200, 206):
+        await upstream.aclose()
+        if upstream.status_code == 416:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": upstream.headers.get("content-range", "")})
+        if upstream.status_code in (400, 404):
+            raise HTTPException(status_code=404, detail="Audio not found")
+        raise HTTPException(status_code=502, detail="Storage error")
+
+    for name in RANGE_HEADERS:
+        if name in upstream.headers:
+            headers[name] = upstream.headers[name]
+    return StreamingResponse(
+        upstream.aiter_raw(64 * 1024),
+        status_code=upstream.status_code,
+        media_type=content_type,
+        headers=headers,
+        background=BackgroundTask(upstream.aclose)
+    )
@@ -0,0 +1,109 @@
+from fastapi import APIRouter, HTTPException, Request
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.services.post_call_svc import post_call_staging, post_call_webhooks
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
+logger = get_logger(__name__)
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+# Maximum age of a signed webhook (same tolerance as the Bun webhook server)
+SIGNATURE_TOLERANCE_SECONDS = 30 * 60
+
+def verify_signature(header: str, body: bytes, secret: str) -> bool:
+    """
+    ElevenLabs signs webhooks with `ElevenLabs-Signature: t=<unix time>,v0=<hex HMAC-SHA256>`
+    over "<t>.<raw body>".
+    """
+    parts = dict(part.split("=", 1) for part in header.split(",") if "=" in part)
+    timestamp, signature = parts.get("t", ""), parts.get("v0", "")
+    if not timestamp.isdigit() or int(timestamp) < time.time() - SIGNATURE_TOLERANCE_SECONDS:
+        return False
+    expected = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def parse_payload(body: bytes) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """
+    The webhook's JSON and, for post_call_audio, its decoded audio (b"" if missing or invalid).
+    Raises ValueError for invalid JSON. Blocking: bodies of a whole call run to tens of MB.
+    """
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Not a JSON object")
+    audio = None
+    if payload.get("type") == "post_call_audio":
+        try:
+            audio = base64.b64decode((payload.get("data") or {}).get("full_audio") or "", validate=True)
+        except (binascii.Error, ValueError):
+            audio = b""
+    return payload, audio
+
+async def read_capped(request: Request, limit: int) -> Optional[bytes]:
+    """Request body, or None as soon as it is known to exceed `limit` bytes (declared or received)."""
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        return None
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            return None
+    return bytes(body)
+
+@router.post("/elevenlabs")
+async def elevenlabs_webhook(request: Request):
+    """
+    Post-call webhooks from ElevenLabs (post_call_audio, post_call_transcription).
+    The data is staged in memory and handed to the voice session processor waiting for it.
+    """
+    secret = settings.ELEVENLABS_WEBHOOK_SECRET
+    if not secret:
+        raise HTTPException(status_code=503, detail="Webhook ingestion is not configured")
+
+    # Unauthenticated until the signature is checked: never buffer more than the cap
+    body = await read_capped(request, settings.VOICE_WEBHOOK_MAX_BYTES)
+    if body is None:
+        post_call_webhooks.inc(type="unknown", result="too_large")
+        raise HTTPException(status_code=413, detail="Payload too large")
+    # Hashing, parsing and decoding payloads this size stay off the event loop
+    if not await asyncio.to_thread(verify_signature, request.headers.get("elevenlabs-signature", ""), body, secret):
+        post_call_webhooks.inc(type="unknown", result="bad_signature")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        payload, audio = await asyncio.to_thread(parse_payload, body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    webhook_type = payload.get("type") or "unknown"
+    data = payload.get("data") or {}
+    conversation_id = data.get("conversation_id")
+    if not conversation_id:
+        post_call_webhooks.inc(type=webhook_type, result="invalid")
+        raise HTTPException(status_code=400, detail="Missing conversation_id")
+
+    if webhook_type == "post_call_audio":
+        if not audio:
+            post_call_webhooks.inc(type=webhook_type, result="invalid")
+            raise HTTPException(status_code=400, detail="Missing or invalid full_audio")
+        await post_call_staging.put(conversation_id, audio=audio)
+    elif webhook_type == "post_call_transcription":
+        transcript = data.get("transcript")
+        if not isinstance(transcript, list):
+            post_call_webhooks.inc(type=webhook_type, result="invalid")
+            raise HTTPException(status_code=400, detail="Missing transcript")
+        await post_call_staging.put(conversation_id, transcript=transcript)
+    else:
+        post_call_webhooks.inc(type="unknown", result="invalid")
+        raise HTTPException(status_code=400, detail="Unknown webhook type")
+
+    post_call_webhooks.inc(type=webhook_type, result="staged")
+    logger.info("Post-call webhook staged", extra={"type": webhook_type, "conversation_id": conversation_id})
+    return {"status": "success", "conversation_id": conversation_id}
@@ -0,0 +1,237 @@
+from app.core.config import settings
+from app.core.lifecycle import stream_tracker
+from app.core.metrics import registry
+from app.core.logs import get_logger
+from app.services.storage_service import storage_service
+from app.services.supabase_svc import supabase_service
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+import array
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+logger = get_logger(__name__)
+
+audio_transcode_duration = registry.histogram(
+    "audio_transcode_seconds", "Time to transcode a voice session to Opus and compute its waveform (queueing included)",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+audio_transcodes = registry.counter(
+    "audio_transcodes_total", "Voice session transcodes, by result (transcoded, deduplicated, failed)", ("result",)
+)
+audio_bytes_saved = registry.counter(
+    "audio_bytes_saved_total", "Bytes by which Opus variants are smaller than the original voice session audio"
+)
+
+BUCKET = "voice-sessions"
+# The waveform is computed from a low-rate decode: plenty for a few hundred peaks
+WAVEFORM_SAMPLE_RATE = 8000
+
+class AudioTranscodeError(RuntimeError):
+    """ffmpeg is missing, failed or timed out."""
+
+def waveform(pcm: bytes, points: int) -> List[float]:
+    """Peak amplitude (0-1) of `points` equal slices of 16-bit mono PCM."""
+    samples = array.array("h")
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap() # s16le
+    if not samples or points <= 0:
+        return []
+    points = min(points, len(samples))
+    step = len(samples) / points
+    peaks = []
+    for i in range(points):
+        chunk = samples[int(i * step):int((i + 1) * step)]
+        peaks.append(round(max(max(chunk), -min(chunk)) / 32768, 3))
+    return peaks
+
+def transcode_audio(data: bytes, ffmpeg: str, bitrate_kbps: int, points: int, timeout: float) -> Dict[str, Any]:
+    """
+    Re-encode audio as mono Opus in WebM and measure it, with one ffmpeg run that writes both
+    the Opus file and a low-rate PCM decode (for the waveform and the duration).
+    Runs in a worker process: everything it needs comes in as arguments.
+    """
+    with tempfile.TemporaryDirectory(prefix="voice-audio-") as workdir:
+        source = os.path.join(workdir, "source")
+        opus_path = os.path.join(workdir, "audio.webm")
+        pcm_path = os.path.join(workdir, "audio.pcm")
+        with open(source, "wb") as f:
+            f.write(data)
+        command = [
+            ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", source,
+            # -application voip tunes Opus for speech
+            "-map", "0:a:0", "-ac", "1", "-c:a", "libopus", "-b:a", f"{bitrate_kbps}k", "-application", "voip", "-f", "webm", opus_path,
+            "-map", "0:a:0", "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", pcm_path,
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AudioTranscodeError(f"ffmpeg could not run: {e}") from e
+        if result.returncode != 0:
+            raise AudioTranscodeError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace')[-500:]}")
+        with open(opus_path, "rb") as f:
+            encoded = f.read()
+        with open(pcm_path, "rb") as f:
+            pcm = f.read()
+
+    return {
+        "data": encoded,
+        "sha256": hashlib.sha256(encoded).hexdigest(),
+        "duration": round(len(pcm) / 2 / WAVEFORM_SAMPLE_RATE, 2),
+        "waveform": waveform(pcm, points),
+    }
+
+class AudioService:
+    """
+    Background stage after a voice session is saved: the MP3 is transcoded to a small Opus variant
+    (see `transcode_audio`) in a pool of AUDIO_TRANSCODE_WORKERS processes per API worker
+    (0 = a thread), stored content-addressed next to it, and described in voice_sessions.audio_meta
+    ({url, sha256, size, content_type, bitrate_kbps, duration, waveform, original_sha256, original_size}).
+    The variant is indexed by the original's hash, so reprocessing a session does not transcode again.
+    """
+
+    def __init__(self):
+        self._pool: Optional[Executor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._ffmpeg: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        if not settings.AUDIO_TRANSCODE_ENABLED:
+            return False
+        if self._ffmpeg is None:
+            self._ffmpeg = shutil.which(settings.AUDIO_FFMPEG_PATH) or ""
+            if not self._ffmpeg:
+                logger.warning("ffmpeg not found (%s): voice sessions are kept as MP3 only", settings.AUDIO_FFMPEG_PATH)
+        return bool(self._ffmpeg)
+
+    def _executor(self) -> Optional[Executor]:
+        if self._pool is None and settings.AUDIO_TRANSCODE_WORKERS > 0:
+            # spawn, not fork: forking a process with a running event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.AUDIO_TRANSCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def transcode(self, data: bytes) -> Dict[str, Any]:
+        """Returns the Opus bytes and their metadata; raises AudioTranscodeError."""
+        loop = asyncio.get_running_loop()
+        args = (
+            data,
+            self._ffmpeg,
+            settings.AUDIO_OPUS_BITRATE_KBPS,
+            settings.AUDIO_WAVEFORM_POINTS,
+            settings.AUDIO_TRANSCODE_TIMEOUT_SECONDS,
+        )
+        started = loop.time()
+        executor = self._executor()
+        if executor is None:
+            result = await asyncio.to_thread(transcode_audio, *args)
+        else:
+            result = await loop.run_in_executor(executor, transcode_audio, *args)
+        audio_transcode_duration.observe(loop.time() - started)
+        return result
+
+    def schedule(self, session_id: str, audio: bytes, original: Dict[str, Any]):
+        """Transcode a saved session's audio in the background. `original` is what storage_service.store returned."""
+        if not self.available:
+            return
+        task = asyncio.get_running_loop().create_task(self._process(str(session_id), audio, original))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def _process(self, session_id: str, audio: bytes, original: Dict[str, Any]):
+        bitrate = settings.AUDIO_OPUS_BITRATE_KBPS
+        key = hashlib.sha256(f"{original['sha256']}:opus:{bitrate}".encode()).hexdigest()
+        try:
+            stored = await storage_service.lookup(key, BUCKET)
+            if stored is not None:
+                audio_transcodes.inc(result="deduplicated")
+            else:
+                result = await self.transcode(audio)
+                stored = await storage_service.store(
+                    result["data"], "audio/webm", "webm", bucket_name=BUCKET, key=key, sha256=result["sha256"],
+                    meta={"duration": result["duration"], "waveform": result["waveform"]}
+                )
+                audio_transcodes.inc(result="transcoded")
+                audio_bytes_saved.inc(max(len(audio) - stored["size"], 0))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            audio_transcodes.inc(result="failed")
+            logger.warning("Voice session transcode failed: %s", e, extra={"session_id": session_id})
+            return
+
+        audio_meta = {
+            "url": stored["url"],
+            "sha256": stored["sha256"],
+            "size": stored["size"],
+            "content_type": "audio/webm",
+            "codec": "opus",
+            "bitrate_kbps": bitrate,
+            "duration": stored["meta"].get("duration"),
+            "waveform": stored["meta"].get("waveform"),
+            "original_sha256": original["sha256"],
+            "original_size": original["size"],
+        }
+        keep_original = settings.AUDIO_KEEP_ORIGINAL
+        await stream_tracker.persist(
+            supabase_service.update_voice_session_audio, session_id, audio_meta,
+            audio_url=None if keep_original else stored["url"]
+        )
+        if not keep_original:
+            await storage_service.remove(original["sha256"], "mp3", BUCKET)
+
+    async def shutdown(self):
+        """Cancel transcodes in progress (those sessions keep only their MP3) and stop the pool."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.wait(set(self._tasks))
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+def _playback_key() -> bytes:
+    if settings.AUDIO_PLAYBACK_SECRET:
+        return settings.AUDIO_PLAYBACK_SECRET.encode()
+    return hmac.new(settings.require("SUPABASE_SERVICE_KEY").encode(), b"voice-playback", hashlib.sha256).digest()
+
+def _signature(session_id: str, expires: int, original: bool) -> str:
+    # The variant is part of what is signed: a link to one cannot be turned into a link to the other
+    payload = f"{session_id}:{expires}:{'original' if original else 'audio'}"
+    return hmac.new(_playback_key(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+def playback_epoch() -> int:
+    """Changes every AUDIO_PLAYBACK_URL_TTL_SECONDS, together with the playback URLs."""
+    return int(time.time()) // settings.AUDIO_PLAYBACK_URL_TTL_SECONDS
+
+def playback_url(session_id: str, original: bool = False) -> str:
+    """
+    Signed URL of the playback endpoint, usable straight as an <audio> src (no auth header);
+    `original` for the MP3 instead of the Opus variant.
+    The expiry is rounded so URLs are stable within an epoch and stay valid for at least one more.
+    """
+    expires = (playback_epoch() + 2) * settings.AUDIO_PLAYBACK_URL_TTL_SECONDS
+    url = f"/api/voice/sessions/{session_id}/audio?expires={expires}&signature={_signature(str(session_id), expires, original)}"
+    return url + "&original=true" if original else url
+
+def verify_playback(session_id: str, expires: int, signature: str, original: bool = False) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(str(session_id), expires, original), signature)
+
+audio_service = AudioService()
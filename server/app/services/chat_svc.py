@@ -0,0 +1,254 @@
+from app.core.config import settings
+from app.core.lifecycle import stream_tracker
+from app.core.logs import get_logger
+from app.core.metrics import registry
+from app.core.ratelimit import rate_limiter
+from app.core.scheduler import openai_breaker
+from app.core.sse import SSE_DONE, coalesce, format_event
+from app.core.stream_buffer import MemoryStream, stream_hub
+from app.models.chat import ChatMessage, ChatRequest
+from app.services.ephemeral_svc import ephemeral_store
+from app.services.image_svc import to_openai_content
+from app.services.model_router_svc import model_router
+from app.services.supabase_svc import supabase_service
+from app.services.title_svc import placeholder_title, title_service
+from fastapi import HTTPException
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+import asyncio
+
+logger = get_logger(__name__)
+
+# Reload-and-retry rounds when the conversation changed between reading and writing its history
+HISTORY_WRITE_ATTEMPTS = 3
+
+chat_turns = registry.counter(
+    "chat_turns_total", "Chat turns started, by transport (http, websocket)", ("transport",)
+)
+chat_state_conflicts = registry.counter(
+    "chat_state_conflicts_total", "History writes that found the conversation changed since it was read (reloaded and retried)"
+)
+
+class ConversationState:
+    """
+    What a chat turn needs to know about a conversation. An HTTP turn reads a fresh one; a WebSocket
+    keeps it between turns, so a follow-up message costs no read. History writes are conditional on
+    `updated_at`, so a state gone stale (another tab wrote, a title was generated) is reloaded
+    instead of overwriting newer messages.
+    """
+    __slots__ = ("conversation_id", "loaded", "exists", "history", "title", "updated_at", "lock")
+
+    def __init__(self, conversation_id: UUID):
+        self.conversation_id = conversation_id
+        self.loaded = False
+        self.exists = False
+        self.history: List[Dict[str, Any]] = []
+        self.title = ""
+        self.updated_at: Optional[str] = None
+        # One turn at a time per conversation on a connection: the next one needs this one's answer
+        self.lock = asyncio.Lock()
+
+    async def load(self):
+        self.refresh(await supabase_service.load_conversation(self.conversation_id))
+
+    def refresh(self, row: Optional[Dict[str, Any]]):
+        # Rows from load_conversation are shared: histories are replaced, never mutated
+        self.loaded = True
+        self.exists = row is not None
+        self.history = (row or {}).get("history") or []
+        self.title = (row or {}).get("title") or ""
+        self.updated_at = (row or {}).get("updated_at")
+
+def _is_duplicate(error: BaseException) -> bool:
+    from postgrest.exceptions import APIError
+    return isinstance(error, APIError) and error.code == "23505"
+
+async def _append_user_message(state: ConversationState, user_id: UUID, entry: Dict[str, Any], content: Any) -> List[Dict[str, Any]]:
+    """Save the user's message; returns the history including it."""
+    for _ in range(HISTORY_WRITE_ATTEMPTS):
+        if not state.exists:
+            # Create conversation on the fly
+            title = placeholder_title(content)
+            try:
+                row = await asyncio.to_thread(supabase_service.create_conversation, user_id, title, entry, state.conversation_id)
+            except Exception as e:
+                if not _is_duplicate(e):
+                    raise
+                row = None # Created meanwhile (another tab)
+        else:
+            row = await asyncio.to_thread(
+                supabase_service.update_conversation_history, state.conversation_id, state.history + [entry], state.updated_at
+            )
+        if row is not None:
+            state.refresh(row)
+            return state.history
+        chat_state_conflicts.inc()
+        await state.load()
+    raise HTTPException(status_code=409, detail="The conversation keeps changing, retry shortly")
+
+def _save_answer(conversation_id: UUID, history: List[Dict[str, Any]], updated_at: Optional[str],
+                 question: Dict[str, Any], answer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Save the answer into `history` (the version at `updated_at`, which ends with `question`).
+    If another turn wrote in between, the answer is merged into the newer history, right after
+    its question, instead of overwriting it. Blocking: runs through stream_tracker.persist.
+    """
+    for _ in range(HISTORY_WRITE_ATTEMPTS):
+        try:
+            position = history.index(question) + 1
+        except ValueError:
+            position = len(history)
+        row = supabase_service.update_conversation_history(
+            conversation_id, history[:position] + [answer] + history[position:], updated_at
+        )
+        if row is not None:
+            return row
+        chat_state_conflicts.inc()
+        current = supabase_service.get_conversation(conversation_id)
+        if current is None:
+            return None # Deleted meanwhile
+        history, updated_at = current.get("history") or [], current.get("updated_at")
+    logger.warning("Answer not saved, the conversation kept changing", extra={"conversation_id": str(conversation_id)})
+    return None
+
+async def _temporary_context(user_id: UUID, conversation_id: UUID, request: ChatRequest) -> List[Dict[str, Any]]:
+    """History of a temporary chat with the request's messages: appended to the kept context, or replacing it."""
+    history = []
+    if request.append:
+        history = await ephemeral_store.get(user_id, conversation_id)
+        if history is None:
+            raise HTTPException(status_code=409, detail="Temporary chat context expired, resend the whole conversation")
+    now = datetime.utcnow().isoformat()
+    for m in request.messages:
+        history.append({"id": 0 if m.role == "user" else 1, "role": m.role, "msg": m.content, "date": now})
+    return history
+
+async def start_turn(user_id: UUID, conversation_id: UUID, request: ChatRequest,
+                     state: Optional[ConversationState] = None, transport: str = "http") -> MemoryStream:
+    """
+    Admit a chat turn, save the user's message and start generating the answer in the background
+    (see StreamHub). Returns the stream to read the answer from; raises HTTPException when the turn
+    is refused. `state` is the caller's warm ConversationState, if it keeps one.
+    """
+    # Validation first, so a bad request costs neither a rate-limit token nor a conversation read
+    if request.model and request.model not in settings.CHAT_ALLOWED_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unsupported model: {request.model}")
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="No messages")
+    last_user_msg = request.messages[-1]
+    if isinstance(last_user_msg.content, str) and not last_user_msg.content.strip():
+        raise HTTPException(status_code=400, detail="Empty message")
+
+    if stream_tracker.draining:
+        # Worker is shutting down: let the client retry against another worker
+        raise HTTPException(status_code=503, detail="Server is restarting, retry shortly", headers={"Retry-After": "1"})
+    # OpenAI known to be down: answer 503 now rather than opening a stream that can only fail
+    openai_breaker.check()
+
+    if request.is_temporary:
+        # Before the quotas: a missing context (409) is answered without spending a token or a slot
+        updated_history = await _temporary_context(user_id, conversation_id, request)
+
+    # Per-user quotas: request rate, then a concurrent stream slot (released when the stream ends)
+    await rate_limiter.check(user_id, "chat")
+    lease = await rate_limiter.acquire_stream(user_id)
+
+    try:
+        if state is None:
+            state = ConversationState(conversation_id)
+        # Temporary chats never touch Supabase
+        if not state.loaded and not request.is_temporary:
+            await state.load()
+        title = state.title
+
+        user_msg_entry = {
+            "id": 0, # User
+            "role": "user",
+            "msg": last_user_msg.content,
+            "date": datetime.utcnow().isoformat()
+        }
+
+        if not request.is_temporary:
+            # Temporary chats are kept in the ephemeral store only (see ephemeral_svc)
+            updated_history = await _append_user_message(state, user_id, user_msg_entry, last_user_msg.content)
+            title = state.title
+            # The version holding this turn's message: the answer is written on top of it
+            version = state.updated_at
+
+        # Prepare messages for OpenAI
+        openai_messages = []
+        for h in updated_history:
+            role = "user" if h.get("id") == 0 else "assistant"
+            if "role" in h:
+                role = h["role"]
+
+            # Multimodal messages go as structured text/image parts, not stringified
+            openai_messages.append(ChatMessage(role=role, content=to_openai_content(h.get("msg"))))
+
+        # The first answer of a conversation triggers its generated title (see title_svc)
+        first_exchange = not any(h.get("role") == "assistant" or h.get("id") == 1 for h in updated_history[:-1])
+
+        stream = await stream_hub.open(str(conversation_id), str(user_id))
+    except BaseException:
+        await rate_limiter.release_stream(user_id, lease)
+        raise
+    chat_turns.inc(transport=transport)
+
+    async def produce(stream):
+        # The answer is generated independently of any one reader: the request or socket that
+        # started it and any reconnect (Last-Event-ID) read the stream buffer.
+        # Text is accumulated straight from the structured events; frames are encoded once on the way in.
+        response_parts = []
+        completed = False
+        async with stream_tracker.stream():
+            try:
+                events = coalesce(
+                    model_router.stream_chat(openai_messages, request.model),
+                    interval_ms=settings.STREAM_COALESCE_MS,
+                    max_bytes=settings.STREAM_COALESCE_BYTES
+                )
+                async for event in events:
+                    content = event.get("content")
+                    if content:
+                        response_parts.append(content)
+                    await stream.publish(format_event(event))
+                completed = True
+            finally:
+                # Runs on normal completion and on cancellation (no reader left for the grace window,
+                # shutdown deadline), so whatever was generated is saved, marked as interrupted if
+                # the answer is partial. The write is a tracked task that outlives the producer;
+                # shutdown flushes it before the worker exits.
+                try:
+                    final_history = updated_history
+                    if completed or response_parts:
+                        ai_msg_entry = {
+                            "id": 1, # AI
+                            "role": "assistant",
+                            "msg": "".join(response_parts),
+                            "date": datetime.utcnow().isoformat()
+                        }
+                        if not completed:
+                            ai_msg_entry["interrupted"] = True
+                        final_history = updated_history + [ai_msg_entry]
+                    if request.is_temporary:
+                        # Kept before [DONE], so the next turn finds the answer in the context
+                        await ephemeral_store.put(user_id, conversation_id, final_history)
+                    elif completed or response_parts:
+                        write = stream_tracker.persist(_save_answer, conversation_id, updated_history, version, user_msg_entry, ai_msg_entry)
+                        # Until the write is known to have landed, the next turn reads the conversation again
+                        state.loaded = False
+                        if completed:
+                            # Send [DONE] only once the history is saved, so a refetch sees the answer
+                            row = await asyncio.shield(write)
+                            if row is not None:
+                                state.refresh(row)
+                            if first_exchange:
+                                title_service.schedule(conversation_id, title, last_user_msg.content, ai_msg_entry["msg"])
+                    if completed:
+                        await stream.publish(SSE_DONE)
+                finally:
+                    await rate_limiter.release_stream(user_id, lease)
+
+    stream_hub.start(str(conversation_id), stream, produce)
+    return stream
@@ -1,20 +1,98 @@
-import requests
 from app.core.config import settings
-from typing import Optional, Generator, Iterator
+from app.core.breaker import circuit_breaker
+from app.core.clients import get_elevenlabs_client
+from app.core.metrics import elevenlabs_call_duration, registry, timed
+from app.core.singleflight import single_flight
+from app.core.tracing import traced
+from app.core.logs import get_logger
+from typing import AsyncIterator
+import asyncio
+import random
+
+logger = get_logger(__name__)
+
+elevenlabs_retries = registry.counter(
+    "elevenlabs_retries_total", "ElevenLabs calls retried after a transient error, by status/error", ("reason",)
+)
+
+# Rate limited, or transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+DEFAULT_VOICE_ID = "21m00Tcm4TlvDq8ikWAM" # Rachel
+
+class ElevenLabsError(Exception):
+    """Non-2xx answer from ElevenLabs (after retries)."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _is_outage(error: BaseException) -> bool:
+    """Errors that count against the ElevenLabs breaker: connection errors, timeouts and 5xx."""
+    import httpx
+    if isinstance(error, ElevenLabsError):
+        return error.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+elevenlabs_breaker = circuit_breaker("elevenlabs", _is_outage)
 
 class ElevenLabsService:
-    def __init__(self):
-        self.api_key = settings.ELEVENLABS_API_KEY
-        self.api_url = "https://api.elevenlabs.io/v1"
-        self.headers = {
-            "xi-api-key": self.api_key,
+    """
+    ElevenLabs REST API over the shared keep-alive client (app.core.clients), so calls
+    reuse pooled connections instead of paying TCP+TLS setup each time, and never block
+    the event loop. Connection errors, 429 and 5xx are retried with exponential backoff;
+    each attempt goes through the "elevenlabs" circuit breaker.
+    """
+
+    @property
+    def client(self):
+        return get_elevenlabs_client()
+
+    @property
+    def headers(self) -> dict:
+        # Read lazily so a missing key only fails the voice features, not the import
+        return {
+            "xi-api-key": settings.require("ELEVENLABS_API_KEY"),
             "Content-Type": "application/json"
         }
-        print(f"ElevenLabs Service initialized. Key length: {len(self.api_key) if self.api_key else 0}")
 
-    def text_to_speech(self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM") -> bytes: # Default to Rachel
-        url = f"{self.api_url}/text-to-speech/{voice_id}"
-        
+    async def _request(self, method: str, path: str, operation: str, **kwargs):
+        """Send a request, retrying transient failures; raises ElevenLabsError on a final non-200."""
+        import httpx
+
+        attempt = 0
+        while True:
+            try:
+                with elevenlabs_breaker.guard() as call:
+                    response = await self.client.request(method, path, headers=self.headers, **kwargs)
+                    if response.status_code >= 500:
+                        call.fail(ElevenLabsError(f"ElevenLabs API Error ({operation}): {response.status_code}", response.status_code))
+                reason = str(response.status_code) if response.status_code in RETRYABLE_STATUS else None
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.ReadError) as e:
+                if attempt >= settings.ELEVENLABS_MAX_RETRIES:
+                    raise
+                response, reason = None, type(e).__name__
+            if reason is None or attempt >= settings.ELEVENLABS_MAX_RETRIES:
+                break
+            delay = random.uniform(0, settings.ELEVENLABS_BACKOFF_BASE_SECONDS * 2 ** attempt)
+            retry_after = response.headers.get("retry-after") if response is not None else None
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                delay = min(float(retry_after), 10.0)
+            elevenlabs_retries.inc(reason=reason)
+            logger.warning("ElevenLabs %s failed (%s), retrying in %.2fs", operation, reason, delay, extra={"attempt": attempt + 1})
+            attempt += 1
+            await asyncio.sleep(delay)
+
+        if response.status_code != 200:
+            logger.error("ElevenLabs API Error (%s): %s - %s", operation, response.status_code, response.text)
+            raise ElevenLabsError(f"ElevenLabs API Error ({operation}): {response.status_code} - {response.text}", response.status_code)
+        return response
+
+    # Many clients asking for the same text and voice at once share one synthesis
+    @single_flight("elevenlabs.text_to_speech", key=lambda self, text, voice_id=DEFAULT_VOICE_ID: (text, voice_id))
+    @timed(elevenlabs_call_duration, method="text_to_speech")
+    @traced("elevenlabs.text_to_speech")
+    async def text_to_speech(self, text: str, voice_id: str = DEFAULT_VOICE_ID) -> bytes:
         data = {
             "text": text,
             "model_id": "eleven_turbo_v2_5",
@@ -23,19 +101,10 @@ class ElevenLabsService:
                 "similarity_boost": 0.5
             }
         }
-        
-        response = requests.post(url, json=data, headers=self.headers)
-        
-        if response.status_code != 200:
-            print(f"ElevenLabs API Error: {response.status_code} - {response.text}") # Debug
-            # If default fails or quota exceeded, fallback or raise
-            raise Exception(f"ElevenLabs API Error: {response.status_code} - {response.text}")
-            
+        response = await self._request("POST", f"/text-to-speech/{voice_id}", "text_to_speech", json=data)
         return response.content
 
-    def stream_text_to_speech(self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM") -> Iterator[bytes]:
-        url = f"{self.api_url}/text-to-speech/{voice_id}/stream"
-        
+    async def stream_text_to_speech(self, text: str, voice_id: str = DEFAULT_VOICE_ID) -> AsyncIterator[bytes]:
         data = {
             "text": text,
             "model_id": "eleven_turbo_v2_5",
@@ -44,38 +113,38 @@ class ElevenLabsService:
                 "similarity_boost": 0.5
             }
         }
-        
-        response = requests.post(url, json=data, headers=self.headers, stream=True)
-        
-        if response.status_code != 200:
-             raise Exception(f"ElevenLabs API Error: {response.status_code} - {response.text}")
-             
-        for chunk in response.iter_content(chunk_size=1024):
-            if chunk:
+        # Generator: only the request (time to response headers) is timed, not the consumer.
+        # Not retried: the body is consumed as it arrives.
+        request = self.client.build_request("POST", f"/text-to-speech/{voice_id}/stream", json=data, headers=self.headers)
+        with elevenlabs_call_duration.time(method="stream_text_to_speech"), elevenlabs_breaker.guard() as call:
+            response = await self.client.send(request, stream=True)
+            if response.status_code >= 500:
+                call.fail(ElevenLabsError(f"ElevenLabs API Error (stream_text_to_speech): {response.status_code}", response.status_code))
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise ElevenLabsError(f"ElevenLabs API Error (stream_text_to_speech): {response.status_code} - {response.text}", response.status_code)
+            async for chunk in response.aiter_bytes(1024):
                 yield chunk
+        finally:
+            await response.aclose()
 
-    def get_conversation(self, conversation_id: str) -> dict:
+    @timed(elevenlabs_call_duration, method="get_conversation")
+    @traced("elevenlabs.get_conversation")
+    async def get_conversation(self, conversation_id: str) -> dict:
         """
         Fetch conversation metadata and transcript from ElevenLabs.
         """
-        url = f"{self.api_url}/convai/conversations/{conversation_id}"
-        response = requests.get(url, headers=self.headers)
-        
-        if response.status_code != 200:
-            raise Exception(f"ElevenLabs API Error (get_conversation): {response.status_code} - {response.text}")
-            
+        response = await self._request("GET", f"/convai/conversations/{conversation_id}", "get_conversation")
         return response.json()
 
-    def get_audio(self, conversation_id: str) -> bytes:
+    @timed(elevenlabs_call_duration, method="get_audio")
+    @traced("elevenlabs.get_audio")
+    async def get_audio(self, conversation_id: str) -> bytes:
         """
         Fetch the audio of the conversation.
         """
-        url = f"{self.api_url}/convai/conversations/{conversation_id}/audio"
-        response = requests.get(url, headers=self.headers)
-        
-        if response.status_code != 200:
-            raise Exception(f"ElevenLabs API Error (get_audio): {response.status_code} - {response.text}")
-            
+        response = await self._request("GET", f"/convai/conversations/{conversation_id}/audio", "get_audio")
         return response.content
 
 elevenlabs_service = ElevenLabsService()
@@ -0,0 +1,177 @@
+from app.core.config import settings
+from app.core.logs import get_logger
+from app.core.metrics import registry
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import math
+import time
+
+# Context of temporary chats, kept on the server so the client sends only its new message each turn.
+# Nothing here is written to Supabase; entries expire EPHEMERAL_TTL_SECONDS after their last turn.
+
+logger = get_logger(__name__)
+
+ephemeral_lookups = registry.counter(
+    "ephemeral_lookups_total", "Temporary chat context reads, by result (hit, miss)", ("result",)
+)
+ephemeral_evictions = registry.counter(
+    "ephemeral_evictions_total", "Temporary chat contexts dropped before use, by reason (expired, capacity, oversize)", ("reason",)
+)
+
+class MemoryBackend:
+    """
+    In-process LRU of encoded histories, bounded by EPHEMERAL_MAX_CONVERSATIONS entries and
+    EPHEMERAL_MAX_BYTES in total; least recently used entries are evicted first.
+    """
+
+    def __init__(self):
+        # key -> (encoded history, expiry); least recently used first
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.bytes = 0
+
+    @property
+    def entries(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            ephemeral_evictions.inc(reason="expired")
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    async def set(self, key: str, blob: str, ttl: float):
+        self._remove(key)
+        self._entries[key] = (blob, time.monotonic() + ttl)
+        self.bytes += len(blob)
+        self._evict()
+
+    async def delete(self, key: str) -> bool:
+        return self._remove(key)
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= len(entry[0])
+        return True
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            expired = expires_at <= now
+            if not expired and len(self._entries) <= settings.EPHEMERAL_MAX_CONVERSATIONS and self.bytes <= settings.EPHEMERAL_MAX_BYTES:
+                return
+            self._remove(key)
+            ephemeral_evictions.inc(reason="expired" if expired else "capacity")
+
+class RedisBackend:
+    """Contexts shared by every worker; Redis expires them (its maxmemory policy caps the total)."""
+
+    # Not tracked per worker: see Redis INFO memory / keyspace
+    entries = 0
+    bytes = 0
+
+    def __init__(self):
+        from app.core.clients import get_redis_client
+        self.redis = get_redis_client()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.redis.get(f"ephemeral:{key}")
+
+    async def set(self, key: str, blob: str, ttl: float):
+        await self.redis.set(f"ephemeral:{key}", blob, ex=max(1, math.ceil(ttl)))
+
+    async def delete(self, key: str) -> bool:
+        return bool(await self.redis.delete(f"ephemeral:{key}"))
+
+class EphemeralStore:
+    """
+    History of temporary chats, keyed by user and conversation ID (a context is only ever read back
+    by the user who wrote it), in the same shape as stored histories ({id, role, msg, date}), so
+    multimodal messages keep their parts. Each context is cut to its last EPHEMERAL_MAX_MESSAGES
+    messages; one that still exceeds EPHEMERAL_MAX_BYTES on its own is not kept.
+    memory: per worker process; redis: shared by all workers (requires the redis package and REDIS_URL)
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._keeps_context: Optional[bool] = None
+
+    @property
+    def keeps_context(self) -> bool:
+        """
+        Whether contexts are kept between turns. Not with the memory backend under several workers:
+        the next turn would usually reach another worker, so clients send the whole chat each turn
+        instead of appending to a context that is not there.
+        """
+        if self._keeps_context is None:
+            self._keeps_context = settings.EPHEMERAL_BACKEND == "redis" or (settings.WEB_CONCURRENCY or 1) <= 1
+            if not self._keeps_context:
+                logger.warning(
+                    "Temporary chat context is not kept with EPHEMERAL_BACKEND=memory and %s workers, set EPHEMERAL_BACKEND=redis",
+                    settings.WEB_CONCURRENCY
+                )
+        return self._keeps_context
+
+    def usage(self) -> Tuple[int, int]:
+        """(contexts, bytes) held in this worker; zeros with the redis backend or before first use."""
+        if self._backend is None:
+            return 0, 0
+        return self._backend.entries, self._backend.bytes
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = RedisBackend() if settings.EPHEMERAL_BACKEND == "redis" else MemoryBackend()
+        return self._backend
+
+    async def get(self, user_id, conversation_id) -> Optional[List[Dict[str, Any]]]:
+        if not self.keeps_context:
+            ephemeral_lookups.inc(result="miss")
+            return None
+        try:
+            blob = await self.backend.get(f"{user_id}:{conversation_id}")
+        except Exception as e:
+            logger.warning("Temporary chat store unavailable: %s", e)
+            blob = None
+        ephemeral_lookups.inc(result="miss" if blob is None else "hit")
+        return None if blob is None else json.loads(blob)
+
+    async def put(self, user_id, conversation_id, history: List[Dict[str, Any]]):
+        if not self.keeps_context:
+            return
+        if settings.EPHEMERAL_MAX_MESSAGES > 0:
+            history = history[-settings.EPHEMERAL_MAX_MESSAGES:]
+        # ASCII-only JSON, so its length is its size in bytes
+        blob = json.dumps(history, separators=(",", ":"))
+        key = f"{user_id}:{conversation_id}"
+        try:
+            if len(blob) > settings.EPHEMERAL_MAX_BYTES:
+                ephemeral_evictions.inc(reason="oversize")
+                logger.warning("Temporary chat context too large to keep", extra={"conversation_id": str(conversation_id), "bytes": len(blob)})
+                await self.backend.delete(key)
+                return
+            await self.backend.set(key, blob, settings.EPHEMERAL_TTL_SECONDS)
+        except Exception as e:
+            # The next turn finds no context and the client resends the conversation
+            logger.warning("Temporary chat store unavailable: %s", e)
+
+    async def discard(self, user_id, conversation_id) -> bool:
+        """Forget a context; True if there was one."""
+        try:
+            return await self.backend.delete(f"{user_id}:{conversation_id}")
+        except Exception as e:
+            logger.warning("Temporary chat store unavailable: %s", e)
+            return False
+
+ephemeral_store = EphemeralStore()
+
+registry.gauge("ephemeral_conversations", "Temporary chat contexts held in this worker (memory backend)", callback=lambda: ephemeral_store.usage()[0])
+registry.gauge("ephemeral_bytes", "Bytes of temporary chat context held in this worker (memory backend)", callback=lambda: ephemeral_store.usage()[1])
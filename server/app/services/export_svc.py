@@ -0,0 +1,205 @@
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.logs import get_logger
+from app.services.audio_svc import BUCKET as AUDIO_BUCKET
+from app.services.storage_service import storage_service
+from app.services.supabase_svc import supabase_breaker, supabase_service
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID, uuid5
+import asyncio
+import json
+
+logger = get_logger(__name__)
+
+transfer_rows = registry.counter(
+    "data_transfer_rows_total", "Rows exported/imported as NDJSON, by direction (export, import, skipped, failed) and kind", ("direction", "kind")
+)
+
+EXPORT_FORMAT = "ai-assistant-export"
+EXPORT_VERSION = 1
+
+# NDJSON record type -> table, in export order (sessions refer to conversations by ID)
+TABLES = {"conversation": "conversations", "voice_session": "voice_sessions"}
+# Line numbers of invalid records listed in an import summary (all are counted)
+MAX_REPORTED_LINES = 20
+
+class InvalidImport(ValueError):
+    """The stream cannot be imported at all (single bad lines are only counted)."""
+
+class ExportService:
+    """
+    A user's conversations and voice sessions as NDJSON, one JSON object per line:
+    a header ({"type": "export", "format", "version", "exported_at"}), then {"type": "conversation", ...}
+    rows, then {"type": "voice_session", ...} rows, with the columns in EXPORT_COLUMNS.
+    Both directions stream: the export reads EXPORT_PAGE_SIZE rows at a time (keyset pages) and
+    the import inserts IMPORT_BATCH_SIZE rows at a time, so memory does not depend on how
+    much the user has.
+    Imported rows get IDs derived from the importing user and the exported ID (see `_import_id`):
+    a voice session still finds its conversation without keeping an ID map, importing into
+    another account never collides with the original rows, and importing the same file twice
+    (e.g. after an interruption) skips what is already there.
+    """
+
+    async def export_lines(self, user_id: UUID) -> AsyncIterator[bytes]:
+        header = {"type": "export", "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+                  "exported_at": datetime.now(timezone.utc).isoformat()}
+        yield _line(header)
+        for kind, table in TABLES.items():
+            after = None
+            while True:
+                rows = await asyncio.to_thread(supabase_service.export_page, table, user_id, after, settings.EXPORT_PAGE_SIZE)
+                for row in rows:
+                    yield _line({"type": kind, **row})
+                transfer_rows.inc(len(rows), direction="export", kind=kind)
+                if len(rows) < settings.EXPORT_PAGE_SIZE:
+                    break
+                after = rows[-1]["id"]
+
+    async def import_lines(self, user_id: UUID, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Insert the records of an export stream for `user_id` (whoever exported it). Rows whose ID
+        already exists are skipped; lines that are not valid records are counted and skipped, and
+        so are batches the database rejects ("failed"). Raises InvalidImport for a line longer
+        than IMPORT_MAX_LINE_BYTES.
+        """
+        summary = {kind: {"imported": 0, "skipped": 0, "failed": 0} for kind in TABLES}
+        summary["invalid_lines"] = []
+        summary["invalid"] = 0
+        batches: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in TABLES}
+        sizes = {kind: 0 for kind in TABLES}
+
+        async def flush(kind: str):
+            rows = batches[kind]
+            if not rows:
+                return
+            batches[kind], sizes[kind] = [], 0
+            try:
+                inserted = await asyncio.to_thread(supabase_service.insert_batch, TABLES[kind], rows)
+            except Exception as e:
+                if not _is_rejected(e):
+                    raise
+                # One bad row fails its whole batch (one statement); the rest of the stream goes on
+                logger.warning("Import batch rejected: %s", e, extra={"user_id": str(user_id), "kind": kind, "rows": len(rows)})
+                summary[kind]["failed"] += len(rows)
+                transfer_rows.inc(len(rows), direction="failed", kind=kind)
+                return
+            summary[kind]["imported"] += inserted
+            summary[kind]["skipped"] += len(rows) - inserted
+            transfer_rows.inc(inserted, direction="import", kind=kind)
+            transfer_rows.inc(len(rows) - inserted, direction="skipped", kind=kind)
+
+        number = 0
+        async for line in _lines(chunks, settings.IMPORT_MAX_LINE_BYTES):
+            number += 1
+            if not line.strip():
+                continue
+            kind, row = _parse(line, user_id)
+            if kind is None:
+                summary["invalid"] += 1
+                if len(summary["invalid_lines"]) < MAX_REPORTED_LINES:
+                    summary["invalid_lines"].append(number)
+                continue
+            if row is None:
+                continue # The header
+            if kind == "voice_session":
+                # Conversations are written before the sessions that follow them
+                await flush("conversation")
+            batches[kind].append(row)
+            sizes[kind] += len(line)
+            if len(batches[kind]) >= settings.IMPORT_BATCH_SIZE or sizes[kind] >= settings.IMPORT_BATCH_MAX_BYTES:
+                await flush(kind)
+        for kind in TABLES:
+            await flush(kind)
+        logger.info("Import finished", extra={"user_id": str(user_id), **{kind: summary[kind]["imported"] for kind in TABLES}, "invalid": summary["invalid"]})
+        return summary
+
+def _line(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+async def _lines(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without holding more than one line (plus a chunk) in memory."""
+    pending = bytearray()
+    async for chunk in chunks:
+        pending += chunk
+        start = 0
+        while (end := pending.find(b"\n", start)) != -1:
+            yield bytes(pending[start:end])
+            start = end + 1
+        del pending[:start]
+        if len(pending) > max_bytes:
+            raise InvalidImport(f"Line longer than {max_bytes} bytes")
+    if pending:
+        yield bytes(pending)
+
+def _uuid(value: Any) -> Optional[UUID]:
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+def _timestamp(value: Any) -> Optional[str]:
+    """`value` if it is an ISO 8601 timestamp (as exported), else None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return value
+
+def _is_rejected(error: BaseException) -> bool:
+    """The database refused the data (constraint, type), as opposed to being unreachable."""
+    from postgrest.exceptions import APIError
+    return isinstance(error, APIError) and not supabase_breaker.is_failure(error)
+
+def _import_id(user_id: UUID, exported_id: UUID) -> str:
+    return str(uuid5(user_id, str(exported_id)))
+
+INVALID = (None, None)
+
+def _parse(line: bytes, user_id: UUID) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(kind, row ready to insert for `user_id`); ("export", None) for the header, (None, None) if invalid."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return INVALID
+    if not isinstance(record, dict):
+        return INVALID
+    kind = record.get("type")
+    if kind == "export":
+        return (kind, None) if record.get("format") == EXPORT_FORMAT else INVALID
+    exported_id = _uuid(record.get("id"))
+    if exported_id is None:
+        return INVALID
+    row: Dict[str, Any] = {"id": _import_id(user_id, exported_id), "user_id": str(user_id)}
+    if kind == "conversation":
+        if not isinstance(record.get("title"), str) or not isinstance(record.get("history", []), list):
+            return INVALID
+        row.update(title=record["title"], history=record.get("history", []))
+        for column in ("created_at", "updated_at"):
+            if record.get(column):
+                row[column] = _timestamp(record[column])
+                if row[column] is None:
+                    return INVALID
+    elif kind == "voice_session":
+        if not isinstance(record.get("transcript", []), list):
+            return INVALID
+        conversation_id = _uuid(record.get("conversation_id"))
+        row.update(
+            # Standalone sessions and legacy text IDs keep theirs
+            conversation_id=_import_id(user_id, conversation_id) if conversation_id else record.get("conversation_id"),
+            transcript=record.get("transcript", []),
+            # The server fetches session audio for playback: only this project's stored audio is
+            # taken from a file, and the variant metadata (with its own URL) is never imported
+            audio_url=record.get("audio_url") if storage_service.object_path(record.get("audio_url"), AUDIO_BUCKET) else None,
+        )
+        if record.get("created_at"):
+            row["created_at"] = _timestamp(record["created_at"])
+            if row["created_at"] is None:
+                return INVALID
+    else:
+        return INVALID
+    return kind, row
+
+export_service = ExportService()
@@ -0,0 +1,157 @@
+from app.core.config import settings
+from app.core.metrics import registry
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import io
+import multiprocessing
+
+image_processing_duration = registry.histogram(
+    "image_processing_seconds", "Time to validate, resize and re-encode an uploaded image (queueing included)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+image_bytes_saved = registry.counter(
+    "image_bytes_saved_total", "Bytes removed from uploaded images by resizing/re-encoding"
+)
+
+# Formats OpenAI accepts as image input (GIFs are reduced to their first frame)
+ACCEPTED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+OUTPUT_TYPES = {"webp": ("WEBP", "image/webp", "webp"), "jpeg": ("JPEG", "image/jpeg", "jpg")}
+
+class InvalidImage(ValueError):
+    """Upload is not an image we accept (unknown format, corrupt, or too many pixels)."""
+
+def target_size(width: int, height: int, max_long: int, max_short: int) -> Tuple[int, int]:
+    """
+    Largest size within max_long x max_short that keeps the aspect ratio. With the defaults
+    (2048/768) this is what OpenAI scales images to for high detail anyway, so larger
+    uploads only cost bandwidth and storage.
+    """
+    long_side, short_side = max(width, height), min(width, height)
+    scale = min(1.0, max_long / long_side, max_short / short_side)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def process_image(data: bytes, max_long: int, max_short: int, output: str, quality: int, max_pixels: int) -> Dict[str, Any]:
+    """
+    Validate, orient, downsize and re-encode an image. Runs in a worker process:
+    everything it needs comes in as arguments and Pillow is only imported there.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data)) # Lazy: reads the header only
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage("Unsupported or corrupt image") from e
+    if image.format not in ACCEPTED_FORMATS:
+        raise InvalidImage(f"Unsupported image format: {image.format}")
+    if image.width * image.height > max_pixels:
+        raise InvalidImage(f"Image too large ({image.width}x{image.height})")
+
+    source_format = image.format
+    size = target_size(image.width, image.height, max_long, max_short)
+    # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which is much cheaper than decoding full size
+    image.draft("RGB", size)
+    try:
+        image = ImageOps.exif_transpose(image) # Phones store rotation in EXIF; the model ignores it
+    except Exception as e:
+        raise InvalidImage("Unsupported or corrupt image") from e
+    size = target_size(image.width, image.height, max_long, max_short)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    pil_format, content_type, extension = OUTPUT_TYPES[output]
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if pil_format == "JPEG" or not has_alpha:
+        if has_alpha:
+            # JPEG has no alpha channel: flatten onto white rather than black
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+    else:
+        image = image.convert("RGBA")
+
+    out = io.BytesIO()
+    if pil_format == "JPEG":
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, "WEBP", quality=quality, method=4)
+    encoded = out.getvalue()
+    return {
+        "data": encoded,
+        "content_type": content_type,
+        "extension": extension,
+        "width": image.width,
+        "height": image.height,
+        "source_format": source_format,
+        "sha256": hashlib.sha256(encoded).hexdigest(),
+    }
+
+class ImageService:
+    """
+    Upload-time image pipeline (see `process_image`). Decoding and resizing are CPU bound,
+    so they run in a process pool of IMAGE_PROCESS_WORKERS processes per API worker
+    (0 = a thread, for small deployments) instead of on the event loop.
+    """
+
+    def __init__(self):
+        self._pool: Optional[Executor] = None
+
+    def _executor(self) -> Optional[Executor]:
+        if self._pool is None and settings.IMAGE_PROCESS_WORKERS > 0:
+            # spawn, not fork: forking a process with a running event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def process(self, data: bytes) -> Dict[str, Any]:
+        """Returns the re-encoded image and its metadata; raises InvalidImage for bad input."""
+        loop = asyncio.get_running_loop()
+        args = (
+            data,
+            settings.IMAGE_MAX_LONG_SIDE,
+            settings.IMAGE_MAX_SHORT_SIDE,
+            settings.IMAGE_OUTPUT_FORMAT,
+            settings.IMAGE_QUALITY,
+            settings.IMAGE_MAX_PIXELS,
+        )
+        started = loop.time()
+        executor = self._executor()
+        if executor is None:
+            result = await asyncio.to_thread(process_image, *args)
+        else:
+            result = await loop.run_in_executor(executor, process_image, *args)
+        image_processing_duration.observe(loop.time() - started)
+        image_bytes_saved.inc(max(len(data) - len(result["data"]), 0))
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+def to_openai_content(content: Any) -> Any:
+    """
+    Message content as OpenAI expects it: text stays a string; multimodal lists keep only
+    text and image parts, with the configured image detail level.
+    """
+    if not isinstance(content, list):
+        return content if isinstance(content, str) else str(content or "")
+    parts: List[Dict[str, Any]] = []
+    for part in content:
+        if not isinstance(part, dict):
+            continue
+        if part.get("type") == "text":
+            parts.append({"type": "text", "text": part.get("text", "")})
+        elif part.get("type") == "image_url":
+            image = part.get("image_url") or {}
+            url = image.get("url") if isinstance(image, dict) else image
+            if url:
+                parts.append({"type": "image_url", "image_url": {"url": url, "detail": settings.IMAGE_DETAIL}})
+    return parts
+
+image_service = ImageService()
@@ -0,0 +1,153 @@
+from app.core.config import settings
+from app.core.sse import StreamEvent
+from app.core.scheduler import Priority, estimate_tokens
+from app.core.metrics import registry
+from app.core.logs import get_logger
+from app.models.chat import ChatMessage
+from app.services.openai_svc import openai_service
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+import asyncio
+
+logger = get_logger(__name__)
+
+chat_model_decisions = registry.counter(
+    "chat_model_decisions_total", "Models launched per chat turn and why (requested, default, small_prompt, hedge, fallback)", ("model", "reason")
+)
+chat_model_served = registry.counter(
+    "chat_model_served_total", "Chat turns answered, by the model that won", ("model",)
+)
+
+class ModelRouter:
+    """
+    Picks the model for a chat turn and runs it with failover:
+    - an explicitly requested model is honored; otherwise short, text-only prompts go to
+      CHAT_MODEL_SMALL (if configured) and everything else to CHAT_MODEL_DEFAULT
+    - if no event arrives within CHAT_HEDGE_AFTER_MS, the fallback model is started too
+      and whichever answers first wins; the other stream is cancelled
+    - if the model fails or stays silent past CHAT_FIRST_TOKEN_TIMEOUT_MS before its first
+      event, the fallback model takes over
+    Both timers start once the OpenAI scheduler admits the call, so time queued for capacity
+    never sends more calls into the same queue. A model running tools is neither hedged nor
+    timed out (its first event comes after the tools, which must not run twice).
+    Once an event has been streamed the turn is committed to that model.
+    """
+
+    def route(self, messages: List[ChatMessage], requested: Optional[str] = None) -> Tuple[str, str]:
+        """Returns (model, reason)."""
+        if requested:
+            return requested, "requested"
+        if settings.CHAT_MODEL_SMALL and self._is_simple(messages):
+            return settings.CHAT_MODEL_SMALL, "small_prompt"
+        return settings.CHAT_MODEL_DEFAULT, "default"
+
+    def _is_simple(self, messages: List[ChatMessage]) -> bool:
+        last = messages[-1].content if messages else ""
+        if not isinstance(last, str) or "```" in last:
+            # Images or code: leave them to the default model
+            return False
+        return estimate_tokens([{"content": m.content} for m in messages]) <= settings.CHAT_SMALL_MAX_PROMPT_TOKENS
+
+    async def stream_chat(self, messages: List[ChatMessage], requested: Optional[str] = None, system_prompt: str = None, priority: Priority = Priority.INTERACTIVE) -> AsyncGenerator[StreamEvent, None]:
+        model, reason = self.route(messages, requested)
+        fallback = settings.CHAT_FALLBACK_MODEL if settings.CHAT_FALLBACK_MODEL != model else None
+        loop = asyncio.get_running_loop()
+        timeout = settings.CHAT_FIRST_TOKEN_TIMEOUT_MS / 1000
+        hedge_after = settings.CHAT_HEDGE_AFTER_MS / 1000 if settings.CHAT_HEDGE_AFTER_MS > 0 else None
+        hedge_at = None
+
+        # Each contender is a stream waiting for its first event: task -> (model, generator, deadline).
+        # The deadline is set when the scheduler admits the call; until then it is unbounded.
+        contenders: Dict[asyncio.Future, Tuple[str, AsyncGenerator, float]] = {}
+        last_error: Optional[BaseException] = None
+        # Set when a contender's timers change (admitted, running tools), to wake the wait below
+        changed = asyncio.Event()
+
+        def launch(name: str, why: str):
+            def on_phase(phase: str):
+                nonlocal hedge_at
+                if task not in contenders:
+                    return
+                if phase == "admitted":
+                    contenders[task] = (name, generator, loop.time() + timeout if timeout > 0 else float("inf"))
+                    if fallback and hedge_after is not None:
+                        hedge_at = loop.time() + hedge_after
+                elif phase == "tools":
+                    contenders[task] = (name, generator, float("inf"))
+                    hedge_at = None
+                changed.set()
+
+            generator = openai_service.stream_chat(messages, model=name, system_prompt=system_prompt, priority=priority, on_phase=on_phase)
+            task = asyncio.ensure_future(generator.__anext__())
+            contenders[task] = (name, generator, float("inf"))
+            chat_model_decisions.inc(model=name, reason=why)
+
+        def take_fallback(why: str):
+            nonlocal fallback
+            if fallback:
+                name, fallback = fallback, None
+                logger.warning("Switching chat model to %s (%s)", name, why)
+                launch(name, why)
+
+        launch(model, reason)
+        winner = None
+        try:
+            while winner is None:
+                changed.clear()
+                wake = min([deadline for _, _, deadline in contenders.values()] + ([hedge_at] if hedge_at else []))
+                wait = max(wake - loop.time(), 0) if wake != float("inf") else None
+                waker = asyncio.ensure_future(changed.wait())
+                try:
+                    done, _ = await asyncio.wait([*contenders, waker], timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waker.cancel()
+                done.discard(waker)
+
+                for task in done:
+                    name, generator, _ = contenders.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = (task, name, generator)
+                        break
+                    logger.warning("Chat model %s failed before its first event: %s", name, error)
+                    last_error = error
+                    await generator.aclose()
+                    take_fallback("fallback_error")
+                if winner is not None:
+                    break
+
+                now = loop.time()
+                for task, (name, generator, deadline) in list(contenders.items()):
+                    if now >= deadline:
+                        contenders.pop(task)
+                        await self._cancel(task, generator)
+                        last_error = asyncio.TimeoutError(f"No response from {name} within {timeout:.1f}s")
+                        take_fallback("fallback_timeout")
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    take_fallback("hedge")
+                if not contenders:
+                    raise last_error
+        finally:
+            # Losers (or everything, if we are being cancelled) stop here and release their upstream streams
+            for task, (_, generator, _) in contenders.items():
+                await self._cancel(task, generator)
+
+        task, name, generator = winner
+        chat_model_served.inc(model=name)
+        if isinstance(task.exception(), StopAsyncIteration):
+            return
+        try:
+            yield task.result()
+            async for event in generator:
+                yield event
+        finally:
+            await generator.aclose()
+
+    async def _cancel(self, task: asyncio.Future, generator: AsyncGenerator):
+        task.cancel()
+        await asyncio.wait([task])
+        if not task.cancelled():
+            task.exception() # Retrieve it so it is not reported as never retrieved
+        await generator.aclose()
+
+model_router = ModelRouter()
@@ -1,16 +1,33 @@
-from openai import OpenAI
 from app.core.config import settings
+from app.core.clients import get_openai_client
 from app.models.chat import ChatMessage
 from app.services.tools_svc import tools_service
-from typing import List, AsyncGenerator
+from app.core.sse import StreamEvent
+from app.core.metrics import chat_time_to_first_token, chat_stream_duration, chat_tokens_per_second
+from app.core.tracing import start_span
+from app.core.scheduler import Priority, estimate_tokens, openai_scheduler
+from app.core.logs import get_logger
+from typing import Callable, List, AsyncGenerator, Optional
 import json
 import asyncio
+import time
+
+logger = get_logger(__name__)
 
 class OpenAIService:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    @property
+    def client(self):
+        return get_openai_client()
 
-    async def stream_chat(self, messages: List[ChatMessage], model: str = "gpt-4o-mini", system_prompt: str = None) -> AsyncGenerator[str, None]:
+    async def stream_chat(self, messages: List[ChatMessage], model: str = "gpt-4o-mini", system_prompt: str = None, priority: Priority = Priority.INTERACTIVE,
+                          on_phase: Optional[Callable[[str], None]] = None) -> AsyncGenerator[StreamEvent, None]:
+        """
+        Stream a chat completion as structured events:
+        {"content": "..."} for each text delta and {"tool_used": True} once tools ran.
+        SSE framing is left to the caller (see app.core.sse).
+        Admission goes through the OpenAI scheduler; `priority` orders waiting requests.
+        `on_phase` is told "admitted" once the scheduler grants the call and "tools" before tools run.
+        """
         conversation_input = []
         
         if system_prompt:
@@ -29,111 +46,172 @@ class OpenAIService:
         # Get available tools
         tools = tools_service.get_tool_definitions()
         
-        # Initial call
-        stream = self.client.chat.completions.create(
-            model=model,
-            messages=conversation_input,
-            tools=tools if tools else None,
-            tool_choice="auto" if tools else None,
-            stream=True,
-        )
+        # Stream metrics: one observation per phase, only a counter increment per token
+        started_at = time.perf_counter()
+        first_token_at = None
+        token_count = 0
+        # Phases are separate spans (not activated) because the context may change between yields
+        trace_root = start_span("openai.stream_chat", attributes={"model": model, "messages": len(conversation_input), "priority": priority.name.lower()})
+        phase = None
+        usage_tokens = 0
+        open_streams = []
+
+        try:
+            # Admission control: waits here when OpenAI capacity (concurrency / token budget) is exhausted
+            estimated = estimate_tokens(conversation_input) + settings.OPENAI_COMPLETION_TOKENS_ESTIMATE
+            async with openai_scheduler.slot(priority, estimated) as ticket:
+                if on_phase is not None:
+                    on_phase("admitted")
+                phase = start_span("openai.first_chunk", parent=trace_root)
+                # Initial call (retried with backoff on 429/5xx before any token was streamed)
+                stream = await ticket.call(lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=conversation_input,
+                    tools=tools if tools else None,
+                    tool_choice="auto" if tools else None,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ))
+                open_streams.append(stream)
 
-        tool_calls = []
-        full_response_content = ""
+                tool_calls = []
+                content_parts = []
 
-        # Process the stream
-        for chunk in stream:
-            if not chunk.choices:
-                continue
+                # Process the stream
+                async for chunk in stream:
+                    if phase is not None:
+                        phase.end()
+                        phase = None
+                    if chunk.usage:
+                        usage_tokens += chunk.usage.total_tokens
+                    if not chunk.choices:
+                        continue
                 
-            delta = chunk.choices[0].delta
+                    delta = chunk.choices[0].delta
             
-            if delta.tool_calls:
-                for tc in delta.tool_calls:
-                    if len(tool_calls) <= tc.index:
-                        tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                    if delta.tool_calls:
+                        for tc in delta.tool_calls:
+                            if len(tool_calls) <= tc.index:
+                                tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
                     
-                    tool_call = tool_calls[tc.index]
+                            tool_call = tool_calls[tc.index]
                     
-                    if tc.id:
-                        tool_call["id"] = tc.id
-                    if tc.function:
-                        if tc.function.name:
-                            tool_call["function"]["name"] = tc.function.name
-                        if tc.function.arguments:
-                            tool_call["function"]["arguments"] += tc.function.arguments
+                            if tc.id:
+                                tool_call["id"] = tc.id
+                            if tc.function:
+                                if tc.function.name:
+                                    tool_call["function"]["name"] = tc.function.name
+                                if tc.function.arguments:
+                                    tool_call["function"]["arguments"] += tc.function.arguments
 
-            if delta.content:
-                content = delta.content
-                full_response_content += content
-                yield f"data: {json.dumps({'content': content})}\n\n"
+                    if delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            chat_time_to_first_token.observe(first_token_at - started_at, model=model)
+                        token_count += 1
+                        content_parts.append(delta.content)
+                        yield {"content": delta.content}
 
-        # If we had tool calls, we need to execute them and call again
-        if tool_calls:
-             print(f"DEBUG: Tool calls detected: {len(tool_calls)}")
+                # If we had tool calls, we need to execute them and call again
+                if tool_calls:
+                     logger.debug("Tool calls detected", extra={"tool_calls": len(tool_calls)})
              
-             # Add the assistant's message with tool calls to history
-             # OpenAI expects the assistant message to have tool_calls field.
-             # Note: content cannot be empty string if tool_calls is present? 
-             # OpenAI API allows content=None if tool_calls is present.
-             assistant_msg = {
-                 "role": "assistant",
-                 "content": full_response_content if full_response_content else None,
-                 "tool_calls": tool_calls
-             }
-             conversation_input.append(assistant_msg)
+                     # Add the assistant's message with tool calls to history
+                     # OpenAI expects the assistant message to have tool_calls field.
+                     # Note: content cannot be empty string if tool_calls is present? 
+                     # OpenAI API allows content=None if tool_calls is present.
+                     full_response_content = "".join(content_parts)
+                     assistant_msg = {
+                         "role": "assistant",
+                         "content": full_response_content if full_response_content else None,
+                         "tool_calls": tool_calls
+                     }
+                     conversation_input.append(assistant_msg)
+                     if on_phase is not None:
+                         on_phase("tools")
              
-             # Execute each tool
-             for tool_call in tool_calls:
-                 function_name = tool_call["function"]["name"]
-                 arguments_str = tool_call["function"]["arguments"]
-                 tool_result_content = ""
-                 tool_call_id = tool_call["id"]
+                     # Execute each tool
+                     for tool_call in tool_calls:
+                         function_name = tool_call["function"]["name"]
+                         arguments_str = tool_call["function"]["arguments"]
+                         tool_result_content = ""
+                         tool_call_id = tool_call["id"]
+                         tool_span = start_span("openai.tool", parent=trace_root, attributes={"tool": function_name})
                  
-                 try:
-                     # Parse arguments
-                     if not arguments_str:
-                         arguments = {}
-                     else:
-                         arguments = json.loads(arguments_str)
+                         try:
+                             # Parse arguments
+                             if not arguments_str:
+                                 arguments = {}
+                             else:
+                                 arguments = json.loads(arguments_str)
                      
-                     print(f"Executing tool: {function_name} with args: {arguments}")
+                             logger.info("Executing tool %s", function_name, extra={"arguments": arguments})
                      
-                     # Execute tool via service
-                     result = await tools_service.execute_tool(function_name, arguments)
+                             # Execute tool via service
+                             result = await tools_service.execute_tool(function_name, arguments)
                      
-                     # Ensure result is string
-                     if isinstance(result, str):
-                         tool_result_content = result
-                     else:
-                         tool_result_content = json.dumps(result)
+                             # Ensure result is string
+                             if isinstance(result, str):
+                                 tool_result_content = result
+                             else:
+                                 tool_result_content = json.dumps(result)
                          
-                 except Exception as e:
-                     print(f"Error executing tool {function_name}: {e}")
-                     tool_result_content = json.dumps({"error": str(e)})
+                         except Exception as e:
+                             logger.error("Error executing tool %s: %s", function_name, e)
+                             tool_span.record_exception(e)
+                             tool_result_content = json.dumps({"error": str(e)})
+                         finally:
+                             tool_span.end()
 
-                 conversation_input.append({
-                     "tool_call_id": tool_call_id,
-                     "role": "tool",
-                     "name": function_name,
-                     "content": tool_result_content
-                 })
+                         conversation_input.append({
+                             "tool_call_id": tool_call_id,
+                             "role": "tool",
+                             "name": function_name,
+                             "content": tool_result_content
+                         })
              
-             # Signal that tools were used so frontend can show badge
-             yield f"data: {json.dumps({'tool_used': True})}\n\n"
+                     # Signal that tools were used so frontend can show badge
+                     yield {"tool_used": True}
 
-             # Second call to OpenAI with tool outputs
-             stream_2 = self.client.chat.completions.create(
-                model=model,
-                messages=conversation_input,
-                stream=True
-             )
+                     # Second call to OpenAI with tool outputs
+                     phase = start_span("openai.tool_followup", parent=trace_root)
+                     stream_2 = await ticket.call(lambda: self.client.chat.completions.create(
+                        model=model,
+                        messages=conversation_input,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                     ))
+                     open_streams.append(stream_2)
              
-             for chunk in stream_2:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content_2 = chunk.choices[0].delta.content
-                    yield f"data: {json.dumps({'content': content_2})}\n\n"
+                     async for chunk in stream_2:
+                        if phase is not None:
+                            phase.end()
+                            phase = None
+                        if chunk.usage:
+                            usage_tokens += chunk.usage.total_tokens
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                chat_time_to_first_token.observe(first_token_at - started_at, model=model)
+                            token_count += 1
+                            yield {"content": chunk.choices[0].delta.content}
 
-        yield "data: [DONE]\n\n"
+                # Settle the budget with the real usage (estimated if the API did not report it)
+                ticket.record_usage(usage_tokens or estimate_tokens(conversation_input) + token_count)
+        except BaseException as e:
+            trace_root.record_exception(e)
+            raise
+        finally:
+            # Release the HTTP connections if the stream was abandoned before the end
+            for open_stream in open_streams:
+                await open_stream.close()
+            if phase is not None:
+                phase.end()
+            trace_root.set_attribute("tokens", token_count)
+            trace_root.end()
+            finished_at = time.perf_counter()
+            chat_stream_duration.observe(finished_at - started_at, model=model)
+            if first_token_at is not None and token_count > 1 and finished_at > first_token_at:
+                chat_tokens_per_second.observe(token_count / (finished_at - first_token_at), model=model)
 
 openai_service = OpenAIService()
@@ -0,0 +1,200 @@
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.logs import get_logger
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import base64
+import json
+import math
+import time
+
+logger = get_logger(__name__)
+
+post_call_webhooks = registry.counter(
+    "voice_webhooks_total", "ElevenLabs post-call webhooks received, by type and result", ("type", "result")
+)
+post_call_wait = registry.histogram(
+    "voice_webhook_wait_seconds", "Time a session processor waited for post-call data, by outcome", ("outcome",),
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+class StagedCall:
+    """What has arrived so far for one ElevenLabs conversation."""
+
+    def __init__(self):
+        self.audio: Optional[bytes] = None
+        self.transcript: Optional[List[Dict[str, Any]]] = None
+        self.received_at = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return len(self.audio or b"")
+
+class MemoryStaging:
+    """
+    Bounded in-process staging of post-call data pushed by ElevenLabs webhooks (audio and
+    transcript), keyed by ElevenLabs conversation ID. Session processors wait on it and are
+    woken as soon as the data they need arrives, instead of polling.
+    Limits: VOICE_STAGING_MAX_CALLS entries, VOICE_STAGING_MAX_BYTES of audio and
+    VOICE_STAGING_TTL_SECONDS per entry; the oldest entries are evicted first.
+    Staging is per worker process: only a processor on the worker that got the webhook sees it.
+    """
+
+    def __init__(self):
+        self._calls: "OrderedDict[str, StagedCall]" = OrderedDict()
+        self._bytes = 0
+        self._changed: Optional[asyncio.Condition] = None
+
+    @property
+    def changed(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running loop
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _entry(self, conversation_id: str) -> StagedCall:
+        call = self._calls.get(conversation_id)
+        if call is None:
+            call = self._calls[conversation_id] = StagedCall()
+        return call
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._calls:
+            conversation_id, oldest = next(iter(self._calls.items()))
+            expired = now - oldest.received_at > settings.VOICE_STAGING_TTL_SECONDS
+            if not expired and len(self._calls) <= settings.VOICE_STAGING_MAX_CALLS and self._bytes <= settings.VOICE_STAGING_MAX_BYTES:
+                return
+            self._remove(conversation_id)
+            if not expired:
+                logger.warning("Voice staging full, dropped post-call data", extra={"conversation_id": conversation_id})
+
+    def _remove(self, conversation_id: str) -> Optional[StagedCall]:
+        call = self._calls.pop(conversation_id, None)
+        if call is not None:
+            self._bytes -= call.size
+        return call
+
+    async def put(self, conversation_id: str, audio: Optional[bytes] = None, transcript: Optional[List[Dict[str, Any]]] = None):
+        """Stage audio and/or transcript and wake the processors waiting for them."""
+        call = self._entry(conversation_id)
+        if audio is not None:
+            self._bytes += len(audio) - call.size
+            call.audio = audio
+        if transcript is not None:
+            call.transcript = transcript
+        self._evict()
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def wait(self, conversation_id: str, timeout: float) -> Tuple[Optional[bytes], Optional[List[Dict[str, Any]]]]:
+        """
+        Wait up to `timeout` seconds for both audio and transcript, then hand over (and unstage)
+        whatever arrived: (audio, transcript), either of which may be None.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        def complete() -> bool:
+            call = self._calls.get(conversation_id)
+            return call is not None and call.audio is not None and call.transcript is not None
+
+        outcome = "complete"
+        try:
+            if not complete():
+                async with self.changed:
+                    await asyncio.wait_for(self.changed.wait_for(complete), timeout)
+        except asyncio.TimeoutError:
+            outcome = "partial" if conversation_id in self._calls else "missing"
+        post_call_wait.observe(loop.time() - started, outcome=outcome)
+
+        call = self._remove(conversation_id)
+        if call is None:
+            return None, None
+        return call.audio, call.transcript
+
+class RedisStaging:
+    """
+    Post-call staging shared by all workers, so the webhook and the session processor need not
+    land on the same one: audio (base64) and transcript (JSON) are kept under voice:staged:<id>
+    for VOICE_STAGING_TTL_SECONDS, and every put is announced on a pub/sub channel of the same
+    name to wake the processor waiting for it.
+    """
+
+    def __init__(self):
+        from app.core.clients import get_redis_client
+        self.redis = get_redis_client()
+
+    async def put(self, conversation_id: str, audio: Optional[bytes] = None, transcript: Optional[List[Dict[str, Any]]] = None):
+        key = f"voice:staged:{conversation_id}"
+        ttl = max(1, math.ceil(settings.VOICE_STAGING_TTL_SECONDS))
+        if audio is not None:
+            # The shared client decodes responses as text
+            await self.redis.set(f"{key}:audio", base64.b64encode(audio).decode(), ex=ttl)
+        if transcript is not None:
+            await self.redis.set(f"{key}:transcript", json.dumps(transcript), ex=ttl)
+        await self.redis.publish(key, "staged")
+
+    async def wait(self, conversation_id: str, timeout: float) -> Tuple[Optional[bytes], Optional[List[Dict[str, Any]]]]:
+        """Same contract as MemoryStaging.wait."""
+        key = f"voice:staged:{conversation_id}"
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        pubsub = self.redis.pubsub()
+        try:
+            # Subscribed before the first check, so a put in between is not missed
+            await pubsub.subscribe(key)
+            staged = await self.redis.exists(f"{key}:audio", f"{key}:transcript")
+            while staged < 2:
+                remaining = started + timeout - loop.time()
+                if remaining <= 0:
+                    break
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+                staged = await self.redis.exists(f"{key}:audio", f"{key}:transcript")
+        finally:
+            await pubsub.aclose()
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(f"{key}:audio").get(f"{key}:transcript").delete(f"{key}:audio", f"{key}:transcript")
+            audio, transcript, _ = await pipe.execute()
+        outcome = "complete" if audio and transcript else "partial" if audio or transcript else "missing"
+        post_call_wait.observe(loop.time() - started, outcome=outcome)
+        return (base64.b64decode(audio) if audio else None), (json.loads(transcript) if transcript else None)
+
+class PostCallStaging:
+    """
+    Where post-call webhooks leave their data for the session processors (VOICE_STAGING_BACKEND).
+    memory: per worker; with several workers the webhook usually reaches another worker than the
+    processor, so processors do not wait for it and fall back to the ElevenLabs API straight away.
+    redis: shared by all workers (requires the redis package and REDIS_URL).
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = RedisStaging() if settings.VOICE_STAGING_BACKEND == "redis" else MemoryStaging()
+        return self._backend
+
+    def usage(self) -> Tuple[int, int]:
+        """(calls, audio bytes) staged in this worker; zeros with the redis backend or before first use."""
+        if not isinstance(self._backend, MemoryStaging):
+            return 0, 0
+        return len(self._backend._calls), self._backend._bytes
+
+    async def put(self, conversation_id: str, audio: Optional[bytes] = None, transcript: Optional[List[Dict[str, Any]]] = None):
+        await self.backend.put(conversation_id, audio=audio, transcript=transcript)
+
+    async def wait(self, conversation_id: str, timeout: float) -> Tuple[Optional[bytes], Optional[List[Dict[str, Any]]]]:
+        if isinstance(self.backend, MemoryStaging) and (settings.WEB_CONCURRENCY or 1) > 1:
+            # Waiting here would mostly mean waiting for data staged on another worker
+            timeout = 0
+        return await self.backend.wait(conversation_id, timeout)
+
+post_call_staging = PostCallStaging()
+
+registry.gauge("voice_staging_calls", "Conversations with post-call data waiting to be processed", callback=lambda: post_call_staging.usage()[0])
+registry.gauge("voice_staging_bytes", "Audio bytes held in the post-call staging area", callback=lambda: post_call_staging.usage()[1])
@@ -1,35 +1,204 @@
-from supabase import create_client, Client
 from app.core.config import settings
-import uuid
-from typing import Optional
+from app.core.breaker import guarded
+from app.core.clients import get_supabase_client
+from app.core.metrics import registry
+from app.core.tracing import traced
+from app.services.supabase_svc import supabase_breaker
+from app.core.logs import get_logger
+from typing import Any, BinaryIO, Dict, Optional, Union
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import unquote, urlsplit
+
+logger = get_logger(__name__)
+
+# Object paths this service writes (objects/<xx>/<sha256>.<ext>) and older flat file names
+OBJECT_PATH = re.compile(r"[A-Za-z0-9_.\-/]+")
+
+storage_uploads = registry.counter(
+    "storage_uploads_total", "Stored files, by result (uploaded, deduplicated)", ("result",)
+)
+storage_bytes_deduplicated = registry.counter(
+    "storage_bytes_deduplicated_total", "Bytes not transferred to storage because the content was already there"
+)
+
+class BlobIndex:
+    """
+    Local SQLite index of what is already in storage: (bucket, key) -> public URL and metadata.
+    The key is a SHA-256 (of the stored bytes, or of the original upload for processed images).
+    One file is shared by every worker on the machine (WAL mode); other machines simply miss
+    and upload again, which is harmless because paths are content-addressed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " bucket TEXT NOT NULL, key TEXT NOT NULL, sha256 TEXT NOT NULL, url TEXT NOT NULL, path TEXT NOT NULL,"
+                " size INTEGER NOT NULL, content_type TEXT, meta TEXT, created_at REAL NOT NULL,"
+                " PRIMARY KEY (bucket, key))"
+            )
+            self._ready = True
+        return connection
+
+    def get(self, bucket: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT sha256, url, path, size, content_type, meta FROM blobs WHERE bucket = ? AND key = ?", (bucket, key)
+            ).fetchone()
+        if row is None:
+            return None
+        sha256, url, path, size, content_type, meta = row
+        return {"sha256": sha256, "url": url, "path": path, "size": size, "content_type": content_type, "meta": json.loads(meta or "{}")}
+
+    def delete_sha256(self, bucket: str, sha256: str):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM blobs WHERE bucket = ? AND sha256 = ?", (bucket, sha256))
+
+    def put(self, bucket: str, key: str, sha256: str, url: str, path: str, size: int, content_type: str, meta: Dict[str, Any]):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (bucket, key, sha256, url, path, size, content_type, json.dumps(meta), time.time())
+            )
 
 class StorageService:
+    """
+    Content-addressed storage on Supabase: objects live at objects/<sha256[:2]>/<sha256>.<ext>,
+    so the same bytes always map to the same object. Uploads already in the local index
+    (STORAGE_INDEX_PATH) return the existing URL without transferring anything.
+    """
+
     def __init__(self):
-        self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
         self.bucket = "chat-assets" # Make sure this bucket exists in Supabase
+        self.index = BlobIndex(settings.STORAGE_INDEX_PATH) if settings.STORAGE_INDEX_PATH else None
+
+    @property
+    def client(self):
+        # Same client as SupabaseService, constructed on first use
+        return get_supabase_client()
+
+    def object_path(self, url: Optional[str], bucket_name: Optional[str] = None) -> Optional[str]:
+        """
+        Path inside the bucket of a public URL of this project's storage, or None for anything else
+        (another host or bucket, a traversal, a query). URLs read back from rows are only fetched
+        through this check, so a stored URL can never point the server somewhere else.
+        """
+        if not url or not settings.SUPABASE_URL:
+            return None
+        base = urlsplit(f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{bucket_name or self.bucket}/")
+        parts = urlsplit(url)
+        if (parts.scheme, parts.netloc.lower()) != (base.scheme, base.netloc.lower()) or parts.query.strip("?") or parts.fragment:
+            return None
+        if not parts.path.startswith(base.path):
+            return None
+        path = unquote(parts.path[len(base.path):])
+        if not OBJECT_PATH.fullmatch(path) or any(segment in ("", ".", "..") for segment in path.split("/")):
+            return None
+        return path
+
+    async def lookup(self, key: str, bucket_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Already stored content for `key` (a SHA-256 hex digest), in the shape returned by `store`,
+        or None if it has not been stored from this machine.
+        """
+        if self.index is None:
+            return None
+        try:
+            existing = await asyncio.to_thread(self.index.get, bucket_name or self.bucket, key)
+        except sqlite3.Error as e:
+            # The index is an optimization: without it every upload goes to storage
+            logger.warning("Storage index unavailable: %s", e)
+            return None
+        if existing is None:
+            return None
+        storage_uploads.inc(result="deduplicated")
+        storage_bytes_deduplicated.inc(existing["size"])
+        return {"url": existing["url"], "sha256": existing["sha256"], "size": existing["size"], "deduplicated": True, "meta": existing["meta"]}
 
-    async def upload_file(self, file_content: bytes, file_name: str, content_type: str, bucket_name: Optional[str] = None, use_original_name: bool = False) -> str:
+    @traced("storage.store")
+    async def store(self, data: Union[bytes, BinaryIO], content_type: str, extension: str, bucket_name: Optional[str] = None,
+                    key: Optional[str] = None, meta: Optional[Dict[str, Any]] = None, sha256: Optional[str] = None) -> Dict[str, Any]:
         """
-        Uploads a file to Supabase Storage and returns the public URL.
+        Store `data` under its SHA-256 and return {"url", "sha256", "size", "deduplicated", "meta"}.
+        `sha256` can be passed when it was already computed (e.g. while reading the upload); it is
+        required when `data` is an unbuffered file (FileIO at position 0), which is streamed to storage.
+        `key` is what the index is keyed by (defaults to the SHA-256 of `data`); callers that
+        transform uploads pass the hash of the original so repeated uploads skip the transform too.
         """
-        target_bucket = bucket_name if bucket_name else self.bucket
-        
-        if use_original_name:
-            path = f"uploads/{file_name}"
+        bucket = bucket_name or self.bucket
+        if isinstance(data, bytes):
+            sha256 = sha256 or hashlib.sha256(data).hexdigest()
+            size = len(data)
+        elif sha256 is None:
+            raise ValueError("sha256 is required to store a file")
         else:
-            file_ext = file_name.split(".")[-1] if "." in file_name else "bin"
-            unique_name = f"{uuid.uuid4()}.{file_ext}"
-            path = f"uploads/{unique_name}"
+            size = os.fstat(data.fileno()).st_size
+        key = key or sha256
+
+        existing = await self.lookup(key, bucket)
+        if existing is not None:
+            return existing
 
-        response = self.client.storage.from_(target_bucket).upload(
+        path = f"objects/{sha256[:2]}/{sha256}.{extension}"
+        url = await asyncio.to_thread(self._upload, bucket, path, data, content_type)
+        storage_uploads.inc(result="uploaded")
+        if self.index is not None:
+            try:
+                await asyncio.to_thread(self.index.put, bucket, key, sha256, url, path, size, content_type, meta or {})
+            except sqlite3.Error as e:
+                logger.warning("Could not index stored object: %s", e)
+        return {"url": url, "sha256": sha256, "size": size, "deduplicated": False, "meta": meta or {}}
+
+    @guarded(supabase_breaker)
+    def _upload(self, bucket: str, path: str, data: Union[bytes, BinaryIO], content_type: str) -> str:
+        storage = self.client.storage.from_(bucket)
+        # upsert: a concurrent or unindexed upload of the same content rewrites identical bytes instead of failing.
+        # The content at a path never changes, so it can be cached forever.
+        storage.upload(
             path=path,
-            file=file_content,
-            file_options={"content-type": content_type}
+            file=data,
+            file_options={"content-type": content_type, "upsert": "true", "cache-control": "31536000"}
         )
-        
-        # In newer supabase-py versions, upload might not return the URL directly,
-        # so we construct it or use get_public_url
-        public_url_response = self.client.storage.from_(target_bucket).get_public_url(path)
-        return public_url_response
+        # get_public_url returns the URL string in current supabase-py versions
+        return storage.get_public_url(path)
+
+    async def remove(self, sha256: str, extension: str, bucket_name: Optional[str] = None):
+        """
+        Delete stored content (and its index entries). Only for content nothing else references:
+        identical bytes stored by anyone else share the same object.
+        """
+        bucket = bucket_name or self.bucket
+        path = f"objects/{sha256[:2]}/{sha256}.{extension}"
+        if self.index is not None:
+            try:
+                await asyncio.to_thread(self.index.delete_sha256, bucket, sha256)
+            except sqlite3.Error as e:
+                logger.warning("Could not unindex stored object: %s", e)
+        try:
+            await asyncio.to_thread(self._remove, bucket, path)
+        except Exception as e:
+            logger.warning("Could not delete stored object: %s", e, extra={"path": path})
+
+    @guarded(supabase_breaker)
+    def _remove(self, bucket: str, path: str):
+        self.client.storage.from_(bucket).remove([path])
+
+    async def upload_file(self, file_content: bytes, file_name: str, content_type: str, bucket_name: Optional[str] = None) -> str:
+        """Store a file (content-addressed, see `store`) and return its public URL."""
+        extension = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else "bin"
+        stored = await self.store(file_content, content_type, extension, bucket_name)
+        return stored["url"]
 
 storage_service = StorageService()
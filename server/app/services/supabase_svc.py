@@ -1,12 +1,50 @@
-from supabase import create_client, Client
-from app.core.config import settings
-from typing import List, Dict, Any, Optional, Union
+from app.core.breaker import circuit_breaker, guarded
+from app.core.clients import get_supabase_client
+from app.core.metrics import supabase_call_duration, timed
+from app.core.singleflight import single_flight
+from app.core.tracing import traced
+from app.core.logs import get_logger
+from typing import List, Dict, Any, Optional, Sequence, Union
 from uuid import UUID
+import asyncio
+
+logger = get_logger(__name__)
+
+def _is_outage(error: BaseException) -> bool:
+    """
+    Errors that count against the Supabase breaker: connection errors, timeouts, 5xx from the
+    gateway (PostgREST reports the HTTP status as the code when the body is not JSON) and
+    PostgREST failing to reach the database (PGRST000-002).
+    """
+    import httpx
+    from postgrest.exceptions import APIError
+    from storage3.exceptions import StorageApiError
+    if isinstance(error, APIError):
+        return (isinstance(error.code, int) and error.code >= 500) or error.code in ("PGRST000", "PGRST001", "PGRST002")
+    if isinstance(error, StorageApiError):
+        return str(error.status).isdigit() and int(error.status) >= 500
+    return isinstance(error, httpx.TransportError)
+
+supabase_breaker = circuit_breaker("supabase", _is_outage)
+
+# Columns of a user data export (see ExportService), per table
+EXPORT_COLUMNS = {
+    "conversations": "id, title, history, created_at, updated_at",
+    "voice_sessions": "id, conversation_id, transcript, audio_url, audio_meta, created_at",
+}
+
+# PostgREST JSON paths: the summary of a voice session leaves the transcript and the waveform in the database
+VOICE_SESSION_SUMMARY = "id, audio_url, created_at, first:transcript->0, duration:audio_meta->duration, variant_url:audio_meta->>url"
 
 class SupabaseService:
-    def __init__(self):
-        self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    @property
+    def client(self):
+        # Shared with StorageService, constructed on first use
+        return get_supabase_client()
 
+    @timed(supabase_call_duration, method="create_conversation")
+    @traced("supabase.create_conversation")
+    @guarded(supabase_breaker)
     def create_conversation(self, user_id: UUID, title: str, 
                           initial_message: Optional[Dict[str, Any]] = None, 
                           conversation_id: Optional[UUID] = None) -> Dict[str, Any]:
@@ -22,12 +60,49 @@ class SupabaseService:
         response = self.client.table("conversations").insert(data).execute()
         return response.data[0]
 
+    @timed(supabase_call_duration, method="get_conversation")
+    @traced("supabase.get_conversation")
+    @guarded(supabase_breaker)
     def get_conversation(self, conversation_id: UUID) -> Dict[str, Any]:
         response = self.client.table("conversations").select("*").eq("id", str(conversation_id)).execute()
         if not response.data:
             return None
         return response.data[0]
-        
+
+    @timed(supabase_call_duration, method="get_conversation_page")
+    @traced("supabase.get_conversation_page")
+    @guarded(supabase_breaker)
+    def get_conversation_page(self, conversation_id: UUID, before: Optional[int] = None, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a window of the conversation history (the `limit` messages preceding
+        sequence number `before`, or the latest ones if `before` is None).
+        Slicing happens in Postgres (see `get_conversation_page` in schema.sql) so the
+        payload size does not grow with the length of the conversation.
+        """
+        response = self.client.rpc("get_conversation_page", {
+            "p_conversation_id": str(conversation_id),
+            "p_before": before,
+            "p_limit": limit
+        }).execute()
+        if not response.data:
+            return None
+        return response.data[0]
+
+    # Request handlers use these: the query runs off the event loop and concurrent loads of the
+    # same conversation (several tabs, a refetch racing a send) share one round trip.
+    # The result is shared between those callers, so it must not be mutated.
+
+    @single_flight("supabase.get_conversation", key=lambda self, conversation_id: str(conversation_id))
+    async def load_conversation(self, conversation_id: UUID) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_conversation, conversation_id)
+
+    @single_flight("supabase.get_conversation_page", key=lambda self, conversation_id, before=None, limit=50: (str(conversation_id), before, limit))
+    async def load_conversation_page(self, conversation_id: UUID, before: Optional[int] = None, limit: int = 50) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_conversation_page, conversation_id, before, limit)
+
+    @timed(supabase_call_duration, method="list_conversations")
+    @traced("supabase.list_conversations")
+    @guarded(supabase_breaker)
     def list_conversations(self, user_id: UUID) -> List[Dict[str, Any]]:
         # Fetch conversations
         conv_resp = self.client.table("conversations").select("id, title, created_at, updated_at, history")\
@@ -59,32 +134,111 @@ class SupabaseService:
             
         return conversations
 
+    @timed(supabase_call_duration, method="export_page")
+    @traced("supabase.export_page")
+    @guarded(supabase_breaker)
+    def export_page(self, table: str, user_id: UUID, after: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        One page of a user's rows of `table` (conversations | voice_sessions), keyset-paginated
+        by ID: pass the last ID of a page as `after` to get the next one. Each page costs the same
+        however deep into the export it is, unlike offsets.
+        """
+        query = self.client.table(table).select(EXPORT_COLUMNS[table]).eq("user_id", str(user_id))
+        if after is not None:
+            query = query.gt("id", after)
+        return query.order("id").limit(limit).execute().data
+
+    @timed(supabase_call_duration, method="insert_batch")
+    @traced("supabase.insert_batch")
+    @guarded(supabase_breaker)
+    def insert_batch(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """
+        Insert rows in one statement, skipping those whose ID already exists (so re-running an
+        import is harmless and never overwrites anyone's rows). Returns how many were inserted.
+        """
+        response = self.client.table(table).upsert(
+            rows, ignore_duplicates=True, on_conflict="id", returning="minimal", count="exact", default_to_null=False
+        ).execute()
+        return response.count or 0
+
+    @timed(supabase_call_duration, method="delete_conversation")
+    @traced("supabase.delete_conversation")
+    @guarded(supabase_breaker)
     def delete_conversation(self, conversation_id: UUID, user_id: UUID) -> bool:
-        # Delete associated voice sessions first
-        self.client.table("voice_sessions").delete()\
-            .eq("conversation_id", str(conversation_id))\
-            .execute()
+        # The conversation and its voice sessions go in one round trip and one transaction
+        results = self._bulk(user_id, delete=[conversation_id])
+        return bool(results) and results[0]["ok"]
 
-        # Verify ownership implicitly by filter and delete conversation
-        response = self.client.table("conversations").delete()\
-            .eq("id", str(conversation_id))\
-            .eq("user_id", str(user_id))\
-            .execute()
-        return len(response.data) > 0
+    @timed(supabase_call_duration, method="bulk_conversations")
+    @traced("supabase.bulk_conversations")
+    @guarded(supabase_breaker)
+    def bulk_conversations(self, user_id: UUID, delete: Sequence[UUID] = (), titles: Optional[Dict[UUID, str]] = None,
+                           delete_voice_sessions: Sequence[UUID] = ()) -> List[Dict[str, Any]]:
+        """
+        Delete conversations (with their voice sessions), rename conversations and delete voice
+        sessions with set-based statements in one transaction (`bulk_conversations` in schema.sql).
+        Only rows owned by `user_id` are touched. Returns one {op, id, ok} per requested item.
+        """
+        return self._bulk(user_id, delete, titles, delete_voice_sessions)
 
-    def update_conversation_history(self, conversation_id: UUID, history: List[Dict[str, Any]]) -> Dict[str, Any]:
-        response = self.client.table("conversations").update({"history": history}).eq("id", str(conversation_id)).execute()
-        return response.data[0]
+    def _bulk(self, user_id: UUID, delete: Sequence[UUID] = (), titles: Optional[Dict[UUID, str]] = None,
+              delete_voice_sessions: Sequence[UUID] = ()) -> List[Dict[str, Any]]:
+        response = self.client.rpc("bulk_conversations", {
+            "p_user_id": str(user_id),
+            "p_delete": [str(i) for i in delete],
+            "p_titles": {str(i): title for i, title in (titles or {}).items()},
+            "p_delete_voice_sessions": [str(i) for i in delete_voice_sessions]
+        }).execute()
+        return response.data or []
+
+    @timed(supabase_call_duration, method="update_conversation_history")
+    @traced("supabase.update_conversation_history")
+    @guarded(supabase_breaker)
+    def update_conversation_history(self, conversation_id: UUID, history: List[Dict[str, Any]],
+                                    expected_updated_at: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        With `expected_updated_at`, only write if the conversation has not changed since that
+        version (optimistic concurrency); None means it did, or the conversation does not exist.
+        """
+        query = self.client.table("conversations").update({"history": history}).eq("id", str(conversation_id))
+        if expected_updated_at is not None:
+            query = query.eq("updated_at", expected_updated_at)
+        response = query.execute()
+        return response.data[0] if response.data else None
         
-    def update_conversation_title(self, conversation_id: UUID, title: str) -> bool:
-        response = self.client.table("conversations").update({"title": title}).eq("id", str(conversation_id)).execute()
+    @timed(supabase_call_duration, method="update_conversation_title")
+    @traced("supabase.update_conversation_title")
+    @guarded(supabase_breaker)
+    def update_conversation_title(self, conversation_id: UUID, title: str, expected: Optional[str] = None) -> bool:
+        """With `expected`, only update if the current title still matches it (e.g. not renamed by the user)."""
+        query = self.client.table("conversations").update({"title": title}).eq("id", str(conversation_id))
+        if expected is not None:
+            query = query.eq("title", expected)
+        response = query.execute()
         return len(response.data) > 0
 
+    @timed(supabase_call_duration, method="get_conversation_title")
+    @traced("supabase.get_conversation_title")
+    @guarded(supabase_breaker)
+    def get_conversation_title(self, conversation_id: UUID, user_id: UUID) -> Optional[Dict[str, Any]]:
+        """
+        Title without loading the history: {title, updated_at, first} (first = the opening message,
+        to tell a placeholder title apart). None if the conversation does not exist.
+        """
+        response = self.client.table("conversations").select("title, updated_at, first:history->0->msg")\
+            .eq("id", str(conversation_id))\
+            .eq("user_id", str(user_id))\
+            .execute()
+        return response.data[0] if response.data else None
+
+    @timed(supabase_call_duration, method="create_voice_session")
+    @traced("supabase.create_voice_session")
+    @guarded(supabase_breaker)
     def create_voice_session(self, user_id: UUID, transcript: List[Dict[str, Any]], audio_url: Optional[str] = None, conversation_id: Optional[Union[UUID, str]] = None) -> Dict[str, Any]:
         """
         Creates a voice session. Can be linked to a conversation or standalone.
         """
-        print(f"DEBUG: creating voice session for user {user_id}, conversation {conversation_id}")
+        logger.debug("Creating voice session", extra={"user_id": str(user_id), "conversation_id": str(conversation_id)})
         data = {
             "user_id": str(user_id),
             "transcript": transcript,
@@ -96,12 +250,57 @@ class SupabaseService:
         response = self.client.table("voice_sessions").insert(data).execute()
         return response.data[0]
         
-    def list_voice_sessions(self, conversation_id: UUID) -> List[Dict[str, Any]]:
-        """List voice sessions for a specific conversation."""
-        response = self.client.table("voice_sessions").select("*")\
+    @timed(supabase_call_duration, method="get_voice_session")
+    @traced("supabase.get_voice_session")
+    @guarded(supabase_breaker)
+    def get_voice_session(self, session_id: Union[UUID, str]) -> Optional[Dict[str, Any]]:
+        response = self.client.table("voice_sessions").select("id, user_id, audio_url, audio_meta")\
+            .eq("id", str(session_id))\
+            .execute()
+        return response.data[0] if response.data else None
+
+    @timed(supabase_call_duration, method="update_voice_session_audio")
+    @traced("supabase.update_voice_session_audio")
+    @guarded(supabase_breaker)
+    def update_voice_session_audio(self, session_id: Union[UUID, str], audio_meta: Dict[str, Any], audio_url: Optional[str] = None) -> bool:
+        """Attach the transcoded variant's metadata (and, if given, point audio_url at it)."""
+        data: Dict[str, Any] = {"audio_meta": audio_meta}
+        if audio_url:
+            data["audio_url"] = audio_url
+        response = self.client.table("voice_sessions").update(data).eq("id", str(session_id)).execute()
+        return len(response.data) > 0
+
+    @timed(supabase_call_duration, method="list_voice_sessions")
+    @traced("supabase.list_voice_sessions")
+    @guarded(supabase_breaker)
+    def list_voice_sessions(self, conversation_id: UUID, transcripts: bool = False) -> List[Dict[str, Any]]:
+        """
+        List voice sessions for a specific conversation, as summaries: the first transcript line
+        (`first`, which carries the TTS metadata), the duration and URL of the transcoded variant.
+        Full transcripts and waveforms only come with `transcripts=True` or `get_voice_session_transcript`,
+        so the payload does not grow with the length of each session.
+        """
+        columns = VOICE_SESSION_SUMMARY + (", transcript, waveform:audio_meta->waveform" if transcripts else "")
+        response = self.client.table("voice_sessions").select(columns)\
             .eq("conversation_id", str(conversation_id))\
             .order("created_at", desc=False)\
             .execute()
         return response.data
 
+    @timed(supabase_call_duration, method="get_voice_session_transcript")
+    @traced("supabase.get_voice_session_transcript")
+    @guarded(supabase_breaker)
+    def get_voice_session_transcript(self, conversation_id: UUID, session_id: Union[UUID, str], user_id: UUID) -> Optional[Dict[str, Any]]:
+        response = self.client.table("voice_sessions").select("id, transcript, waveform:audio_meta->waveform")\
+            .eq("id", str(session_id))\
+            .eq("conversation_id", str(conversation_id))\
+            .eq("user_id", str(user_id))\
+            .execute()
+        return response.data[0] if response.data else None
+
+    # Off the event loop and coalesced, like load_conversation
+    @single_flight("supabase.list_voice_sessions", key=lambda self, conversation_id, transcripts=False: (str(conversation_id), transcripts))
+    async def load_voice_sessions(self, conversation_id: UUID, transcripts: bool = False) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.list_voice_sessions, conversation_id, transcripts)
+
 supabase_service = SupabaseService()
@@ -0,0 +1,187 @@
+from app.core.config import settings
+from app.core.clients import get_openai_client
+from app.core.lifecycle import stream_tracker
+from app.core.scheduler import Priority, estimate_tokens, openai_scheduler
+from app.core.metrics import registry
+from app.core.logs import get_logger
+from app.services.supabase_svc import supabase_service
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Set
+import asyncio
+import json
+
+logger = get_logger(__name__)
+
+chat_titles = registry.counter(
+    "chat_titles_total", "Background conversation titles, by result (generated, failed, deduped)", ("result",)
+)
+
+# Characters of each message sent to the title model; the opening of a conversation is enough
+TITLE_EXCERPT_CHARS = 500
+TITLE_MAX_CHARS = 60
+# A conversation still showing its placeholder this long after its last write is not getting a title
+TITLE_PENDING_SECONDS = 60
+
+TITLE_PROMPT = (
+    "Escribe un título breve (máximo 6 palabras) para cada conversación, en el idioma de la conversación, "
+    "sin comillas ni punto final. Responde solo con JSON: {\"titles\": {\"<clave>\": \"<título>\"}}."
+)
+
+def message_text(content: Any) -> str:
+    """Plain text of a message: multimodal content keeps only its text parts."""
+    if isinstance(content, list):
+        return " ".join(p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text")
+    return content or ""
+
+def placeholder_title(content: Any) -> str:
+    """Immediate title for a new conversation: its first message truncated to 30 characters."""
+    text = message_text(content)
+    return text[:30] + "..." if len(text) > 30 else text
+
+class TitleService:
+    """
+    Replaces the placeholder title of new conversations with one written by a small model,
+    after the first exchange and without holding up the chat response:
+    - `schedule()` only queues the conversation; a conversation already queued or being titled is skipped
+    - a background worker takes up to TITLE_BATCH_SIZE queued conversations per OpenAI call
+      (waiting TITLE_BATCH_WAIT_MS for more to arrive) at background priority in the scheduler
+    - the title is only written if the conversation still has its placeholder (not renamed meanwhile)
+    Clients poll GET /api/chat/{id}/title (see `pending`), or are told over their WebSocket
+    (listeners registered with `subscribe`).
+    """
+
+    def __init__(self):
+        # conversation id -> job, in arrival order
+        self._queue: Dict[str, Dict[str, Any]] = {}
+        self._running: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._listeners: Set[Callable[[str, str], None]] = set()
+
+    @property
+    def client(self):
+        return get_openai_client()
+
+    def subscribe(self, listener: Callable[[str, str], None]):
+        """Call `listener(conversation_id, title)` for every title written from now on (this worker)."""
+        self._listeners.add(listener)
+
+    def unsubscribe(self, listener: Callable[[str, str], None]):
+        self._listeners.discard(listener)
+
+    def pending(self, conversation_id, row: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Whether a generated title is still to come. This worker knows its own queue; a title queued
+        by another worker is inferred from the conversation `row` (see get_conversation_title):
+        it still has its placeholder and was written less than TITLE_PENDING_SECONDS ago.
+        """
+        key = str(conversation_id)
+        if key in self._queue or key in self._running:
+            return True
+        if row is None or not settings.TITLE_GENERATION_ENABLED or row.get("first") is None:
+            return False
+        if row.get("title") != placeholder_title(row["first"]):
+            return False
+        try:
+            updated_at = datetime.fromisoformat(str(row.get("updated_at")).replace("Z", "+00:00"))
+        except ValueError:
+            return False
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - updated_at < timedelta(seconds=TITLE_PENDING_SECONDS)
+
+    def schedule(self, conversation_id, placeholder: str, user_text: Any, answer: str):
+        """Queue a title for a conversation whose first exchange just completed."""
+        if not settings.TITLE_GENERATION_ENABLED:
+            return
+        key = str(conversation_id)
+        if key in self._queue or key in self._running:
+            chat_titles.inc(result="deduped")
+            return
+        self._queue[key] = {
+            "placeholder": placeholder,
+            "user": message_text(user_text)[:TITLE_EXCERPT_CHARS],
+            "assistant": answer[:TITLE_EXCERPT_CHARS],
+        }
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._work())
+        self._wakeup.set()
+
+    async def shutdown(self):
+        """Stop the worker; queued conversations keep their placeholder titles."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.wait([self._worker])
+            self._worker = None
+
+    async def _work(self):
+        while True:
+            await self._wakeup.wait()
+            # Let a batch build up, unless it is already full
+            if len(self._queue) < settings.TITLE_BATCH_SIZE:
+                await asyncio.sleep(settings.TITLE_BATCH_WAIT_MS / 1000)
+            batch = {}
+            for key in list(self._queue)[:max(settings.TITLE_BATCH_SIZE, 1)]:
+                batch[key] = self._queue.pop(key)
+            if not self._queue:
+                self._wakeup.clear()
+            self._running.update(batch)
+            try:
+                await self._generate(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                chat_titles.inc(len(batch), result="failed")
+                logger.warning("Title generation failed: %s", e, extra={"conversations": len(batch)})
+            finally:
+                self._running.difference_update(batch)
+
+    async def _generate(self, batch: Dict[str, Dict[str, Any]]):
+        # Short keys instead of UUIDs keep the prompt (and the answer) small
+        keys = list(batch)
+        conversations = {
+            str(i): {"user": job["user"], "assistant": job["assistant"]} for i, job in enumerate(batch.values(), 1)
+        }
+        messages = [
+            {"role": "system", "content": TITLE_PROMPT},
+            {"role": "user", "content": json.dumps(conversations, ensure_ascii=False)},
+        ]
+        max_tokens = 20 * len(batch) + 20
+        async with openai_scheduler.slot(Priority.BACKGROUND, estimate_tokens(messages) + max_tokens) as ticket:
+            response = await ticket.call(lambda: self.client.chat.completions.create(
+                model=settings.TITLE_MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                max_tokens=max_tokens,
+                temperature=0.3,
+            ))
+            if response.usage:
+                ticket.record_usage(response.usage.total_tokens)
+
+        titles = json.loads(response.choices[0].message.content or "{}").get("titles") or {}
+        writes = {}
+        for i, key in enumerate(keys, 1):
+            title = _clean(titles.get(str(i)))
+            if not title:
+                chat_titles.inc(result="failed")
+                continue
+            writes[stream_tracker.persist(
+                supabase_service.update_conversation_title, key, title, expected=batch[key]["placeholder"]
+            )] = (key, title)
+            chat_titles.inc(result="generated")
+        if writes:
+            await asyncio.wait(writes)
+        for write, (key, title) in writes.items():
+            # False: renamed by the user meanwhile; None: the write failed
+            if not write.cancelled() and write.result():
+                for listener in list(self._listeners):
+                    listener(key, title)
+
+def _clean(title: Any) -> Optional[str]:
+    if not isinstance(title, str):
+        return None
+    title = " ".join(title.split()).strip("\"'«»“”").rstrip(".")
+    return title[:TITLE_MAX_CHARS] or None
+
+title_service = TitleService()
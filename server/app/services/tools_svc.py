@@ -1,4 +1,6 @@
 from typing import List, Dict, Any, Callable
+from app.core.metrics import tool_execution_duration
+import asyncio
 import json
 
 class ToolsService:
@@ -102,12 +104,13 @@ class ToolsService:
             return json.dumps({"error": f"Tool {tool_name} not found"})
         
         try:
-            # Check if function is async, if so await it (not handled here yet, assuming sync for simple tools)
-            # For now assuming sync functions
+            # Sync tools run in a thread: the event loop stays free and the awaiting stream can be
+            # cancelled right away (e.g. client disconnected) instead of waiting for the tool to return
             import inspect
-            if inspect.iscoroutinefunction(func):
-                return await func(**arguments)
-            return func(**arguments)
+            with tool_execution_duration.time(tool=tool_name):
+                if inspect.iscoroutinefunction(func):
+                    return await func(**arguments)
+                return await asyncio.to_thread(func, **arguments)
         except Exception as e:
             return json.dumps({"error": str(e)})
 
@@ -1,93 +1,101 @@
-import requests
-import time
+import asyncio
 from datetime import datetime
 from uuid import UUID
 from typing import List, Dict, Any, Optional
 from app.services.elevenlabs_svc import elevenlabs_service
 from app.services.storage_service import storage_service
+from app.services.audio_svc import audio_service
 from app.services.supabase_svc import supabase_service
+from app.services.post_call_svc import post_call_staging
+from app.core.breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.tracing import span, traced
+from app.core.logs import get_logger
+
+logger = get_logger(__name__)
 
 class VoiceService:
+    @traced("voice.process_and_save_session")
     async def process_and_save_session(self, conversation_id: str, user_id: UUID, fallback_transcript: Optional[List[Dict[str, Any]]] = None, app_conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Process a completed voice session:
-        1. Fetch audio from Local Webhook Server (Bun) OR ElevenLabs and upload to Supabase.
-        2. Fetch transcript from ElevenLabs (or use fallback).
+        1. Take audio and transcript pushed by the ElevenLabs post-call webhooks (waiting until they
+           arrive, up to VOICE_WEBHOOK_WAIT_SECONDS) OR fetch them from ElevenLabs, and upload the audio to Supabase.
+        2. Fall back to the client's transcript if ElevenLabs has none.
         3. Format data and save to voice_sessions table.
+        4. Schedule the Opus transcode of the audio (see audio_svc).
         """
-        print(f"Processing voice session: {conversation_id} (App ID: {app_conversation_id}) for user {user_id}")
+        logger.info("Processing voice session", extra={"conversation_id": conversation_id, "app_conversation_id": app_conversation_id, "user_id": str(user_id)})
         
         # 1. Audio Persistence
         audio_url = None
         audio_content = None
+        stored = None
+        staged_transcript = None
         
-        # Try Local Webhook Server (Bun) first (faster, avoids 404 race condition)
-        try:
-            local_url = f"http://localhost:3002/api/conversation-audio/{conversation_id}"
-            print(f"Attempting to fetch audio from local webhook server: {local_url}")
-            resp = requests.get(local_url, timeout=5)
-            if resp.status_code == 200:
-                audio_content = resp.content
-                print("Successfully fetched audio from local server.")
-            else:
-                print(f"Local server returned {resp.status_code}. Falling back to ElevenLabs API.")
-        except Exception as e:
-            print(f"Error fetching from local server: {e}. Falling back to ElevenLabs API.")
+        with span("voice.fetch_audio", conversation_id=conversation_id) as stage:
+            # Webhooks push the data (see app/routers/webhooks.py): wake up as soon as it is here
+            if settings.ELEVENLABS_WEBHOOK_SECRET:
+                audio_content, staged_transcript = await post_call_staging.wait(conversation_id, settings.VOICE_WEBHOOK_WAIT_SECONDS)
+                if audio_content:
+                    stage.set_attribute("source", "webhook")
+                else:
+                    logger.info("No post-call audio webhook received. Falling back to ElevenLabs API.", extra={"conversation_id": conversation_id})
 
-        # Fallback to ElevenLabs API with retry
-        if not audio_content:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    print(f"Fetching audio from ElevenLabs (Attempt {attempt+1}/{max_retries}): {conversation_id}")
-                    audio_content = elevenlabs_service.get_audio(conversation_id)
-                    break 
-                except Exception as e:
-                    print(f"Error processing audio (Attempt {attempt+1}): {e}")
-                    if "404" in str(e) and attempt < max_retries - 1:
-                        time.sleep(2) # Wait a bit for ElevenLabs to process
-                    else:
-                        break # Don't retry other errors or if max retries reached
+            # Fallback to ElevenLabs API with retry
+            if not audio_content:
+                max_retries = 3
+                for attempt in range(max_retries):
+                    try:
+                        logger.info("Fetching audio from ElevenLabs (attempt %d/%d)", attempt + 1, max_retries, extra={"conversation_id": conversation_id})
+                        audio_content = await elevenlabs_service.get_audio(conversation_id)
+                        stage.set_attribute("source", "elevenlabs")
+                        stage.set_attribute("attempts", attempt + 1)
+                        break 
+                    except CircuitOpenError:
+                        logger.warning("ElevenLabs is unavailable, not fetching audio", extra={"conversation_id": conversation_id})
+                        break
+                    except Exception as e:
+                        logger.warning("Error processing audio (attempt %d): %s", attempt + 1, e)
+                        if "404" in str(e) and attempt < max_retries - 1:
+                            await asyncio.sleep(2) # Wait a bit for ElevenLabs to process
+                        else:
+                            break # Don't retry other errors or if max retries reached
         
         if audio_content:
             try:
                 bucket_name = "voice-sessions" 
-                file_name = f"{conversation_id}.mp3"
-                print(f"Uploading audio to bucket: {bucket_name}")
+                logger.debug("Uploading audio to bucket %s", bucket_name)
                 
-                # Upload using original name so we can find it easily if needed
-                public_url_resp = await storage_service.upload_file(
-                    file_content=audio_content, 
-                    file_name=file_name, 
-                    content_type="audio/mpeg",
-                    bucket_name=bucket_name,
-                    use_original_name=True
-                )
-                
-                if isinstance(public_url_resp, dict) and 'publicUrl' in public_url_resp:
-                        audio_url = public_url_resp['publicUrl']
-                else:
-                    audio_url = public_url_resp
+                # Content-addressed: reprocessing the same session finds the audio already stored
+                stored = await storage_service.store(audio_content, "audio/mpeg", "mp3", bucket_name=bucket_name)
+                audio_url = stored["url"]
                     
-                print(f"Audio uploaded. URL: {audio_url}")
+                logger.info("Audio uploaded", extra={"audio_url": audio_url, "deduplicated": stored["deduplicated"]})
             except Exception as e:
-                print(f"Error uploading audio to storage: {e}")
+                logger.error("Error uploading audio to storage: %s", e)
         else:
-            print("Failed to retrieve audio content from any source.")
+            logger.warning("Failed to retrieve audio content from any source", extra={"conversation_id": conversation_id})
 
         # 2. Transcript Retrieval & Reliability
         transcript_data = []
-        try:
-            print(f"Fetching transcript for conversation: {conversation_id}")
-            conv_data = elevenlabs_service.get_conversation(conversation_id)
-            transcript_data = conv_data.get("transcript", [])
-        except Exception as e:
-            print(f"Error fetching transcript from ElevenLabs: {e}")
-            if fallback_transcript:
-                print("Using fallback transcript from client.")
-                transcript_data = fallback_transcript
+        with span("voice.fetch_transcript", conversation_id=conversation_id) as stage:
+            if staged_transcript is not None:
+                transcript_data = staged_transcript
+                stage.set_attribute("source", "webhook")
             else:
-                print("No transcript available.")
+                try:
+                    conv_data = await elevenlabs_service.get_conversation(conversation_id)
+                    transcript_data = conv_data.get("transcript", [])
+                    stage.set_attribute("source", "elevenlabs")
+                except Exception as e:
+                    logger.warning("Error fetching transcript from ElevenLabs: %s", e)
+                    if fallback_transcript:
+                        logger.info("Using fallback transcript from client")
+                        transcript_data = fallback_transcript
+                        stage.set_attribute("source", "client")
+                    else:
+                        logger.warning("No transcript available", extra={"conversation_id": conversation_id})
 
         # 3. Strict ID Mapping & Formatting
         processed_transcript = []
@@ -119,21 +127,21 @@ class VoiceService:
             })
             
         # 4. Save to DB (Voice Sessions ONLY)
-        print(f"Saving voice session with {len(processed_transcript)} messages.")
+        logger.info("Saving voice session", extra={"message_count": len(processed_transcript)})
         
         target_conversation_id = conversation_id
         
         # If App ID provided, prioritize it and ensure conversation exists
         if app_conversation_id:
-            print(f"Linking voice session to App Conversation ID: {app_conversation_id}")
+            logger.debug("Linking voice session to app conversation", extra={"app_conversation_id": app_conversation_id})
             # Ensure the conversation exists in `conversations` table
             # We don't have a direct 'ensure_exists' method but create_conversation might handle it or we check first?
             # supabase_service.get_conversation returns None if not found.
             
-            existing_conv = supabase_service.get_conversation(app_conversation_id)
+            existing_conv = await supabase_service.load_conversation(app_conversation_id)
             if not existing_conv:
                 # Create it!
-                print(f"Conversation {app_conversation_id} not found. Creating placeholder.")
+                logger.info("Conversation not found, creating placeholder", extra={"app_conversation_id": app_conversation_id})
                 # We need a title. Use date or something generic.
                 now = datetime.now()
                 title = f"Conversación - {now.strftime('%H:%M')}"
@@ -155,6 +163,10 @@ class VoiceService:
             audio_url=audio_url,
             conversation_id=target_conversation_id 
         )
+
+        # Smaller Opus copy + waveform, in the background (the MP3 is playable meanwhile)
+        if stored is not None and result.get("id"):
+            audio_service.schedule(result["id"], audio_content, stored)
         
         return {
             "status": "success",
@@ -0,0 +1,421 @@
+"""
+Local stand-ins for the external services used by the API, for benchmarks.
+
+One ASGI app serving:
+  /openai/v1/chat/completions           streaming completions (configurable TTFT, token rate, tool calls, 429s);
+                                        non-streaming JSON requests (conversation titles) answer right away
+  /elevenlabs/v1/...                    text-to-speech and convai conversation/audio
+  /supabase/rest/v1/{table}, /rpc/{fn}  in-memory PostgREST subset (eq/neq/in/lt/gt filters, order, limit)
+  /supabase/auth/v1/user                bearer tokens of the form "bench-<uuid>" authenticate as <uuid>
+  /supabase/storage/v1/object/...       uploads kept in memory; public object URLs support Range
+
+Point the API at it with:
+  OPENAI_BASE_URL=http://HOST:PORT/openai/v1
+  ELEVENLABS_API_URL=http://HOST:PORT/elevenlabs/v1
+  SUPABASE_URL=http://HOST:PORT/supabase
+
+Usage (from server/):
+    python -m benchmarks.fakes --port 3901 --token-rate 80 --ttft-ms 250
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+WORDS = ("la", "respuesta", "es", "que", "el", "sistema", "funciona", "bien", "con", "datos", "de", "prueba", "y", "más")
+
+class FakeConfig:
+    ttft_ms: float = 250.0
+    token_rate: float = 80.0 # tokens per second after the first one
+    answer_tokens: int = 120
+    tts_ms: float = 150.0
+    tts_bytes: int = 48_000
+    supabase_ms: float = 5.0
+    openai_429_rate: float = 0.0 # Fraction of completions rejected with 429 (exercises the scheduler's backoff)
+    straggler_rate: float = 0.0 # Fraction of completions whose first token takes straggler_ms instead (exercises hedging)
+    straggler_ms: float = 3000.0
+    tool_keywords = ("tiempo", "clima", "weather")
+    audio_file: Optional[str] = None # Served as the convai conversation audio (e.g. a real MP3 for transcoding)
+
+config = FakeConfig()
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# --- OpenAI ---
+
+def _chunk(model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+    body = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+def _usage_chunk(model: str, body: Dict[str, Any], completion_tokens: int) -> str:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    body = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+    return f"data: {json.dumps(body)}\n\n"
+
+def _json_completion(model: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    # Title requests send {"<key>": {...}} and expect {"titles": {"<key>": "..."}}
+    try:
+        keys = list(json.loads(body["messages"][-1]["content"]))
+    except (KeyError, IndexError, TypeError, ValueError):
+        keys = []
+    content = json.dumps({"titles": {key: " ".join(random.sample(WORDS, 3)) for key in keys}})
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    return {
+        "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 5 * len(keys), "total_tokens": prompt_tokens + 5 * len(keys)},
+    }
+
+def _wants_tool(body: Dict[str, Any]) -> bool:
+    messages = body.get("messages", [])
+    if not body.get("tools") or any(m.get("role") == "tool" for m in messages):
+        return False
+    last = messages[-1] if messages else {}
+    content = last.get("content")
+    text = content if isinstance(content, str) else json.dumps(content)
+    return any(k in text.lower() for k in config.tool_keywords)
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o-mini")
+    wants_tool = _wants_tool(body)
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+    if config.openai_429_rate and random.random() < config.openai_429_rate:
+        error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+        return JSONResponse(error, status_code=429, headers={"retry-after": "0.2"})
+
+    if not body.get("stream"):
+        return JSONResponse(_json_completion(model, body))
+
+    ttft_ms = config.straggler_ms if config.straggler_rate and random.random() < config.straggler_rate else config.ttft_ms
+
+    async def stream():
+        await asyncio.sleep(ttft_ms / 1000)
+        if wants_tool:
+            yield _chunk(model, {"role": "assistant", "tool_calls": [{
+                "index": 0, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                "function": {"name": "get_weather", "arguments": json.dumps({"location": "Tokyo"})},
+            }]})
+            yield _chunk(model, {}, "tool_calls")
+            if include_usage:
+                yield _usage_chunk(model, body, 20)
+            yield "data: [DONE]\n\n"
+            return
+        interval = 1 / config.token_rate if config.token_rate > 0 else 0
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        for i in range(config.answer_tokens):
+            if i and interval:
+                await asyncio.sleep(interval)
+            yield _chunk(model, {"content": (" " if i else "") + random.choice(WORDS)})
+        yield _chunk(model, {}, "stop")
+        if include_usage:
+            yield _usage_chunk(model, body, config.answer_tokens)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+# --- ElevenLabs ---
+
+async def text_to_speech(request: Request):
+    await asyncio.sleep(config.tts_ms / 1000)
+    return Response(b"\xff\xfb" + b"\x00" * (config.tts_bytes - 2), media_type="audio/mpeg")
+
+async def convai_conversation(request: Request):
+    return JSONResponse({
+        "conversation_id": request.path_params["conversation_id"],
+        "transcript": [
+            {"role": "user", "message": "Hola", "time_in_call_secs": 0},
+            {"role": "agent", "message": "Hola, ¿en qué puedo ayudarte?", "time_in_call_secs": 1},
+        ],
+    })
+
+async def convai_audio(request: Request):
+    if config.audio_file:
+        with open(config.audio_file, "rb") as f:
+            return Response(f.read(), media_type="audio/mpeg")
+    return Response(b"\xff\xfb" + b"\x00" * (config.tts_bytes - 2), media_type="audio/mpeg")
+
+# --- Supabase ---
+
+TABLES: Dict[str, List[Dict[str, Any]]] = {"conversations": [], "voice_sessions": []}
+OBJECTS: Dict[str, bytes] = {}
+_RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+def _coerce(value: Any) -> str:
+    return "" if value is None else str(value)
+
+def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+    op, _, operand = expression.partition(".")
+    value = row.get(column)
+    if op == "eq":
+        return _coerce(value) == operand
+    if op == "neq":
+        return _coerce(value) != operand
+    if op == "in":
+        options = [o.strip().strip('"') for o in operand.strip("()").split(",")]
+        return _coerce(value) in options
+    if op == "is":
+        return value is None if operand == "null" else _coerce(value).lower() == operand
+    if op in ("lt", "lte", "gt", "gte"):
+        if value is None:
+            return False
+        left, right = _coerce(value), operand
+        return {"lt": left < right, "lte": left <= right, "gt": left > right, "gte": left >= right}[op]
+    return True
+
+def _filtered(table: str, request: Request) -> List[Dict[str, Any]]:
+    rows = TABLES.setdefault(table, [])
+    for column, expression in request.query_params.multi_items():
+        if column in _RESERVED_PARAMS:
+            continue
+        rows = [r for r in rows if _matches(r, column, expression)]
+    return rows
+
+def _project(rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+    if not select or select == "*":
+        return [dict(r) for r in rows]
+    projected = []
+    columns = [c.strip() for c in select.split(",")]
+    for row in rows:
+        out = {}
+        for column in columns:
+            alias, _, expression = column.rpartition(":")
+            # JSON paths: col->0->key, col->>key (array indexes and object keys)
+            name, *path = re.split(r"->>?", expression)
+            value = row.get(name)
+            for step in path:
+                if isinstance(value, list) and step.isdigit():
+                    value = value[int(step)] if int(step) < len(value) else None
+                elif isinstance(value, dict):
+                    value = value.get(step)
+                else:
+                    value = None
+            if "->>" in expression and value is not None and not isinstance(value, str):
+                value = json.dumps(value) # ->> reads the value as text
+            out[alias or (path[-1] if path else name)] = value
+        projected.append(out)
+    return projected
+
+def _ordered(rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+    if not order:
+        return rows
+    for part in reversed(order.split(",")):
+        column, _, direction = part.partition(".")
+        rows = sorted(rows, key=lambda r: _coerce(r.get(column)), reverse=direction.startswith("desc"))
+    return rows
+
+def _defaults(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    row.setdefault("id", str(uuid.uuid4()))
+    row.setdefault("created_at", _now())
+    if table == "conversations":
+        row.setdefault("history", [])
+        row["updated_at"] = _now()
+    if table == "voice_sessions":
+        row.setdefault("transcript", [])
+    return row
+
+async def rest_table(request: Request):
+    await asyncio.sleep(config.supabase_ms / 1000)
+    table = request.path_params["table"]
+    params = request.query_params
+
+    if request.method == "GET":
+        rows = _ordered(_filtered(table, request), params.get("order"))
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit else rows[offset:]
+        return JSONResponse(_project(rows, params.get("select")))
+
+    if request.method == "POST":
+        body = await request.json()
+        items = body if isinstance(body, list) else [body]
+        stored = TABLES.setdefault(table, [])
+        created = []
+        prefer = request.headers.get("prefer", "")
+        upsert = "merge-duplicates" in prefer
+        ids = {r["id"]: r for r in stored}
+        for item in items:
+            row = _defaults(table, dict(item))
+            existing = ids.get(row["id"])
+            if existing is not None:
+                if "ignore-duplicates" in prefer:
+                    continue
+                if not upsert:
+                    return JSONResponse({"code": "23505", "message": "duplicate key value violates unique constraint"}, status_code=409)
+                existing.update(item)
+                created.append(existing)
+            else:
+                stored.append(row)
+                ids[row["id"]] = row
+                created.append(row)
+        headers = {"Content-Range": f"*/{len(created)}"} if "count=exact" in prefer else {}
+        if "return=minimal" in prefer:
+            return Response(status_code=201, headers=headers)
+        return JSONResponse(created, status_code=201, headers=headers)
+
+    if request.method == "PATCH":
+        body = await request.json()
+        rows = _filtered(table, request)
+        for row in rows:
+            row.update(body)
+            if table == "conversations":
+                row["updated_at"] = _now()
+        return JSONResponse(rows)
+
+    if request.method == "DELETE":
+        rows = _filtered(table, request)
+        ids = {id(r) for r in rows}
+        TABLES[table] = [r for r in TABLES[table] if id(r) not in ids]
+        return JSONResponse(rows)
+
+    return Response(status_code=405)
+
+def _rpc_get_conversation_page(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    row = next((r for r in TABLES["conversations"] if r["id"] == args.get("p_conversation_id")), None)
+    if row is None:
+        return []
+    history = row.get("history") or []
+    total = len(history)
+    before = args.get("p_before")
+    upper = min(total if before is None else before, total)
+    lower = max(upper - int(args.get("p_limit") or 50), 0)
+    return [{"id": row["id"], "title": row["title"], "updated_at": row["updated_at"], "total": total,
+             "start_seq": lower, "history": history[lower:upper]}]
+
+def _rpc_bulk_conversations(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    user_id = args["p_user_id"]
+    delete, titles, delete_sessions = args.get("p_delete") or [], args.get("p_titles") or {}, args.get("p_delete_voice_sessions") or []
+    deleted = {r["id"] for r in TABLES["conversations"] if r["id"] in delete and r["user_id"] == user_id}
+    renamed = set()
+    for row in TABLES["conversations"]:
+        if row["id"] in titles and row["user_id"] == user_id and row["id"] not in delete:
+            row["title"] = titles[row["id"]]
+            renamed.add(row["id"])
+    TABLES["conversations"] = [r for r in TABLES["conversations"] if r["id"] not in deleted]
+    sessions = {r["id"] for r in TABLES["voice_sessions"]
+                if r.get("user_id") == user_id and (r["id"] in delete_sessions or r.get("conversation_id") in deleted)}
+    TABLES["voice_sessions"] = [r for r in TABLES["voice_sessions"] if r["id"] not in sessions]
+    return ([{"op": "delete", "id": i, "ok": i in deleted} for i in delete]
+            + [{"op": "rename", "id": i, "ok": i in renamed} for i in titles]
+            + [{"op": "delete_voice_session", "id": i, "ok": i in sessions} for i in delete_sessions])
+
+RPCS = {"get_conversation_page": _rpc_get_conversation_page, "bulk_conversations": _rpc_bulk_conversations}
+
+async def rest_rpc(request: Request):
+    await asyncio.sleep(config.supabase_ms / 1000)
+    handler = RPCS.get(request.path_params["fn"])
+    if handler is None:
+        return JSONResponse({"message": "function not found"}, status_code=404)
+    return JSONResponse(handler(await request.json()))
+
+async def auth_user(request: Request):
+    token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not token.startswith("bench-"):
+        return JSONResponse({"msg": "invalid JWT"}, status_code=401)
+    return JSONResponse({
+        "id": token.removeprefix("bench-"),
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": "bench@example.com",
+        "app_metadata": {},
+        "user_metadata": {},
+        "created_at": _now(),
+    })
+
+async def storage_object(request: Request):
+    key = f"{request.path_params['bucket']}/{request.path_params['path']}"
+    if request.method in ("POST", "PUT"):
+        OBJECTS[key] = await request.body()
+        return JSONResponse({"Key": key, "Id": str(uuid.uuid4())})
+    # Public URLs (/object/public/<bucket>/<path>) read the same objects
+    key = key[len("public/"):] if key.startswith("public/") else key
+    if key not in OBJECTS:
+        return JSONResponse({"message": "Object not found"}, status_code=404)
+    data = OBJECTS[key]
+    byte_range = request.headers.get("range", "")
+    if not byte_range.startswith("bytes="):
+        return Response(data, headers={"Accept-Ranges": "bytes"})
+    first, _, last = byte_range[len("bytes="):].split(",")[0].partition("-")
+    if not first:
+        start, end = max(len(data) - int(last), 0), len(data) - 1
+    else:
+        start, end = int(first), min(int(last) if last else len(data) - 1, len(data) - 1)
+    if start >= len(data) or start > end:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{len(data)}"})
+    return Response(data[start:end + 1], status_code=206, headers={"Content-Range": f"bytes {start}-{end}/{len(data)}", "Accept-Ranges": "bytes"})
+
+async def storage_remove(request: Request):
+    bucket = request.path_params["bucket"]
+    removed = []
+    for path in (await request.json()).get("prefixes", []):
+        if OBJECTS.pop(f"{bucket}/{path}", None) is not None:
+            removed.append({"name": path})
+    return JSONResponse(removed)
+
+routes = [
+    Route("/openai/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/elevenlabs/v1/text-to-speech/{voice_id}", text_to_speech, methods=["POST"]),
+    Route("/elevenlabs/v1/text-to-speech/{voice_id}/stream", text_to_speech, methods=["POST"]),
+    Route("/elevenlabs/v1/convai/conversations/{conversation_id}", convai_conversation, methods=["GET"]),
+    Route("/elevenlabs/v1/convai/conversations/{conversation_id}/audio", convai_audio, methods=["GET"]),
+    Route("/supabase/rest/v1/rpc/{fn}", rest_rpc, methods=["POST"]),
+    Route("/supabase/rest/v1/{table}", rest_table, methods=["GET", "POST", "PATCH", "DELETE"]),
+    Route("/supabase/auth/v1/user", auth_user, methods=["GET"]),
+    Route("/supabase/storage/v1/object/{bucket}", storage_remove, methods=["DELETE"]),
+    Route("/supabase/storage/v1/object/{bucket}/{path:path}", storage_object, methods=["GET", "POST", "PUT"]),
+]
+
+app = Starlette(routes=routes)
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--ttft-ms", type=float, default=FakeConfig.ttft_ms, help="OpenAI delay before the first token")
+    parser.add_argument("--token-rate", type=float, default=FakeConfig.token_rate, help="OpenAI tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=FakeConfig.answer_tokens)
+    parser.add_argument("--tts-ms", type=float, default=FakeConfig.tts_ms, help="ElevenLabs TTS latency")
+    parser.add_argument("--supabase-ms", type=float, default=FakeConfig.supabase_ms, help="Supabase REST latency")
+    parser.add_argument("--openai-429-rate", type=float, default=FakeConfig.openai_429_rate, help="Fraction of OpenAI calls answered with 429")
+    parser.add_argument("--straggler-rate", type=float, default=FakeConfig.straggler_rate, help="Fraction of OpenAI calls with a slow first token")
+    parser.add_argument("--straggler-ms", type=float, default=FakeConfig.straggler_ms)
+    parser.add_argument("--audio-file", help="File served as convai conversation audio (default: a dummy MP3 header)")
+
+def configure(args: argparse.Namespace):
+    config.ttft_ms = args.ttft_ms
+    config.token_rate = args.token_rate
+    config.answer_tokens = args.answer_tokens
+    config.tts_ms = args.tts_ms
+    config.supabase_ms = args.supabase_ms
+    config.openai_429_rate = args.openai_429_rate
+    config.straggler_rate = args.straggler_rate
+    config.straggler_ms = args.straggler_ms
+    config.audio_file = args.audio_file
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3901)
+    parser.add_argument("--ssl-certfile", help="Serve HTTPS with this certificate (see benchmarks/http_reuse.py)")
+    parser.add_argument("--ssl-keyfile")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
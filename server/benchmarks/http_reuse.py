@@ -0,0 +1,137 @@
+"""
+Per-call latency of ElevenLabs requests with and without connection reuse, against the
+local fakes served over TLS (self-signed certificate generated for the run).
+
+  per-call: a new client per request, as the service used to do with `requests.post`
+            (TCP connect + TLS handshake every time)
+  pooled:   ElevenLabsService on the shared keep-alive client (app.core.clients)
+
+Localhost has no network round trips, so the difference measured here is the connection
+setup cost alone; over the internet each reused connection also saves ~2 RTTs (TCP + TLS 1.3).
+
+Usage (from server/):
+    python -m benchmarks.http_reuse --calls 200 --concurrency 1
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+
+from benchmarks.load import _free_port, stop_processes, summarize
+
+def write_certificate(directory: Path):
+    """Self-signed certificate for 127.0.0.1; returns (certfile, keyfile)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    certfile, keyfile = directory / "cert.pem", directory / "key.pem"
+    certfile.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    keyfile.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return certfile, keyfile
+
+async def run(label: str, call, calls: int, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    remaining = iter(range(calls))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stats = summarize(latencies)
+    print(f"{label:<10} mean {stats['mean_ms']:7.2f} ms  p50 {stats['p50_ms']:7.2f} ms  "
+          f"p95 {stats['p95_ms']:7.2f} ms  {calls / elapsed:7.1f} calls/s")
+    return latencies
+
+async def main_async(args, base_url: str, certfile: Path):
+    from app.services.elevenlabs_svc import elevenlabs_service
+    from app.core.clients import close_clients
+
+    async def per_call():
+        async with httpx.AsyncClient(base_url=base_url, verify=str(certfile), timeout=30) as client:
+            response = await client.post("/text-to-speech/bench", json={"text": "hola"}, headers=elevenlabs_service.headers)
+            response.raise_for_status()
+
+    async def pooled():
+        await elevenlabs_service.text_to_speech("hola", "bench")
+
+    await pooled() # Open the pool outside the measurement
+    baseline = await run("per-call", per_call, args.calls, args.concurrency)
+    reused = await run("pooled", pooled, args.calls, args.concurrency)
+    saved = (sum(baseline) / len(baseline) - sum(reused) / len(reused)) * 1000
+    print(f"saved per call: {saved:.2f} ms")
+    await close_clients()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--tts-ms", type=float, default=0, help="Fake TTS latency (0 isolates the connection cost)")
+    parser.add_argument("--http2", action="store_true", help="Let the pooled client offer HTTP/2 (the fakes only speak HTTP/1.1)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile, keyfile = write_certificate(Path(tmp))
+        port = _free_port()
+        fakes = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.fakes", "--port", str(port), "--tts-ms", str(args.tts_ms),
+            "--ssl-certfile", str(certfile), "--ssl-keyfile", str(keyfile)
+        ])
+        try:
+            base_url = f"https://127.0.0.1:{port}/elevenlabs/v1"
+            # The service's client trusts the system store; point it (and the readiness check) at the test CA
+            os.environ.update(
+                SSL_CERT_FILE=str(certfile),
+                ELEVENLABS_API_URL=base_url,
+                ELEVENLABS_API_KEY=os.environ.get("ELEVENLABS_API_KEY", "bench"),
+                ELEVENLABS_HTTP2=str(args.http2).lower()
+            )
+            _wait_for_tls(f"https://127.0.0.1:{port}/supabase/auth/v1/user", fakes, certfile)
+            asyncio.run(main_async(args, base_url, certfile))
+        finally:
+            stop_processes(fakes)
+
+def _wait_for_tls(url: str, process: subprocess.Popen, certfile: Path, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"fakes exited with {process.returncode}")
+        try:
+            httpx.get(url, verify=str(certfile), timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+if __name__ == "__main__":
+    main()
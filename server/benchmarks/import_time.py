@@ -0,0 +1,77 @@
+"""
+Import-time profile of the API (`import main`), i.e. the cold-start cost every worker pays.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters, reports the median
+total and the heaviest top-level packages, and exits non-zero if the median exceeds
+the budget, so it can be used as a CI check.
+
+Usage (from server/):
+    python -m benchmarks.import_time --budget-ms 1000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Tuple
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+def profile_once(module: str) -> Tuple[float, Dict[str, int]]:
+    env = dict(os.environ)
+    # Keys are not needed to import the app; make sure the run does not depend on a local .env
+    env.setdefault("PREWARM_CLIENTS", "false")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    cumulative_by_package: Dict[str, int] = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, raw_name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        name = raw_name.strip()
+        # Output is indented two spaces per nesting level (after one separator space)
+        level = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        if level == 0 and name == module:
+            total_us = int(cumulative)
+        elif level == 1:
+            # Direct imports of the target module, grouped by top-level package
+            cumulative_by_package[name.split(".")[0]] += int(cumulative)
+    return total_us / 1000, cumulative_by_package
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=1000, help="Fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    totals = []
+    packages: Dict[str, list] = defaultdict(list)
+    for _ in range(args.runs):
+        total_ms, by_package = profile_once(args.module)
+        totals.append(total_ms)
+        for name, us in by_package.items():
+            packages[name].append(us / 1000)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.0f} ms over {args.runs} runs (min {min(totals):.0f}, max {max(totals):.0f})")
+    print(f"{'package':<30} {'median ms':>10}")
+    ranked = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, values in ranked[:args.top]:
+        print(f"{name:<30} {statistics.median(values):>10.1f}")
+
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print(f"OK: within budget of {args.budget_ms:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+End-to-end load test of the FastAPI app against local stand-ins (benchmarks/fakes.py).
+
+Boots the fakes and the API (`serve.py`) as subprocesses, then runs closed-loop
+virtual users issuing a weighted mix of chat (streamed), search, TTS, conversation list
+and conversation fetch requests. Reports throughput, p50/p95/p99 latency per operation
+and time-to-first-token for chat, and writes the results to benchmarks/results/*.json.
+
+Usage (from server/):
+    python -m benchmarks.load --users 50 --duration 30
+    python -m benchmarks.load --users 50 --duration 30 --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks import fakes
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+DEFAULT_MIX = "chat=4,list=2,get=2,search=1,tts=1"
+PROMPTS = [
+    "Explícame qué es una base de datos relacional",
+    "Dame tres ideas para una cena rápida",
+    "¿Qué tiempo hace en Tokyo?",
+    "Resume en dos frases la historia de Roma",
+    "¿Cómo funciona la búsqueda semántica?",
+]
+QUERIES = ["cual es el codigo secreto", "que framework usas", "tiene dark mode", "quien te creo"]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "mean_ms": (sum(values) / len(values) * 1000) if values else None,
+        "p50_ms": (percentile(values, 50) or 0) * 1000 if values else None,
+        "p95_ms": (percentile(values, 95) or 0) * 1000 if values else None,
+        "p99_ms": (percentile(values, 99) or 0) * 1000 if values else None,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.ttft: List[float] = []
+        self.recording = False
+
+    def record(self, op: str, seconds: float, ok: bool):
+        if not self.recording:
+            return
+        if ok:
+            self.latencies[op].append(seconds)
+        else:
+            self.errors[op] += 1
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, mix: Dict[str, float]):
+        self.client = client
+        self.recorder = recorder
+        self.user_id = uuid.uuid4()
+        self.headers = {"Authorization": f"Bearer bench-{self.user_id}"}
+        self.conversations: List[str] = []
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+
+    async def run(self, stop_at: float):
+        while time.perf_counter() < stop_at:
+            op = random.choices(self.ops, self.weights)[0]
+            if op == "get" and not self.conversations:
+                op = "chat"
+            start = time.perf_counter()
+            try:
+                ok = await getattr(self, f"op_{op}")()
+            except httpx.HTTPError:
+                ok = False
+            self.recorder.record(op, time.perf_counter() - start, ok)
+
+    async def op_chat(self) -> bool:
+        # Mostly continue an existing conversation, sometimes start a new one
+        if self.conversations and random.random() < 0.7:
+            conversation_id = random.choice(self.conversations)
+        else:
+            conversation_id = str(uuid.uuid4())
+            self.conversations.append(conversation_id)
+        payload = {"messages": [{"role": "user", "content": random.choice(PROMPTS)}]}
+        start = time.perf_counter()
+        first_token = None
+        async with self.client.stream("POST", f"/api/chat/{conversation_id}/message", json=payload, headers=self.headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return False
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith('data: {"content"'):
+                    first_token = time.perf_counter() - start
+                if line == "data: [DONE]":
+                    break
+        if first_token is not None and self.recorder.recording:
+            self.recorder.ttft.append(first_token)
+        return first_token is not None
+
+    async def op_list(self) -> bool:
+        response = await self.client.get("/api/chat/", headers=self.headers)
+        return response.status_code == 200
+
+    async def op_get(self) -> bool:
+        conversation_id = random.choice(self.conversations)
+        response = await self.client.get(f"/api/chat/{conversation_id}", headers=self.headers)
+        return response.status_code == 200
+
+    async def op_search(self) -> bool:
+        response = await self.client.post("/api/search", json={"query": random.choice(QUERIES)})
+        return response.status_code == 200
+
+    async def op_tts(self) -> bool:
+        response = await self.client.post("/api/voice/speak", json={"text": random.choice(PROMPTS)}, headers=self.headers)
+        return response.status_code == 200
+
+def _wait_for(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+def start_processes(args):
+    fakes_port = _free_port()
+    api_port = _free_port()
+    fakes_base = f"http://127.0.0.1:{fakes_port}"
+
+    fake_cmd = [sys.executable, "-m", "benchmarks.fakes", "--port", str(fakes_port),
+                "--ttft-ms", str(args.ttft_ms), "--token-rate", str(args.token_rate),
+                "--answer-tokens", str(args.answer_tokens), "--tts-ms", str(args.tts_ms),
+                "--supabase-ms", str(args.supabase_ms), "--openai-429-rate", str(args.openai_429_rate),
+                "--straggler-rate", str(args.straggler_rate), "--straggler-ms", str(args.straggler_ms)]
+    fake_proc = subprocess.Popen(fake_cmd, cwd=SERVER_DIR)
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"{fakes_base}/openai/v1",
+        "ELEVENLABS_API_KEY": "bench",
+        "ELEVENLABS_API_URL": f"{fakes_base}/elevenlabs/v1",
+        "SUPABASE_URL": f"{fakes_base}/supabase",
+        "SUPABASE_SERVICE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench",
+        "LOG_LEVEL": "WARNING",
+        # Virtual users loop without think time, far above the per-user quotas of a real client
+        "RATE_LIMIT_ENABLED": "false",
+    })
+    # Same entry point as production, so multi-worker scaling can be measured with --workers
+    api_cmd = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(api_port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    api_proc = subprocess.Popen(api_cmd, cwd=SERVER_DIR, env=env)
+
+    try:
+        _wait_for(f"{fakes_base}/supabase/auth/v1/user", fake_proc)
+        _wait_for(f"http://127.0.0.1:{api_port}/api/health", api_proc)
+    except Exception:
+        stop_processes(fake_proc, api_proc)
+        raise
+    return fake_proc, api_proc, f"http://127.0.0.1:{api_port}"
+
+def stop_processes(*processes: subprocess.Popen):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(VirtualUser, f"op_{name.strip()}"):
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+async def drive(base_url: str, args) -> Dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        users = [VirtualUser(client, recorder, parse_mix(args.mix)) for _ in range(args.users)]
+
+        if args.warmup > 0:
+            await asyncio.gather(*(u.run(time.perf_counter() + args.warmup) for u in users))
+
+        recorder.recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*(u.run(started + args.duration) for u in users))
+        elapsed = time.perf_counter() - started
+        recorder.recording = False
+
+    operations = {}
+    total = 0
+    for op in sorted(set(recorder.latencies) | set(recorder.errors)):
+        stats = summarize(recorder.latencies[op])
+        stats["errors"] = recorder.errors[op]
+        stats["rps"] = stats["count"] / elapsed
+        operations[op] = stats
+        total += stats["count"]
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "duration_s": elapsed,
+        "throughput_rps": total / elapsed,
+        "operations": operations,
+        "chat_ttft": summarize(recorder.ttft),
+    }
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:9.1f}" if value is not None else "        -"
+
+def print_report(results: Dict, baseline: Optional[Dict] = None):
+    print(f"\nCommit {results['meta']['commit']}  users={results['meta']['args']['users']}  "
+          f"duration={results['duration_s']:.1f}s  throughput={results['throughput_rps']:.1f} req/s")
+    print(f"{'operation':<10} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + ("  p95 vs base" if baseline else ""))
+    rows = dict(results["operations"])
+    rows["ttft"] = {**results["chat_ttft"], "errors": 0, "rps": 0.0}
+    for op, stats in rows.items():
+        line = f"{op:<10} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} {_fmt(stats['p50_ms'])} {_fmt(stats['p95_ms'])} {_fmt(stats['p99_ms'])}"
+        if baseline:
+            base = baseline["chat_ttft"] if op == "ttft" else baseline["operations"].get(op)
+            if base and base.get("p95_ms") and stats.get("p95_ms"):
+                line += f"  {(stats['p95_ms'] / base['p95_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured warm-up seconds")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted operation mix (default {DEFAULT_MIX})")
+    parser.add_argument("--base-url", help="Drive an already running API instead of booting one (fakes must be configured separately)")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="Previous results JSON to compare p95 latencies against")
+    fakes.add_arguments(parser)
+    args = parser.parse_args()
+
+    processes = ()
+    base_url = args.base_url
+    if base_url is None:
+        *processes, base_url = start_processes(args)
+    try:
+        results = asyncio.run(drive(base_url, args))
+    finally:
+        stop_processes(*processes)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['meta']['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
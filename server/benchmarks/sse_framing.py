@@ -0,0 +1,101 @@
+"""
+CPU cost per streamed token for the chat SSE pipeline.
+
+Runs many concurrent fake token streams through:
+  - legacy:    dict -> json.dumps -> f-string, then json.loads(chunk[6:]) in the router to accumulate
+  - events:    structured events accumulated at the source, encoded once (app.core.sse)
+  - coalesced: same as events, merged with coalesce(interval_ms, max_bytes)
+
+Usage (from server/):
+    python -m benchmarks.sse_framing --streams 500 --tokens 400 --token-interval-ms 2
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, List
+
+from app.core.sse import SSE_DONE, coalesce, format_event
+
+TOKENS = ["Hola", ",", " ¿", "qué", " tal", "?", " Esto", " es", " una", " respuesta", " de", " prueba", "."]
+
+async def fake_upstream(n_tokens: int, interval: float) -> AsyncIterator[Dict[str, str]]:
+    for i in range(n_tokens):
+        if interval:
+            await asyncio.sleep(interval)
+        yield {"content": TOKENS[i % len(TOKENS)]}
+
+async def legacy_pipeline(n_tokens: int, interval: float) -> int:
+    async def stream_chat():
+        async for event in fake_upstream(n_tokens, interval):
+            yield f"data: {json.dumps({'content': event['content']})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    frames = 0
+    full_response_content = ""
+    async for chunk in stream_chat():
+        if chunk.startswith("data: {") and not "[DONE]" in chunk:
+            try:
+                data = json.loads(chunk[6:])
+                if "content" in data:
+                    full_response_content += data["content"]
+            except:
+                pass
+        chunk.encode("utf-8")
+        frames += 1
+    return frames
+
+async def event_pipeline(n_tokens: int, interval: float, interval_ms: int = 0, max_bytes: int = 0) -> int:
+    frames = 0
+    response_parts: List[str] = []
+    async for event in coalesce(fake_upstream(n_tokens, interval), interval_ms=interval_ms, max_bytes=max_bytes):
+        content = event.get("content")
+        if content:
+            response_parts.append(content)
+        format_event(event).encode("utf-8")
+        frames += 1
+    SSE_DONE.encode("utf-8")
+    "".join(response_parts)
+    return frames + 1
+
+async def run(name: str, factory, streams: int, tokens: int) -> Dict[str, float]:
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    frames = await asyncio.gather(*(factory() for _ in range(streams)))
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    total_tokens = streams * tokens
+    return {
+        "pipeline": name,
+        "cpu_us_per_token": cpu / total_tokens * 1e6,
+        "frames_per_stream": sum(frames) / streams,
+        "wall_s": wall,
+    }
+
+async def main(args):
+    interval = args.token_interval_ms / 1000
+    variants = [
+        ("legacy", lambda: legacy_pipeline(args.tokens, interval)),
+        ("events", lambda: event_pipeline(args.tokens, interval)),
+        ("coalesced", lambda: event_pipeline(args.tokens, interval, args.coalesce_ms, args.coalesce_bytes)),
+    ]
+    results = []
+    for name, factory in variants:
+        results.append(await run(name, factory, args.streams, args.tokens))
+
+    print(f"{args.streams} concurrent streams x {args.tokens} tokens, {args.token_interval_ms} ms/token")
+    print(f"{'pipeline':<10} {'cpu us/token':>13} {'frames/stream':>14} {'wall s':>8}")
+    for r in results:
+        print(f"{r['pipeline']:<10} {r['cpu_us_per_token']:>13.2f} {r['frames_per_stream']:>14.1f} {r['wall_s']:>8.2f}")
+    if args.json:
+        print(json.dumps(results))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=500)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--token-interval-ms", type=float, default=2)
+    parser.add_argument("--coalesce-ms", type=int, default=50)
+    parser.add_argument("--coalesce-bytes", type=int, default=256)
+    parser.add_argument("--json", action="store_true", help="Also print raw results as JSON")
+    asyncio.run(main(parser.parse_args()))
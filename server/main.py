@@ -1,5 +1,5 @@
 from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, BackgroundTasks, Request
-from fastapi.responses import Response, StreamingResponse
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
@@ -7,9 +7,42 @@ import io
 import asyncio
 
 from app.core.config import settings
-from app.routers import chat, voice, search # Import routers including search
+from app.core.metrics import MetricsMiddleware, registry as metrics_registry
+from app.core.tracing import TracingMiddleware
+from app.core.logs import setup_logging, get_logger
+from app.core.clients import warm_clients, close_clients
+from app.core.lifecycle import stream_tracker
+from app.core.breaker import breaker_health
+from app.core.stream_buffer import stream_hub
+from app.services.title_svc import title_service
+from app.services.image_svc import image_service
+from app.services.audio_svc import audio_service
+from app.routers import chat, chat_ws, voice, search, webhooks # Import routers including search
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="AI Assistant API")
+setup_logging()
+logger = get_logger("main")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # API clients are lazy; warm them in a thread right after boot so the worker
+    # starts accepting requests immediately and the first request rarely pays for it.
+    if settings.PREWARM_CLIENTS:
+        asyncio.get_running_loop().run_in_executor(None, warm_clients)
+    # Refuse new chat streams as soon as the worker is told to stop (see serve.py)
+    stream_tracker.install_signal_hooks()
+    yield
+    # By now uvicorn has waited for open responses (up to its graceful timeout); stop answers
+    # still generating and flush the history writes of streams that finished or were cut off
+    stream_tracker.begin_drain()
+    await stream_hub.shutdown()
+    await title_service.shutdown()
+    await audio_service.shutdown()
+    await stream_tracker.drain(settings.SHUTDOWN_FLUSH_SECONDS)
+    await close_clients()
+    image_service.shutdown()
+
+app = FastAPI(title="AI Assistant API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -20,15 +53,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency and the root span of each request (outermost, so they also cover CORS handling)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/api/health")
-async def health_check():
-    return {"status": "ok"}
+async def health_check(response: Response):
+    if stream_tracker.draining:
+        # Tell load balancers to stop routing here while in-flight streams finish
+        response.status_code = 503
+        return {"status": "draining"}
+    # A dependency being down is reported but not a reason to take this worker out of rotation
+    dependencies = breaker_health()
+    degraded = any(state["state"] != "closed" for state in dependencies.values())
+    return {"status": "degraded" if degraded else "ok", "dependencies": dependencies}
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus text exposition of the in-process metrics."""
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 # Include routers
 app.include_router(chat.router, prefix="/api")
+app.include_router(chat_ws.router, prefix="/api") # WebSocket chat: /api/chat/ws
 app.include_router(voice.router, prefix="/api") # Include voice router with /api prefix so it becomes /api/voice
 app.include_router(search.router, prefix="/api") # Include search router
+app.include_router(webhooks.router, prefix="/api")
 
 if __name__ == "__main__":
+    # Development entry point (single process); use serve.py in production
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=3001)
@@ -0,0 +1,111 @@
+import pytest
+
+from app.core.breaker import BreakerState, CircuitBreaker, CircuitOpenError
+from app.core.config import settings
+
+
+class Outage(Exception):
+    pass
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_ENABLED", True)
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "BREAKER_RESET_SECONDS", 30)
+    monkeypatch.setattr(settings, "BREAKER_HALF_OPEN_PROBES", 1)
+    return CircuitBreaker("test", lambda error: isinstance(error, Outage))
+
+
+def fail(breaker, error=None):
+    with pytest.raises(type(error or Outage())):
+        with breaker.guard():
+            raise error or Outage()
+
+
+def succeed(breaker):
+    with breaker.guard():
+        pass
+
+
+def cool_down(breaker):
+    breaker.opened_at -= settings.BREAKER_RESET_SECONDS
+
+
+def test_opens_after_consecutive_failures(breaker):
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == BreakerState.CLOSED
+    fail(breaker)
+    assert breaker.state == BreakerState.OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        succeed(breaker)
+    assert raised.value.status_code == 503
+    assert int(raised.value.headers["Retry-After"]) >= 1
+
+
+def test_success_resets_the_failure_count(breaker):
+    fail(breaker)
+    fail(breaker)
+    succeed(breaker)
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_errors_that_are_not_outages_count_as_success(breaker):
+    for _ in range(5):
+        fail(breaker, ValueError("bad input"))
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.failures == 0
+
+
+def test_check_fails_fast_only_while_open(breaker):
+    breaker.check()
+    for _ in range(3):
+        fail(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    cool_down(breaker)
+    breaker.check()
+
+
+def test_half_open_probe_success_closes(breaker):
+    for _ in range(3):
+        fail(breaker)
+    cool_down(breaker)
+    with breaker.guard():
+        assert breaker.state == BreakerState.HALF_OPEN
+        # Only BREAKER_HALF_OPEN_PROBES calls go through while the probe is out
+        with pytest.raises(CircuitOpenError):
+            succeed(breaker)
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.failures == 0
+
+
+def test_half_open_probe_failure_reopens(breaker):
+    for _ in range(3):
+        fail(breaker)
+    cool_down(breaker)
+    fail(breaker)
+    assert breaker.state == BreakerState.OPEN
+    assert breaker.retry_after() > 0
+
+
+def test_cancelled_probe_frees_its_slot(breaker):
+    for _ in range(3):
+        fail(breaker)
+    cool_down(breaker)
+    with pytest.raises(KeyboardInterrupt):
+        with breaker.guard():
+            raise KeyboardInterrupt()
+    assert breaker.state == BreakerState.HALF_OPEN
+    succeed(breaker)
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_disabled_breaker_never_opens(breaker, monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_ENABLED", False)
+    for _ in range(10):
+        fail(breaker)
+    assert breaker.state == BreakerState.CLOSED
@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import chat_svc
+from app.services.chat_svc import HISTORY_WRITE_ATTEMPTS, ConversationState, _append_user_message, _save_answer
+
+
+class Conversations:
+    """
+    Stands in for supabase_service's conversation reads and writes. Every write bumps updated_at,
+    like the trigger in schema.sql, and a write expecting another version changes nothing.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.versions = itertools.count(1)
+        self.writes = 0
+        # Called before each conditional write, to simulate another turn writing in between
+        self.interleave = None
+
+    def add(self, conversation_id, history):
+        self.rows[str(conversation_id)] = {"id": str(conversation_id), "title": "Chat", "history": history,
+                                           "updated_at": f"v{next(self.versions)}"}
+        return self.rows[str(conversation_id)]
+
+    def get_conversation(self, conversation_id):
+        row = self.rows.get(str(conversation_id))
+        return dict(row) if row else None
+
+    async def load_conversation(self, conversation_id):
+        return self.get_conversation(conversation_id)
+
+    def update_conversation_history(self, conversation_id, history, expected_updated_at=None):
+        self.writes += 1
+        if self.interleave is not None:
+            self.interleave(conversation_id)
+        row = self.rows.get(str(conversation_id))
+        if row is None or (expected_updated_at is not None and row["updated_at"] != expected_updated_at):
+            return None
+        row.update(history=history, updated_at=f"v{next(self.versions)}")
+        return dict(row)
+
+
+@pytest.fixture
+def conversations(monkeypatch):
+    conversations = Conversations()
+    for name in ("get_conversation", "load_conversation", "update_conversation_history"):
+        monkeypatch.setattr(chat_svc.supabase_service, name, getattr(conversations, name))
+    return conversations
+
+
+def message(role, text):
+    return {"id": 0 if role == "user" else 1, "role": role, "msg": text, "date": "2024-05-01T10:00:00"}
+
+
+def other_turn(conversations, text):
+    """Another tab's whole turn landing on the conversation."""
+    def write(conversation_id):
+        conversations.interleave = None
+        row = conversations.rows[str(conversation_id)]
+        conversations.update_conversation_history(
+            conversation_id, row["history"] + [message("user", text), message("assistant", "re: " + text)], row["updated_at"]
+        )
+    return write
+
+
+def test_answer_saved_on_the_version_read(conversations):
+    conversation_id = uuid.uuid4()
+    question = message("user", "hola")
+    row = conversations.add(conversation_id, [question])
+    saved = _save_answer(conversation_id, row["history"], row["updated_at"], question, message("assistant", "buenas"))
+    assert [m["msg"] for m in saved["history"]] == ["hola", "buenas"]
+    assert conversations.writes == 1
+
+
+def test_answer_merged_after_its_question_on_conflict(conversations):
+    conversation_id = uuid.uuid4()
+    question = message("user", "hola")
+    row = conversations.add(conversation_id, [question])
+    conversations.interleave = other_turn(conversations, "otra pestaña")
+
+    saved = _save_answer(conversation_id, row["history"], row["updated_at"], question, message("assistant", "buenas"))
+    # The concurrent turn is kept, and the answer follows its own question
+    assert [m["msg"] for m in saved["history"]] == ["hola", "buenas", "otra pestaña", "re: otra pestaña"]
+    assert conversations.writes == 3
+
+
+def test_answer_gives_up_when_the_conversation_keeps_changing(conversations):
+    conversation_id = uuid.uuid4()
+    question = message("user", "hola")
+    row = conversations.add(conversation_id, [question])
+
+    def always(conversation_id):
+        other_turn(conversations, "otra")(conversation_id)
+        conversations.interleave = always
+    conversations.interleave = always
+
+    assert _save_answer(conversation_id, row["history"], row["updated_at"], question, message("assistant", "buenas")) is None
+    assert "buenas" not in [m["msg"] for m in conversations.rows[str(conversation_id)]["history"]]
+
+
+def test_answer_to_a_deleted_conversation_is_dropped(conversations):
+    conversation_id = uuid.uuid4()
+    question = message("user", "hola")
+    row = conversations.add(conversation_id, [question])
+    del conversations.rows[str(conversation_id)]
+    assert _save_answer(conversation_id, row["history"], row["updated_at"], question, message("assistant", "buenas")) is None
+
+
+def test_user_message_reloads_a_stale_state(conversations):
+    conversation_id = uuid.uuid4()
+    conversations.add(conversation_id, [message("user", "hola"), message("assistant", "buenas")])
+    state = ConversationState(conversation_id)
+    asyncio.run(state.load())
+    conversations.interleave = other_turn(conversations, "otra pestaña")
+
+    history = asyncio.run(_append_user_message(state, uuid.uuid4(), message("user", "y ahora"), "y ahora"))
+    assert [m["msg"] for m in history] == ["hola", "buenas", "otra pestaña", "re: otra pestaña", "y ahora"]
+    assert state.updated_at == conversations.rows[str(conversation_id)]["updated_at"]
+
+
+def test_user_message_conflicts_end_in_409(conversations):
+    conversation_id = uuid.uuid4()
+    conversations.add(conversation_id, [message("user", "hola")])
+    state = ConversationState(conversation_id)
+    asyncio.run(state.load())
+
+    def always(conversation_id):
+        other_turn(conversations, "otra")(conversation_id)
+        conversations.interleave = always
+    conversations.interleave = always
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(_append_user_message(state, uuid.uuid4(), message("user", "y ahora"), "y ahora"))
+    assert raised.value.status_code == 409
+    assert conversations.writes == 2 * HISTORY_WRITE_ATTEMPTS
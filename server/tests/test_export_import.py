@@ -0,0 +1,161 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.services import export_svc
+from app.services.export_svc import InvalidImport, _lines, export_service
+
+
+class Tables:
+    """Stands in for supabase_service's export_page and insert_batch, over in-memory tables."""
+
+    def __init__(self):
+        self.rows = {"conversations": {}, "voice_sessions": {}}
+        self.batches = []
+
+    def export_page(self, table, user_id, after=None, limit=200):
+        rows = sorted((r for r in self.rows[table].values() if r["user_id"] == str(user_id)), key=lambda r: r["id"])
+        rows = [r for r in rows if after is None or r["id"] > after][:limit]
+        return [{k: v for k, v in r.items() if k != "user_id"} for r in rows]
+
+    def insert_batch(self, table, rows):
+        self.batches.append((table, len(rows)))
+        new = [r for r in rows if r["id"] not in self.rows[table]]
+        for row in new:
+            self.rows[table][row["id"]] = dict(row)
+        return len(new)
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    tables = Tables()
+    monkeypatch.setattr(export_svc.supabase_service, "export_page", tables.export_page)
+    monkeypatch.setattr(export_svc.supabase_service, "insert_batch", tables.insert_batch)
+    monkeypatch.setattr(settings, "EXPORT_PAGE_SIZE", 2)
+    monkeypatch.setattr(settings, "IMPORT_BATCH_SIZE", 2)
+    return tables
+
+
+def add_account(tables, user_id, conversations=3):
+    for n in range(conversations):
+        conversation_id = str(uuid.uuid4())
+        tables.rows["conversations"][conversation_id] = {
+            "id": conversation_id, "user_id": str(user_id), "title": f"Chat {n}",
+            "history": [{"id": 0, "role": "user", "msg": f"hola {n}", "date": "2024-05-01T10:00:00"}],
+            "created_at": "2024-05-01T10:00:00+00:00", "updated_at": "2024-05-01T10:00:05.12345+00:00",
+        }
+        session_id = str(uuid.uuid4())
+        tables.rows["voice_sessions"][session_id] = {
+            "id": session_id, "user_id": str(user_id), "conversation_id": conversation_id,
+            "transcript": [{"role": "user", "message": "hola"}], "audio_url": None, "audio_meta": None,
+            "created_at": "2024-05-01T10:01:00+00:00",
+        }
+
+
+async def collect(iterator):
+    return [line async for line in iterator]
+
+
+async def stream(lines, chunk_size=7):
+    data = b"".join(lines)
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def export(user_id):
+    return asyncio.run(collect(export_service.export_lines(user_id)))
+
+
+def import_(user_id, lines):
+    return asyncio.run(export_service.import_lines(user_id, stream(lines)))
+
+
+def test_export_lists_every_row_after_a_header(tables):
+    owner = uuid.uuid4()
+    add_account(tables, owner, conversations=5)
+    add_account(tables, uuid.uuid4())
+    records = [json.loads(line) for line in export(owner)]
+    assert records[0]["type"] == "export" and records[0]["format"] == export_svc.EXPORT_FORMAT
+    assert [r["type"] for r in records[1:]] == ["conversation"] * 5 + ["voice_session"] * 5
+
+
+def test_round_trip_into_another_account(tables):
+    owner, other = uuid.uuid4(), uuid.uuid4()
+    add_account(tables, owner)
+    lines = export(owner)
+
+    summary = import_(other, lines)
+    assert summary["conversation"] == {"imported": 3, "skipped": 0, "failed": 0}
+    assert summary["voice_session"] == {"imported": 3, "skipped": 0, "failed": 0}
+    assert summary["invalid"] == 0
+
+    imported = [json.loads(line) for line in export(other)][1:]
+    original = [json.loads(line) for line in lines][1:]
+    conversations = {r["id"] for r in imported if r["type"] == "conversation"}
+    # New IDs, same content, and each session still points at its (imported) conversation
+    assert conversations.isdisjoint(r["id"] for r in original)
+    assert sorted(r["title"] for r in imported if r["type"] == "conversation") == ["Chat 0", "Chat 1", "Chat 2"]
+    assert all(r["conversation_id"] in conversations for r in imported if r["type"] == "voice_session")
+
+
+def test_importing_twice_only_skips(tables):
+    owner = uuid.uuid4()
+    add_account(tables, owner)
+    lines = export(owner)
+    target = uuid.uuid4()
+    import_(target, lines)
+    before = {table: dict(rows) for table, rows in tables.rows.items()}
+
+    summary = import_(target, lines)
+    assert summary["conversation"] == {"imported": 0, "skipped": 3, "failed": 0}
+    assert summary["voice_session"] == {"imported": 0, "skipped": 3, "failed": 0}
+    assert tables.rows == before
+
+
+def test_invalid_lines_are_counted_and_skipped(tables):
+    owner = uuid.uuid4()
+    add_account(tables, owner, conversations=1)
+    lines = export(owner)
+    bad = [
+        b"not json\n",
+        json.dumps({"type": "conversation", "id": "nope", "title": "x"}).encode() + b"\n",
+        json.dumps({"type": "conversation", "id": str(uuid.uuid4()), "title": "x", "created_at": "yesterday"}).encode() + b"\n",
+    ]
+    summary = import_(uuid.uuid4(), lines[:2] + bad + lines[2:])
+    assert summary["invalid"] == 3
+    assert summary["invalid_lines"] == [3, 4, 5]
+    assert summary["conversation"]["imported"] == 1
+
+
+def test_rejected_batch_does_not_stop_the_import(tables, monkeypatch):
+    from postgrest.exceptions import APIError
+
+    def insert_batch(table, rows):
+        if any(r.get("title") == "Chat 1" for r in rows):
+            raise APIError({"code": "22P02", "message": "invalid input syntax"})
+        return tables.insert_batch(table, rows)
+
+    owner = uuid.uuid4()
+    add_account(tables, owner)
+    lines = export(owner)
+    monkeypatch.setattr(export_svc.supabase_service, "insert_batch", insert_batch)
+    monkeypatch.setattr(settings, "IMPORT_BATCH_SIZE", 1)
+    summary = import_(uuid.uuid4(), lines)
+    assert summary["conversation"] == {"imported": 2, "skipped": 0, "failed": 1}
+
+
+def test_lines_split_across_chunks():
+    lines = [b"first", b"", b"a much longer second line", b"last without newline"]
+    assert asyncio.run(collect(_lines(stream([b"\n".join(lines)], chunk_size=3), 64))) == lines
+
+
+def test_line_too_long_is_refused():
+    with pytest.raises(InvalidImport):
+        asyncio.run(collect(_lines(stream([b"ok\n", b"x" * 100, b"\n"], chunk_size=16), 64)))
+
+
+def test_line_at_the_limit_is_accepted():
+    assert asyncio.run(collect(_lines(stream([b"x" * 64, b"\nend"], chunk_size=64), 64))) == [b"x" * 64, b"end"]
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import ratelimit
+from app.core.config import settings
+from app.core.ratelimit import MemoryBackend, RateLimiter
+
+
+class Clock:
+    """Stands in for the time module in app.core.ratelimit."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(monkeypatch, clock):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", "memory")
+    monkeypatch.setattr(settings, "RATE_LIMIT_CHAT_PER_MINUTE", 60)
+    monkeypatch.setattr(settings, "RATE_LIMIT_CHAT_BURST", 3)
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_STREAMS_PER_USER", 2)
+    monkeypatch.setattr(settings, "STREAM_LEASE_SECONDS", 300)
+    return RateLimiter()
+
+
+def test_bucket_allows_burst_then_refuses(clock):
+    backend = MemoryBackend()
+    for _ in range(3):
+        assert asyncio.run(backend.take("u", 1.0, 3)) == 0
+    assert asyncio.run(backend.take("u", 1.0, 3)) == pytest.approx(1.0)
+
+
+def test_bucket_refills_at_its_rate(clock):
+    backend = MemoryBackend()
+    for _ in range(3):
+        asyncio.run(backend.take("u", 0.5, 3))
+    clock.now += 1
+    assert asyncio.run(backend.take("u", 0.5, 3)) == pytest.approx(1.0)
+    clock.now += 2
+    assert asyncio.run(backend.take("u", 0.5, 3)) == 0
+    # Refills never go past the burst
+    clock.now += 3600
+    for _ in range(3):
+        assert asyncio.run(backend.take("u", 0.5, 3)) == 0
+    assert asyncio.run(backend.take("u", 0.5, 3)) > 0
+
+
+def test_sweep_keeps_buckets_still_refilling(clock):
+    backend = MemoryBackend()
+    # A slow bucket far from full, then enough calls on a fast one to trigger a sweep later on
+    for _ in range(3):
+        asyncio.run(backend.take("slow", 1 / 60, 3))
+    clock.now += 10
+    for _ in range(999):
+        asyncio.run(backend.take("fast", 100.0, 3))
+    assert "slow" in backend._buckets
+    clock.now += 180
+    for _ in range(1000):
+        asyncio.run(backend.take("fast", 100.0, 3))
+    assert "slow" not in backend._buckets
+
+
+def test_check_raises_429_with_retry_after(limiter):
+    for _ in range(3):
+        asyncio.run(limiter.check("user", "chat"))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(limiter.check("user", "chat"))
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == "1"
+    # Limits are per user
+    asyncio.run(limiter.check("other", "chat"))
+
+
+def test_stream_leases_cap_and_release(limiter):
+    first = asyncio.run(limiter.acquire_stream("user"))
+    second = asyncio.run(limiter.acquire_stream("user"))
+    assert first and second and first != second
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(limiter.acquire_stream("user"))
+    assert raised.value.status_code == 429
+    asyncio.run(limiter.release_stream("user", first))
+    assert asyncio.run(limiter.acquire_stream("user"))
+
+
+def test_stream_leases_expire(limiter, clock):
+    asyncio.run(limiter.acquire_stream("user"))
+    asyncio.run(limiter.acquire_stream("user"))
+    clock.now += settings.STREAM_LEASE_SECONDS + 1
+    assert asyncio.run(limiter.acquire_stream("user"))
+
+
+def test_releasing_twice_or_no_lease_is_harmless(limiter):
+    lease = asyncio.run(limiter.acquire_stream("user"))
+    asyncio.run(limiter.release_stream("user", lease))
+    asyncio.run(limiter.release_stream("user", lease))
+    asyncio.run(limiter.release_stream("user", None))
+    assert limiter.backend._leases == {}
+
+
+def test_disabled_limits_admit_everything(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    for _ in range(10):
+        asyncio.run(limiter.check("user", "chat"))
+        assert asyncio.run(limiter.acquire_stream("user")) is None
@@ -78,6 +78,8 @@ create table if not exists public.conversations (
 
 create index if not exists idx_conversations_user_id on public.conversations(user_id);
 create index if not exists idx_conversations_updated_at on public.conversations(updated_at desc);
+-- Paginación por clave (user_id, id) de la exportación NDJSON
+create index if not exists idx_conversations_user_id_id on public.conversations(user_id, id);
 
 create or replace function public.update_updated_at_column()
 returns trigger as $$
@@ -92,6 +94,58 @@ create trigger update_conversations_updated_at
     for each row
     execute function update_updated_at_column();
 
+-- ============================================
+-- RPC: get_conversation_page (historial paginado)
+-- ============================================
+-- Devuelve solo la ventana [start_seq, before) del historial JSONB, de modo que
+-- abrir una conversación larga transfiere lo mismo que abrir una corta.
+create or replace function public.get_conversation_page(
+    p_conversation_id uuid,
+    p_before integer default null,
+    p_limit integer default 50
+)
+returns table (
+    id uuid,
+    title text,
+    updated_at timestamptz,
+    total integer,
+    start_seq integer,
+    history jsonb
+)
+language sql
+stable
+as $$
+    with c as (
+        select
+            c.id,
+            c.title,
+            c.updated_at,
+            c.history,
+            jsonb_array_length(c.history) as total
+        from public.conversations c
+        where c.id = p_conversation_id
+    ),
+    w as (
+        select
+            c.*,
+            least(coalesce(p_before, c.total), c.total) as upper_seq,
+            greatest(least(coalesce(p_before, c.total), c.total) - greatest(p_limit, 0), 0) as lower_seq
+        from c
+    )
+    select
+        w.id,
+        w.title,
+        w.updated_at,
+        w.total,
+        w.lower_seq as start_seq,
+        coalesce(
+            (select jsonb_agg(w.history -> i order by i)
+             from generate_series(w.lower_seq, w.upper_seq - 1) as i),
+            '[]'::jsonb
+        ) as history
+    from w;
+$$;
+
 -- ============================================
 -- TABLA: voice_sessions (MODIFICADO)
 -- ============================================
@@ -101,13 +155,72 @@ create table if not exists public.voice_sessions (
     conversation_id text, -- AHORA ES TEXT (Desacoplado de conversations.id)
     transcript jsonb not null default '[]'::jsonb,
     audio_url text,
+    audio_meta jsonb, -- Variante Opus transcodificada: url, sha256, tamaño, duración, forma de onda
     created_at timestamptz not null default now()
 );
 
+-- Migración para tablas existentes
+alter table public.voice_sessions add column if not exists audio_meta jsonb;
+
 create index if not exists idx_voice_sessions_user_id on public.voice_sessions(user_id);
+create index if not exists idx_voice_sessions_user_id_id on public.voice_sessions(user_id, id);
 -- Index importante para buscar por el ID de texto externo
 create index if not exists idx_voice_sessions_conversation_id on public.voice_sessions(conversation_id);
 
+-- ============================================
+-- RPC: bulk_conversations (operaciones en lote)
+-- ============================================
+-- Borra conversaciones (con sus sesiones de voz), renombra conversaciones y borra
+-- sesiones de voz sueltas en una sola llamada y una sola transacción. Solo toca filas
+-- de p_user_id y devuelve una fila por elemento pedido: (op, id, ok).
+-- p_titles es un objeto {"<conversation_id>": "<título>"}; una conversación que se
+-- borra en la misma llamada no se renombra.
+create or replace function public.bulk_conversations(
+    p_user_id uuid,
+    p_delete uuid[] default '{}',
+    p_titles jsonb default '{}'::jsonb,
+    p_delete_voice_sessions uuid[] default '{}'
+)
+returns table (
+    op text,
+    id text,
+    ok boolean
+)
+language sql
+volatile
+as $$
+    with deleted as (
+        delete from public.conversations c
+        where c.id = any(p_delete)
+          and c.user_id = p_user_id
+        returning c.id
+    ),
+    deleted_sessions as (
+        delete from public.voice_sessions v
+        where v.user_id = p_user_id
+          and (v.id = any(p_delete_voice_sessions)
+               or v.conversation_id in (select d.id::text from deleted d))
+        returning v.id
+    ),
+    renamed as (
+        update public.conversations c
+        set title = t.value
+        from jsonb_each_text(p_titles) t
+        where c.id = t.key::uuid
+          and c.user_id = p_user_id
+          and not (c.id = any(p_delete))
+        returning c.id
+    )
+    select 'delete', r.id::text, exists (select 1 from deleted d where d.id = r.id)
+    from unnest(p_delete) as r(id)
+    union all
+    select 'rename', t.key, exists (select 1 from renamed u where u.id = t.key::uuid)
+    from jsonb_each_text(p_titles) t
+    union all
+    select 'delete_voice_session', r.id::text, exists (select 1 from deleted_sessions s where s.id = r.id)
+    from unnest(p_delete_voice_sessions) as r(id);
+$$;
+
 -- ============================================
 -- ROW LEVEL SECURITY (RLS) - DATOS
 -- ============================================